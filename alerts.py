@@ -0,0 +1,125 @@
+import sqlite3
+
+
+# --- Module alerts.py ---
+# Alertes de stock bas tenues par triggers.
+#
+#   stock_balance : solde (kg) par produit/boutique, mis à jour à chaque
+#                   insertion, modification ou suppression de mouvement
+#   stock_alert   : exactement les couples (produit actif, boutique) dont le
+#                   stock est <= seuil_kg, avec ce stock
+#
+# Comme low_stock_products, un couple sans mouvement a un stock de 0.
+# Les triggers sur product (seuil_kg, actif) et shop tiennent l'ensemble à
+# jour ; le rapport et le badge de la barre latérale lisent stock_alert seul.
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS stock_balance (
+        product_id INTEGER NOT NULL,
+        shop_id INTEGER NOT NULL,
+        qty_kg REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (product_id, shop_id)
+    );
+    CREATE TABLE IF NOT EXISTS stock_alert (
+        product_id INTEGER NOT NULL,
+        shop_id INTEGER NOT NULL,
+        stock_kg REAL NOT NULL,
+        PRIMARY KEY (product_id, shop_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_stock_alert_shop ON stock_alert(shop_id);
+"""
+
+
+def _recompute(product: str, shop: str) -> str:
+    """Instructions recalculant l'alerte d'un couple (expressions SQL du trigger)."""
+    return f"""
+            DELETE FROM stock_alert WHERE product_id = {product} AND shop_id = {shop};
+            INSERT INTO stock_alert(product_id, shop_id, stock_kg)
+            SELECT p.id, s.id, COALESCE(b.qty_kg, 0)
+            FROM product p JOIN shop s ON s.id = {shop}
+            LEFT JOIN stock_balance b ON b.product_id = p.id AND b.shop_id = s.id
+            WHERE p.id = {product} AND p.actif = 1 AND COALESCE(b.qty_kg, 0) <= p.seuil_kg;"""
+
+
+def _add_balance(product: str, shop: str, qty: str) -> str:
+    return f"""
+            INSERT INTO stock_balance(product_id, shop_id, qty_kg) VALUES ({product}, {shop}, {qty})
+            ON CONFLICT(product_id, shop_id) DO UPDATE SET qty_kg = qty_kg + excluded.qty_kg;"""
+
+
+TRIGGERS = f"""
+    CREATE TRIGGER IF NOT EXISTS alert_movement_insert AFTER INSERT ON movement
+    BEGIN
+        {_add_balance("NEW.product_id", "NEW.shop_id", "NEW.qty_kg")}
+        {_recompute("NEW.product_id", "NEW.shop_id")}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS alert_movement_update AFTER UPDATE OF product_id, shop_id, qty_kg ON movement
+    BEGIN
+        {_add_balance("OLD.product_id", "OLD.shop_id", "-OLD.qty_kg")}
+        {_add_balance("NEW.product_id", "NEW.shop_id", "NEW.qty_kg")}
+        {_recompute("OLD.product_id", "OLD.shop_id")}
+        {_recompute("NEW.product_id", "NEW.shop_id")}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS alert_movement_delete AFTER DELETE ON movement
+    BEGIN
+        {_add_balance("OLD.product_id", "OLD.shop_id", "-OLD.qty_kg")}
+        {_recompute("OLD.product_id", "OLD.shop_id")}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS alert_product_insert AFTER INSERT ON product
+    BEGIN
+        INSERT INTO stock_alert(product_id, shop_id, stock_kg)
+        SELECT NEW.id, s.id, 0 FROM shop s WHERE NEW.actif = 1 AND 0 <= NEW.seuil_kg;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS alert_product_update AFTER UPDATE OF seuil_kg, actif ON product
+    BEGIN
+        DELETE FROM stock_alert WHERE product_id = NEW.id;
+        INSERT INTO stock_alert(product_id, shop_id, stock_kg)
+        SELECT NEW.id, s.id, COALESCE(b.qty_kg, 0)
+        FROM shop s LEFT JOIN stock_balance b ON b.product_id = NEW.id AND b.shop_id = s.id
+        WHERE NEW.actif = 1 AND COALESCE(b.qty_kg, 0) <= NEW.seuil_kg;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS alert_product_delete AFTER DELETE ON product
+    BEGIN
+        DELETE FROM stock_alert WHERE product_id = OLD.id;
+        DELETE FROM stock_balance WHERE product_id = OLD.id;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS alert_shop_insert AFTER INSERT ON shop
+    BEGIN
+        INSERT INTO stock_alert(product_id, shop_id, stock_kg)
+        SELECT p.id, NEW.id, 0 FROM product p WHERE p.actif = 1 AND 0 <= p.seuil_kg;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS alert_shop_delete AFTER DELETE ON shop
+    BEGIN
+        DELETE FROM stock_alert WHERE shop_id = OLD.id;
+        DELETE FROM stock_balance WHERE shop_id = OLD.id;
+    END;
+"""
+
+
+def rebuild_stock_alerts(cnx: sqlite3.Connection):
+    """Recalcule soldes et alertes depuis le journal (installation, réparation)."""
+    cnx.execute("DELETE FROM stock_balance")
+    cnx.execute("""INSERT INTO stock_balance(product_id, shop_id, qty_kg)
+                    SELECT product_id, shop_id, SUM(qty_kg) FROM movement GROUP BY product_id, shop_id""")
+    cnx.execute("DELETE FROM stock_alert")
+    cnx.execute("""INSERT INTO stock_alert(product_id, shop_id, stock_kg)
+                    SELECT p.id, s.id, COALESCE(b.qty_kg, 0)
+                    FROM product p CROSS JOIN shop s
+                    LEFT JOIN stock_balance b ON b.product_id = p.id AND b.shop_id = s.id
+                    WHERE p.actif = 1 AND COALESCE(b.qty_kg, 0) <= p.seuil_kg""")
+    cnx.execute("INSERT OR REPLACE INTO app_setting(key, value) VALUES ('stock_alerts', '1')")
+    cnx.commit()
+
+
+def install_stock_alerts(cnx: sqlite3.Connection):
+    cnx.executescript(SCHEMA)
+    cnx.executescript(TRIGGERS)
+    if cnx.execute("SELECT 1 FROM app_setting WHERE key='stock_alerts'").fetchone() is None:
+        rebuild_stock_alerts(cnx)
@@ -0,0 +1,275 @@
+import numpy as np
+from datetime import date
+from typing import List, Dict, Optional, Sequence, Tuple
+
+from db import TYPE_CODES
+
+
+# --- Module analytics.py ---
+# Ventes, coûts et marges par produit, par boutique et par période.
+# Le grand livre filtré est chargé une seule fois en colonnes NumPy ;
+# tous les regroupements se font ensuite par bincount / unique / cumsum.
+
+IN, OUT, ADJ = TYPE_CODES["IN"], TYPE_CODES["OUT"], TYPE_CODES["ADJ"]
+
+
+def _day_index(days: np.ndarray) -> np.ndarray:
+    """Convertit un tableau datetime64[D] en numéro de jour depuis 1970-01-01."""
+    return days.astype("datetime64[D]").astype(np.int64)
+
+
+class Ledger:
+    """Grand livre filtré en colonnes NumPy (une ligne par mouvement)."""
+
+    def __init__(self, ids, product_id, shop_id, mtype, qty_kg, cost, day, start_day: Optional[int] = None):
+        self.ids = ids
+        self.product_id = product_id
+        self.shop_id = shop_id
+        self.mtype = mtype
+        self.qty_kg = qty_kg
+        self.cost = cost
+        self.day = day
+        # Les mouvements antérieurs au début de période ne comptent que pour le stock d'ouverture
+        if start_day is None:
+            self.in_period = np.ones(len(ids), dtype=bool)
+        else:
+            self.in_period = day >= start_day
+        self.products: Dict[int, Dict] = {}
+        self.shops: Dict[int, Dict] = {}
+
+    @classmethod
+    def load(cls, db, shop_id: Optional[int] = None, q: str = "",
+             date_from: Optional[str] = None, date_to: Optional[str] = None) -> "Ledger":
+        rows = db.ledger_rows(shop_id=shop_id, q=q, date_to=date_to)
+        n = len(rows)
+        if n:
+            ids, pids, sids, types, qtys, costs, days = zip(*rows)
+        else:
+            ids = pids = sids = types = qtys = costs = days = ()
+        start = None
+        if date_from:
+            start = int(_day_index(np.array([date_from[:10]], dtype="datetime64[D]"))[0])
+        ledger = cls(
+            ids=np.fromiter(ids, dtype=np.int64, count=n),
+            product_id=np.fromiter(pids, dtype=np.int64, count=n),
+            shop_id=np.fromiter(sids, dtype=np.int64, count=n),
+            mtype=np.fromiter((TYPE_CODES[t] for t in types), dtype=np.int8, count=n),
+            qty_kg=np.fromiter(qtys, dtype=np.float64, count=n),
+            cost=np.fromiter(costs, dtype=np.float64, count=n),
+            day=_day_index(np.array(days, dtype="datetime64[D]")) if n else np.zeros(0, dtype=np.int64),
+            start_day=start,
+        )
+        ledger.products = {p["id"]: p for p in db.list_products(include_inactive=True)}
+        ledger.shops = {s["id"]: s for s in db.list_shops()}
+        return ledger
+
+    @classmethod
+    def from_snapshot(cls, snapshot, db=None, shop_id: Optional[int] = None,
+                      date_from: Optional[str] = None, date_to: Optional[str] = None) -> "Ledger":
+        """
+        Grand livre lu dans une copie en colonnes (columnar.ColumnSnapshot, en mmap)
+        au lieu de SQLite. `db` ne sert qu'aux libellés des produits et boutiques.
+        """
+        day = snapshot.day()
+        mask = None
+        if shop_id:
+            mask = snapshot["shop_id"] == shop_id
+        if date_to:
+            end = _day_index(np.array([date_to[:10]], dtype="datetime64[D]"))[0]
+            mask = (day <= end) if mask is None else mask & (day <= end)
+
+        def col(name, values=None):
+            values = snapshot[name] if values is None else values
+            return values if mask is None else values[mask]
+
+        start = None
+        if date_from:
+            start = int(_day_index(np.array([date_from[:10]], dtype="datetime64[D]"))[0])
+        ledger = cls(
+            ids=col("id"), product_id=col("product_id"), shop_id=col("shop_id"),
+            mtype=col("type"), qty_kg=col("qty_kg"), cost=col("cost"),
+            day=col("day", day), start_day=start,
+        )
+        if db is not None:
+            ledger.products = {p["id"]: p for p in db.list_products(include_inactive=True)}
+            ledger.shops = {s["id"]: s for s in db.list_shops()}
+        return ledger
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ------------------------------------------------------------------
+    # Agrégats
+    # ------------------------------------------------------------------
+    def _totals(self, inv: np.ndarray, n: int) -> Dict[str, np.ndarray]:
+        """Sommes par groupe (indices `inv`) pour la période et le stock d'ouverture."""
+        per = self.in_period
+        out_m = per & (self.mtype == OUT)
+        in_m = per & (self.mtype == IN)
+
+        def total(weights, mask):
+            return np.bincount(inv[mask], weights=weights[mask], minlength=n)
+
+        opening = total(self.qty_kg, ~per)
+        closing = opening + total(self.qty_kg, per)
+        qty_out = -total(self.qty_kg, out_m)
+        sales = total(self.cost, out_m)
+        purchases = total(self.cost, in_m)
+        return {
+            "qty_in": total(self.qty_kg, in_m),
+            "qty_out": qty_out,
+            "sales": sales,
+            "purchases": purchases,
+            "margin": sales - purchases,
+            "stock_open": opening,
+            "stock_close": closing,
+            "turnover": _turnover(qty_out, opening, closing),
+        }
+
+    def _grouped(self, keys: np.ndarray) -> List[Dict]:
+        uniq, inv = np.unique(keys, return_inverse=True)
+        totals = self._totals(inv.reshape(-1), len(uniq))
+        rows = []
+        for i, key in enumerate(uniq.tolist()):
+            d = {"key": key}
+            for name, col in totals.items():
+                d[name] = float(col[i])
+            rows.append(d)
+        return rows
+
+    def by_product(self) -> List[Dict]:
+        """Ventes, achats, marge et rotation par produit."""
+        rows = self._grouped(self.product_id)
+        for r in rows:
+            p = self.products.get(r["key"], {})
+            r["product_id"] = r.pop("key")
+            r["libelle"] = p.get("libelle", "?")
+            r["poids_sac_kg"] = p.get("poids_sac_kg", 0)
+        rows.sort(key=lambda r: r["sales"], reverse=True)
+        return rows
+
+    def by_shop(self) -> List[Dict]:
+        """Ventes, achats, marge et rotation par boutique."""
+        rows = self._grouped(self.shop_id)
+        for r in rows:
+            r["shop_id"] = r.pop("key")
+            r["libelle"] = self.shops.get(r["shop_id"], {}).get("libelle", "?")
+        return rows
+
+    def by_period(self, freq: str = "month") -> List[Dict]:
+        """
+        Ventes, achats et marge par semaine ('week') ou par mois ('month').
+        Le stock de fin de période est obtenu par somme cumulée des variations.
+        """
+        if freq == "week":
+            # Le 1970-01-01 est un jeudi : on ramène chaque jour au lundi de sa semaine
+            keys = self.day - (self.day + 3) % 7
+        else:
+            keys = _day_index(self.day.astype("datetime64[D]").astype("datetime64[M]"))
+
+        per = self.in_period
+        opening = float(self.qty_kg[~per].sum())
+        uniq, inv = np.unique(keys[per], return_inverse=True)
+        inv = inv.reshape(-1)
+        n = len(uniq)
+        mtype, qty, cost = self.mtype[per], self.qty_kg[per], self.cost[per]
+        out_m, in_m = mtype == OUT, mtype == IN
+
+        def total(weights, mask):
+            return np.bincount(inv[mask], weights=weights[mask], minlength=n)
+
+        closing = opening + np.cumsum(total(qty, np.ones(len(qty), dtype=bool)))
+        start = np.concatenate(([opening], closing[:-1]))
+        qty_out = -total(qty, out_m)
+        qty_in = total(qty, in_m)
+        sales = total(cost, out_m)
+        purchases = total(cost, in_m)
+        turnover = _turnover(qty_out, start, closing)
+
+        rows = []
+        labels = uniq.astype("datetime64[D]").astype(str).tolist()
+        for i in range(n):
+            label = labels[i] if freq == "week" else labels[i][:7]
+            rows.append({
+                "period": label,
+                "qty_in": float(qty_in[i]),
+                "qty_out": float(qty_out[i]),
+                "sales": float(sales[i]),
+                "purchases": float(purchases[i]),
+                "margin": float(sales[i] - purchases[i]),
+                "stock_open": float(start[i]),
+                "stock_close": float(closing[i]),
+                "turnover": float(turnover[i]),
+            })
+        return rows
+
+    def summary(self) -> Dict[str, float]:
+        """Totaux de la période, tous produits et boutiques confondus."""
+        per = self.in_period
+        sales = float(self.cost[per & (self.mtype == OUT)].sum())
+        purchases = float(self.cost[per & (self.mtype == IN)].sum())
+        return {"sales": sales, "purchases": purchases, "margin": sales - purchases}
+
+
+def _turnover(qty_out: np.ndarray, opening: np.ndarray, closing: np.ndarray) -> np.ndarray:
+    """Rotation = quantité sortie / stock moyen (moyenne ouverture-clôture)."""
+    avg = (np.asarray(opening, dtype=np.float64) + closing) / 2
+    return np.divide(qty_out, avg, out=np.zeros(len(avg), dtype=np.float64), where=avg > 0)
+
+
+# ----------------------------------------------------------------------
+# Séries journalières pour les graphiques
+
+def daily_grid(rows: Sequence[Tuple[str, float, float]], date_from: Optional[str] = None,
+               date_to: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Étale les lignes de Database.daily_series sur tous les jours de la période :
+    (numéros de jour, ventes du jour — 0 sans mouvement, stock en fin de jour — reporté).
+    """
+    empty = np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+    if not rows:
+        return empty
+    days = _day_index(np.array([r[0] for r in rows], dtype="datetime64[D]"))
+    sales = np.array([r[1] for r in rows], dtype=np.float64)
+    stock = np.array([r[2] for r in rows], dtype=np.float64)
+    start = int(_day_index(np.array([date_from], dtype="datetime64[D]"))[0]) if date_from else int(days[0])
+    end = int(_day_index(np.array([date_to or date.today().isoformat()], dtype="datetime64[D]"))[0])
+    end = max(end, int(days[-1])) if not date_to else end
+    if end < start:
+        return empty
+    grid = np.arange(start, end + 1, dtype=np.int64)
+    daily_sales = np.zeros(len(grid))
+    inside = (days >= start) & (days <= end)
+    daily_sales[days[inside] - start] = sales[inside]
+    # Dernier jour avec mouvements au plus tard ce jour-là
+    last = np.searchsorted(days, grid, side="right") - 1
+    daily_stock = np.where(last >= 0, stock[np.maximum(last, 0)], 0.0)
+    return grid, daily_sales, daily_stock
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Largest-Triangle-Three-Buckets : garde `threshold` points qui conservent la forme
+    de la courbe (pics et creux compris). Premier et dernier points toujours gardés.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+    xf = np.asarray(x, dtype=np.float64)
+    yf = np.asarray(y, dtype=np.float64)
+    # Sommes cumulées : moyenne de n'importe quel seau en temps constant
+    cx = np.concatenate(([0.0], np.cumsum(xf)))
+    cy = np.concatenate(([0.0], np.cumsum(yf)))
+    every = (n - 2) / (threshold - 2)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0] = a = 0
+    for i in range(threshold - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        nlo, nhi = hi, min(int((i + 2) * every) + 1, n)
+        avg_x = (cx[nhi] - cx[nlo]) / (nhi - nlo)
+        avg_y = (cy[nhi] - cy[nlo]) / (nhi - nlo)
+        area = np.abs((xf[a] - avg_x) * (yf[lo:hi] - yf[a]) - (xf[a] - xf[lo:hi]) * (avg_y - yf[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    keep[-1] = n - 1
+    return x[keep], y[keep]
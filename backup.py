@@ -0,0 +1,267 @@
+import argparse
+import gzip
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional
+
+
+# --- Module backup.py ---
+# Sauvegarde à chaud de la base avec l'API de sauvegarde de SQLite.
+#
+# La copie se fait par paquets de `pages` pages depuis une connexion dédiée : entre
+# deux paquets le verrou est relâché et les postes continuent d'écrire (en WAL, la
+# lecture ne bloque d'ailleurs jamais les écritures). Si d'autres connexions écrivent
+# sans cesse, SQLite recommence la copie ; au-delà de `max_restarts` reprises, la
+# copie se termine en une seule étape sur un instantané cohérent.
+#
+# Chaque copie est vérifiée (PRAGMA integrity_check) avant d'être gardée, compressée
+# en gzip si demandé ; seules les `keep` dernières sont conservées.
+# La restauration vérifie la sauvegarde, met de côté la base actuelle, puis la remplace
+# page par page avec la même API.
+#
+#   python backup.py provenderie.db sauvegardes --gzip --keep 14
+#   python backup.py provenderie.db --restore sauvegardes/provenderie-20240131-2200.db.gz
+
+PREFIX_SEP = "-"
+STAMP = "%Y%m%d-%H%M%S"
+
+
+class BackupError(Exception):
+    pass
+
+
+class _Restarted(Exception):
+    """Levée depuis le rappel de progression pour abandonner une copie qui recommence sans fin."""
+
+
+def integrity_check(path) -> str:
+    cnx = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True)
+    try:
+        return cnx.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        cnx.close()
+
+
+def _copy(src: sqlite3.Connection, dst: sqlite3.Connection, pages: int, sleep: float, max_restarts: int,
+          progress: Optional[Callable[[int, int], None]]):
+    state = {"remaining": None, "restarts": 0}
+
+    def step(status, remaining, total):
+        if state["remaining"] is not None and remaining > state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > max_restarts:
+                raise _Restarted()
+        state["remaining"] = remaining
+        if progress:
+            progress(total - remaining, total)
+
+    try:
+        src.backup(dst, pages=pages, progress=step, sleep=sleep)
+    except _Restarted:
+        src.backup(dst, pages=-1)
+        if progress:
+            total = dst.execute("PRAGMA page_count").fetchone()[0]
+            progress(total, total)
+
+
+def _backup_key(path: Path, name: str):
+    """(horodatage, numéro) d'une sauvegarde de `name`, ou None pour un autre fichier."""
+    sep = re.escape(PREFIX_SEP)
+    m = re.fullmatch(rf"{re.escape(name)}{sep}(\d{{8}}{sep}\d{{6}})(?:{sep}(\d+))?\.db(?:\.gz)?", path.name)
+    if m is None:
+        return None
+    try:
+        stamp = datetime.strptime(m.group(1), STAMP)
+    except ValueError:
+        return None
+    # <base>-STAMP.db précède <base>-STAMP-1.db, créé dans la même seconde
+    return stamp, int(m.group(2) or 0)
+
+
+def _check_tables(cnx: sqlite3.Connection):
+    tables = {r[0] for r in cnx.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    if not {"product", "shop", "movement"} <= tables:
+        raise BackupError("Ce fichier n'est pas une base Provenderie.")
+
+
+def _open_source(db_path: Path) -> sqlite3.Connection:
+    """Base à sauvegarder, en lecture seule : un chemin erroné ne crée pas de base vide."""
+    if not db_path.is_file():
+        raise BackupError(f"Base introuvable : {db_path}")
+    src = sqlite3.connect(db_path.absolute().as_uri() + "?mode=ro", uri=True, timeout=30)
+    try:
+        _check_tables(src)
+    except sqlite3.DatabaseError as e:
+        src.close()
+        raise BackupError(f"Base illisible : {e}")
+    except BackupError:
+        src.close()
+        raise
+    return src
+
+
+def backups(directory, name: str) -> List[Path]:
+    """Sauvegardes de la base `name` dans `directory`, de la plus ancienne à la plus récente."""
+    directory = Path(directory)
+    found = []
+    for p in directory.glob(f"{name}{PREFIX_SEP}*.db*"):
+        key = _backup_key(p, name)
+        if key is not None:
+            found.append((key, p))
+    return [p for _, p in sorted(found)]
+
+
+def backup(db_path, directory, compress: bool = False, keep: Optional[int] = None, pages: int = 256,
+           sleep: float = 0.005, max_restarts: int = 5,
+           progress: Optional[Callable[[int, int], None]] = None) -> Path:
+    """
+    Copie la base dans `directory` sous le nom <base>-AAAAMMJJ-HHMMSS.db[.gz].
+    `progress(copiées, total)` est appelé après chaque paquet de pages.
+    """
+    db_path = Path(db_path)
+    src = _open_source(db_path)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = db_path.stem
+    stamp = datetime.now().strftime(STAMP)
+    target = directory / f"{name}{PREFIX_SEP}{stamp}.db"
+    n = 1
+    while target.exists() or target.with_name(target.name + ".gz").exists():
+        target = directory / f"{name}{PREFIX_SEP}{stamp}{PREFIX_SEP}{n}.db"
+        n += 1
+    part = target.with_name(target.name + ".part")
+
+    dst = sqlite3.connect(part)
+    try:
+        _copy(src, dst, pages, sleep, max_restarts, progress)
+        # Fichier autonome : pas de -wal à côté de la sauvegarde
+        dst.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        dst.close()
+        src.close()
+
+    result = integrity_check(part)
+    if result != "ok":
+        part.unlink(missing_ok=True)
+        raise BackupError(f"Sauvegarde invalide : {result}")
+    if compress:
+        gz = target.with_name(target.name + ".gz.part")
+        with open(part, "rb") as fin, gzip.open(gz, "wb", compresslevel=6) as fout:
+            shutil.copyfileobj(fin, fout, 1 << 20)
+        part.unlink()
+        target = target.with_name(target.name + ".gz")
+        gz.replace(target)
+    else:
+        part.replace(target)
+
+    if keep:
+        for old in backups(directory, name)[:-keep]:
+            old.unlink(missing_ok=True)
+    return target
+
+
+def restore(backup_path, db_path, pages: int = 256, progress: Optional[Callable[[int, int], None]] = None) -> Optional[Path]:
+    """
+    Remplace le contenu de `db_path` par la sauvegarde, après vérification.
+    La base actuelle est d'abord sauvegardée à côté d'elle (<base>-avant-restauration-...db) ;
+    retourne ce fichier. Les autres postes doivent être fermés pendant la restauration.
+    """
+    backup_path = Path(backup_path)
+    db_path = Path(db_path)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = backup_path
+        if backup_path.suffix == ".gz":
+            source = Path(tmp) / backup_path.stem
+            with gzip.open(backup_path, "rb") as fin, open(source, "wb") as fout:
+                shutil.copyfileobj(fin, fout, 1 << 20)
+        try:
+            result = integrity_check(source)
+        except sqlite3.DatabaseError as e:
+            raise BackupError(f"Sauvegarde illisible : {e}")
+        if result != "ok":
+            raise BackupError(f"Sauvegarde invalide : {result}")
+        src = sqlite3.connect(source)
+        try:
+            _check_tables(src)
+
+            saved = None
+            if db_path.exists():
+                saved = db_path.with_name(f"{db_path.stem}{PREFIX_SEP}avant-restauration{PREFIX_SEP}"
+                                          f"{datetime.now().strftime(STAMP)}.db")
+                cur = sqlite3.connect(db_path, timeout=30)
+                out = sqlite3.connect(saved)
+                try:
+                    cur.backup(out)
+                finally:
+                    out.close()
+                    cur.close()
+            dst = sqlite3.connect(db_path, timeout=30)
+            try:
+                src.backup(dst, pages=pages, progress=(lambda s, r, t: progress(t - r, t)) if progress else None)
+            finally:
+                dst.close()
+        finally:
+            src.close()
+    return saved
+
+
+class BackupJob(threading.Thread):
+    """
+    Sauvegarde dans un thread : l'interface lit `copied` / `total` et attend `done`.
+    La connexion de la sauvegarde est propre au thread ; celle de l'interface n'est pas utilisée.
+    """
+
+    def __init__(self, db_path, directory, compress: bool = False, keep: Optional[int] = None, pages: int = 256):
+        super().__init__(daemon=True)
+        self.args = (db_path, directory, compress, keep, pages)
+        self.copied = 0
+        self.total = 0
+        self.result: Optional[Path] = None
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+    def _progress(self, copied: int, total: int):
+        self.copied, self.total = copied, total
+
+    def run(self):
+        db_path, directory, compress, keep, pages = self.args
+        try:
+            self.result = backup(db_path, directory, compress=compress, keep=keep, pages=pages, progress=self._progress)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Sauvegarde à chaud / restauration d'une base Provenderie")
+    parser.add_argument("db", help="base, ex. provenderie.db")
+    parser.add_argument("directory", nargs="?", default="sauvegardes", help="dossier des sauvegardes")
+    parser.add_argument("--gzip", action="store_true", help="compresser la sauvegarde")
+    parser.add_argument("--keep", type=int, help="nombre de sauvegardes conservées")
+    parser.add_argument("--pages", type=int, default=256, help="pages copiées par étape")
+    parser.add_argument("--restore", metavar="SAUVEGARDE", help="restaurer cette sauvegarde dans la base")
+    args = parser.parse_args(argv)
+    try:
+        if args.restore:
+            saved = restore(args.restore, args.db, args.pages)
+            print(f"{args.db} restaurée depuis {args.restore}" + (f" (ancienne base : {saved})" if saved else ""))
+        else:
+            t = time.perf_counter()
+            path = backup(args.db, args.directory, args.gzip, args.keep, args.pages)
+            print(f"Sauvegarde vérifiée : {path} ({path.stat().st_size / 1e6:.1f} Mo, {time.perf_counter() - t:.1f} s)")
+    except BackupError as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
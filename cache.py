@@ -0,0 +1,67 @@
+import sys
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+
+# --- Module cache.py ---
+# Cache LRU borné des résultats d'agrégats (totaux filtrés, comptages).
+#
+# Chaque entrée est associée à une génération de données : dès que la génération
+# change (écriture de cette connexion ou d'une autre), tout le cache est vidé.
+# Au-delà de `max_entries` entrées ou de `max_bytes` octets (taille estimée des
+# clés et valeurs), les entrées les moins récemment utilisées sont évincées.
+
+
+def _size(obj) -> int:
+    """Taille approximative d'une clé ou d'une valeur (tuples, nombres, textes)."""
+    if isinstance(obj, (tuple, list)):
+        return sys.getsizeof(obj) + sum(_size(x) for x in obj)
+    return sys.getsizeof(obj)
+
+
+class LRUCache:
+    def __init__(self, max_entries: int = 256, max_bytes: int = 1 << 20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self.generation: Optional[Hashable] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def get_or_compute(self, generation: Hashable, key: Hashable, compute: Callable):
+        if generation != self.generation:
+            if self._entries:
+                self.invalidations += 1
+            self.clear()
+            self.generation = generation
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        value = compute()
+        size = _size(key) + _size(value)
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.evictions += 1
+        return value
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries), "bytes": self._bytes,
+            "hits": self.hits, "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions, "invalidations": self.invalidations,
+        }
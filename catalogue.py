@@ -0,0 +1,124 @@
+import csv
+import io
+from typing import Dict, List, Optional
+
+from utils import parse_number
+
+
+# --- Module catalogue.py ---
+# Import du catalogue / de la liste de prix fournisseur, en CSV indexé par SKU.
+#
+#   sku;libelle;poids_sac_kg;prix_kg;prix_sac;seuil_kg
+#
+# Seule la colonne sku est obligatoire : une liste de prix « sku;prix_kg;prix_sac »
+# ne modifie que les prix. `preview` compare le fichier au catalogue sans rien
+# écrire ; `apply` écrit toutes les lignes en une transaction (Database.upsert_products).
+
+COLUMNS = ("sku", "libelle", "poids_sac_kg", "prix_kg", "prix_sac", "seuil_kg", "actif")
+NUMERIC = ("poids_sac_kg", "prix_kg", "prix_sac", "seuil_kg")
+DEFAULTS = {"libelle": "", "poids_sac_kg": 50.0, "prix_kg": 0.0, "prix_sac": 0.0, "seuil_kg": 0.0, "actif": 1}
+
+# En-têtes acceptés en plus des noms de colonnes (fichiers exportés ou saisis à la main)
+ALIASES = {
+    "reference": "sku", "ref": "sku", "produit": "libelle", "designation": "libelle",
+    "1 sac (kg)": "poids_sac_kg", "poids_sac": "poids_sac_kg", "prix/kg": "prix_kg",
+    "prix/sac": "prix_sac", "seuil (kg)": "seuil_kg", "seuil": "seuil_kg",
+}
+
+
+def read_csv(text: str) -> List[Dict]:
+    """Lit le CSV (séparateur ';' ou ',') en dictionnaires aux noms de colonnes normalisés."""
+    try:
+        delimiter = csv.Sniffer().sniff(text[:4096], delimiters=";,\t").delimiter
+    except csv.Error:
+        delimiter = ";"
+    reader = csv.reader(io.StringIO(text), delimiter=delimiter)
+    header = next(reader, None)
+    if not header:
+        return []
+    names = []
+    for h in header:
+        key = h.strip().lstrip("\ufeff").lower()
+        names.append(ALIASES.get(key, key))
+    if "sku" not in names:
+        raise ValueError("Colonne 'sku' introuvable dans le fichier.")
+    rows = []
+    for values in reader:
+        if not any(v.strip() for v in values):
+            continue
+        rows.append({n: v.strip() for n, v in zip(names, values) if n in COLUMNS and v.strip()})
+    return rows
+
+
+def _normalize(row: Dict) -> Dict:
+    """Valeurs typées ; une cellule numérique illisible lève ValueError (jamais remplacée par 0)."""
+    out = {}
+    for key, value in row.items():
+        if key in NUMERIC:
+            try:
+                out[key] = parse_number(value)
+            except ValueError:
+                raise ValueError(f"Valeur non numérique pour {key} : « {value} »")
+        elif key == "actif":
+            out[key] = 0 if value.strip().lower() in ("0", "non", "false") else 1
+        else:
+            out[key] = value
+    return out
+
+
+def preview(db, rows: List[Dict]) -> Dict:
+    """
+    Différences entre le fichier et le catalogue, sans écriture.
+    Retourne {"columns", "new", "changed", "unchanged", "errors", "rows"} ;
+    chaque entrée de "rows" : {"sku", "status", "changes": {col: (ancien, nouveau)}, "data"}.
+    """
+    columns = [c for c in COLUMNS if any(c in r for r in rows)]
+    by_sku: Dict[str, Dict] = {}
+    errors = []
+    for i, raw in enumerate(rows, start=2):
+        if not raw.get("sku"):
+            errors.append({"line": i, "sku": "", "error": "SKU manquant"})
+            continue
+        try:
+            data = _normalize(raw)
+        except ValueError as e:
+            # Ligne écartée : ni prix à 0, ni version plus ancienne du même SKU appliquée
+            errors.append({"line": i, "sku": raw["sku"], "error": str(e)})
+            by_sku.pop(raw["sku"], None)
+            continue
+        # Un SKU répété : la dernière ligne l'emporte
+        by_sku[raw["sku"]] = data
+
+    result = {"columns": columns, "new": 0, "changed": 0, "unchanged": 0, "errors": errors, "rows": []}
+    for sku, data in by_sku.items():
+        current: Optional[Dict] = db.product_by_sku(sku)
+        if current is None:
+            if not data.get("libelle"):
+                errors.append({"line": None, "sku": sku, "error": "Nouveau SKU sans libellé"})
+                continue
+            data.update({c: DEFAULTS[c] for c in columns if c not in data})
+            result["new"] += 1
+            result["rows"].append({"sku": sku, "status": "nouveau", "changes": {c: (None, data[c]) for c in data if c != "sku"}, "data": data})
+            continue
+        # Cellule vide : la valeur actuelle est conservée
+        data.update({c: current[c] for c in columns if c not in data})
+        changes = {c: (current[c], v) for c, v in data.items() if c != "sku" and current[c] != v}
+        status = "modifié" if changes else "inchangé"
+        result["changed" if changes else "unchanged"] += 1
+        result["rows"].append({"sku": sku, "status": status, "changes": changes, "data": data})
+    return result
+
+
+def apply(db, diff: Dict) -> int:
+    """Écrit les lignes nouvelles ou modifiées d'un aperçu ; retourne leur nombre."""
+    rows = [r["data"] for r in diff["rows"] if r["status"] != "inchangé"]
+    db.upsert_products(rows, diff["columns"])
+    return len(rows)
+
+
+def import_file(db, path: str, dry_run: bool = False) -> Dict:
+    with open(path, encoding="utf-8-sig") as f:
+        diff = preview(db, read_csv(f.read()))
+    if not dry_run:
+        apply(db, diff)
+    return diff
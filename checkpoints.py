@@ -0,0 +1,172 @@
+import sqlite3
+from datetime import date, datetime
+from typing import Dict, Optional
+
+
+# --- Module checkpoints.py ---
+# Points de contrôle mensuels du stock, pour « le stock de X dans la boutique Y
+# à la date D » sans sommer tout l'historique.
+#
+# stock_checkpoint(product_id, shop_id, period_end, qty_kg) : stock cumulé de
+# tous les mouvements avec created_at < period_end (1er jour d'un mois). On n'en
+# garde que pour les mois clos ayant eu des mouvements ; `built_until` indique
+# jusqu'où les points d'un couple sont complets et à jour.
+#
+# Une requête part du dernier point <= D et ne somme que les mouvements depuis.
+# Un mouvement inséré ou modifié avant des points existants les invalide. Les
+# points sont (re)construits par `build`, dans sa propre transaction courte : à
+# l'ouverture de la base et par `python -m provenderie rebuild checkpoints`.
+# La lecture n'écrit jamais : elle part du dernier point resté valide, quitte à
+# sommer plus de mouvements tant que les points ne sont pas complétés.
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS stock_checkpoint (
+        product_id INTEGER NOT NULL,
+        shop_id INTEGER NOT NULL,
+        period_end TEXT NOT NULL,
+        qty_kg REAL NOT NULL,
+        PRIMARY KEY (product_id, shop_id, period_end)
+    );
+    CREATE TABLE IF NOT EXISTS stock_checkpoint_state (
+        product_id INTEGER NOT NULL,
+        shop_id INTEGER NOT NULL,
+        built_until TEXT NOT NULL,
+        PRIMARY KEY (product_id, shop_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_movement_key_date ON movement(product_id, shop_id, created_at);
+"""
+
+
+def month_start(d: str) -> str:
+    """'YYYY-MM-DD...' -> 'YYYY-MM-01'."""
+    return d[:7] + "-01"
+
+
+def next_month(d: str) -> str:
+    y, m = int(d[:4]), int(d[5:7])
+    return f"{y + m // 12:04d}-{m % 12 + 1:02d}-01"
+
+
+def as_of_bound(when) -> str:
+    """Borne incluse sur created_at : une date seule couvre toute la journée."""
+    if isinstance(when, datetime):
+        return when.isoformat(timespec="seconds")
+    if isinstance(when, date):
+        when = when.isoformat()
+    when = str(when).strip()
+    return f"{when}T23:59:59" if len(when) == 10 else when
+
+
+class StockCheckpoints:
+    """Points de contrôle tenus à jour dans la transaction d'écriture de `Database`."""
+
+    def __init__(self, cnx: sqlite3.Connection, readonly: bool = False):
+        self.cnx = cnx
+        # Connexion en lecture seule : on utilise les points existants sans en créer
+        self.readonly = readonly
+        if not readonly:
+            self.cnx.executescript(SCHEMA)
+
+    def on_insert(self, m: Dict):
+        self.invalidate(m["product_id"], m["shop_id"], m["created_at"])
+
+    def on_update(self, old: Dict, new: Dict):
+        self.invalidate(old["product_id"], old["shop_id"], old["created_at"])
+        self.invalidate(new["product_id"], new["shop_id"], new["created_at"])
+
+    def invalidate(self, product_id: int, shop_id: int, created_at: str):
+        """Écarte les points postérieurs à un mouvement ajouté ou modifié à `created_at`."""
+        state = self.cnx.execute(
+            "SELECT built_until FROM stock_checkpoint_state WHERE product_id=? AND shop_id=?", (product_id, shop_id)
+        ).fetchone()
+        # Cas courant : mouvement du mois en cours, postérieur à tous les points
+        if state is None or created_at >= state[0]:
+            return
+        self.cnx.execute(
+            "DELETE FROM stock_checkpoint WHERE product_id=? AND shop_id=? AND period_end > ?",
+            (product_id, shop_id, created_at)
+        )
+        self.cnx.execute(
+            "UPDATE stock_checkpoint_state SET built_until=? WHERE product_id=? AND shop_id=?",
+            (month_start(created_at), product_id, shop_id)
+        )
+
+    def reset(self):
+        """Supprime tous les points (après une réécriture en masse du journal)."""
+        self.cnx.execute("DELETE FROM stock_checkpoint")
+        self.cnx.execute("DELETE FROM stock_checkpoint_state")
+
+    def build(self, product_id: Optional[int] = None, shop_id: Optional[int] = None) -> int:
+        """
+        Complète les points jusqu'au dernier mois clos, pour un couple ou pour tous,
+        dans une transaction à part. Rien n'est fait si une transaction de l'appelant
+        est ouverte (elle serait validée avec) ou en lecture seule. Retourne le nombre de couples.
+        """
+        if self.readonly or self.cnx.in_transaction:
+            return 0
+        self.cnx.execute("BEGIN IMMEDIATE")
+        try:
+            if product_id is not None and shop_id is not None:
+                pairs = [(product_id, shop_id)]
+            else:
+                pairs = self.cnx.execute("SELECT DISTINCT product_id, shop_id FROM movement").fetchall()
+            for pid, sid in pairs:
+                self._build_pair(pid, sid)
+            self.cnx.commit()
+        except Exception:
+            self.cnx.rollback()
+            raise
+        return len(pairs)
+
+    def _build_pair(self, product_id: int, shop_id: int):
+        """Complète les points du couple jusqu'au dernier mois clos (sans valider)."""
+        current = month_start(date.today().isoformat())
+        state = self.cnx.execute(
+            "SELECT built_until FROM stock_checkpoint_state WHERE product_id=? AND shop_id=?", (product_id, shop_id)
+        ).fetchone()
+        built_until = state[0] if state else ""
+        if built_until >= current:
+            return
+        last = self.cnx.execute(
+            "SELECT qty_kg FROM stock_checkpoint WHERE product_id=? AND shop_id=? AND period_end <= ? ORDER BY period_end DESC LIMIT 1",
+            (product_id, shop_id, built_until)
+        ).fetchone() if built_until else None
+        qty = float(last[0]) if last else 0.0
+        rows = self.cnx.execute(
+            """SELECT substr(created_at, 1, 7) AS month, SUM(qty_kg) FROM movement
+                WHERE product_id=? AND shop_id=? AND created_at >= ? AND created_at < ?
+                GROUP BY month ORDER BY month""",
+            (product_id, shop_id, built_until, current)
+        ).fetchall()
+        for month, total in rows:
+            qty += float(total or 0.0)
+            self.cnx.execute(
+                "INSERT OR REPLACE INTO stock_checkpoint(product_id, shop_id, period_end, qty_kg) VALUES (?,?,?,?)",
+                (product_id, shop_id, next_month(month), qty)
+            )
+        self.cnx.execute(
+            "INSERT OR REPLACE INTO stock_checkpoint_state(product_id, shop_id, built_until) VALUES (?,?,?)",
+            (product_id, shop_id, current)
+        )
+
+    def stock_at(self, product_id: int, shop_id: int, when) -> float:
+        """Stock (kg) du couple en tenant compte des mouvements jusqu'à `when` inclus (lecture seule)."""
+        bound = as_of_bound(when)
+        state = self.cnx.execute(
+            "SELECT built_until FROM stock_checkpoint_state WHERE product_id=? AND shop_id=?", (product_id, shop_id)
+        ).fetchone()
+        cp = None
+        if state is not None:
+            cp = self.cnx.execute(
+                """SELECT period_end, qty_kg FROM stock_checkpoint
+                    WHERE product_id=? AND shop_id=? AND period_end <= ? AND period_end <= ?
+                    ORDER BY period_end DESC LIMIT 1""",
+                (product_id, shop_id, bound, state[0])
+            ).fetchone()
+        start, base = (cp[0], float(cp[1])) if cp else ("", 0.0)
+        row = self.cnx.execute(
+            """SELECT COALESCE(SUM(qty_kg), 0) FROM movement
+                WHERE product_id=? AND shop_id=? AND created_at >= ? AND created_at <= ?""",
+            (product_id, shop_id, start, bound)
+        ).fetchone()
+        return base + float(row[0] or 0.0)
@@ -0,0 +1,205 @@
+import io
+import json
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+from numpy.lib import format as npy
+
+from db import TYPE_CODES
+
+
+# --- Module columnar.py ---
+# Copie en colonnes NumPy (.npy) du journal des mouvements, pour les analyses
+# lourdes sans passer par le fichier SQLite où écrivent les postes.
+#
+#   provenderie.columns/
+#       id.npy  product_id.npy  shop_id.npy  type.npy  qty_kg.npy  cost.npy  epoch.npy
+#       meta.json   {"origin", "rows", "last_id", "change_seq"}
+#
+# Chaque mise à jour n'ajoute que les mouvements d'id > last_id, à la fin des
+# fichiers (l'en-tête .npy est réécrit sur place). Les mouvements modifiés depuis
+# la dernière fois sont retrouvés dans change_log (module sync) et corrigés sur
+# place ; une suppression ou une copie incohérente entraîne une reconstruction.
+# Les colonnes sont ouvertes en mmap, en lecture seule : seules les pages lues
+# sont chargées en mémoire.
+
+COLUMNS = {
+    "id": np.int64,
+    "product_id": np.int32,
+    "shop_id": np.int32,
+    "type": np.int8,
+    "qty_kg": np.float64,
+    "cost": np.float64,
+    "epoch": np.int64,   # secondes depuis 1970-01-01 (created_at pris tel quel, sans fuseau)
+}
+
+_SELECT = f"""
+    SELECT id, product_id, shop_id,
+           CASE type {' '.join(f"WHEN '{t}' THEN {c}" for t, c in TYPE_CODES.items())} END,
+           qty_kg, COALESCE(cost, 0), CAST(strftime('%s', created_at) AS INTEGER)
+    FROM movement
+"""
+
+
+def default_dir(db_path: str) -> Path:
+    """provenderie.db -> provenderie.columns"""
+    return Path(db_path).with_suffix(".columns")
+
+
+def _read_header(f):
+    version = npy.read_magic(f)
+    read = npy.read_array_header_1_0 if version == (1, 0) else npy.read_array_header_2_0
+    shape, _, dtype = read(f)
+    return version, shape, dtype, f.tell()
+
+
+def _append(path: Path, values: np.ndarray):
+    """Ajoute des valeurs à la fin d'un fichier .npy à une dimension."""
+    if not path.exists():
+        np.save(path, values)
+        return
+    with open(path, "r+b") as f:
+        version, shape, dtype, offset = _read_header(f)
+        header = {"descr": npy.dtype_to_descr(dtype), "fortran_order": False, "shape": (shape[0] + len(values),)}
+        buf = io.BytesIO()
+        (npy.write_array_header_1_0 if version == (1, 0) else npy.write_array_header_2_0)(buf, header)
+        if buf.tell() == offset:
+            # NumPy réserve de la place dans l'en-tête pour que la longueur puisse grandir.
+            # Les données partent avant l'en-tête : des lignes laissées par un export
+            # interrompu après leur écriture sont coupées avant d'ajouter les nouvelles.
+            f.truncate(offset + shape[0] * dtype.itemsize)
+            f.seek(0, 2)
+            f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+            f.seek(0)
+            f.write(buf.getvalue())
+            return
+    # En-tête trop court (ancien format) : réécriture complète
+    np.save(path, np.concatenate([np.load(path), values.astype(dtype)]))
+
+
+class ColumnSnapshot:
+    """Colonnes du journal ouvertes en mmap (lecture seule)."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.meta = json.loads((self.directory / "meta.json").read_text(encoding="utf-8"))
+        self.columns = {name: np.load(self.directory / f"{name}.npy", mmap_mode="r") for name in COLUMNS}
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __len__(self) -> int:
+        return int(self.meta["rows"])
+
+    def day(self) -> np.ndarray:
+        """Numéro de jour depuis 1970-01-01 (même échelle que analytics._day_index)."""
+        return self.columns["epoch"] // 86400
+
+
+class ColumnExporter:
+    """Tient à jour la copie en colonnes d'une base."""
+
+    def __init__(self, db, directory=None, batch: int = 100_000):
+        self.db = db
+        self.directory = Path(directory) if directory else default_dir(db.path)
+        self.batch = batch
+
+    def _meta_path(self) -> Path:
+        return self.directory / "meta.json"
+
+    def _load_meta(self) -> Optional[Dict]:
+        try:
+            meta = json.loads(self._meta_path().read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        from sync import origin_of
+        if meta.get("origin") != origin_of(self.db):
+            return None
+        # Un export interrompu laisse des colonnes plus longues que meta.json
+        for name in COLUMNS:
+            path = self.directory / f"{name}.npy"
+            if not path.exists():
+                return None
+            with open(path, "rb") as f:
+                if _read_header(f)[1][0] != meta["rows"]:
+                    return None
+        return meta
+
+    def _save_meta(self, meta: Dict):
+        tmp = self._meta_path().with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        tmp.replace(self._meta_path())
+
+    def _change_seq(self) -> int:
+        return self.db.cnx.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+
+    def refresh(self, rebuild: bool = False) -> Dict:
+        """
+        Met la copie à jour ; retourne {"appended", "patched", "rebuilt", "rows"}.
+        """
+        from sync import origin_of
+        self.directory.mkdir(parents=True, exist_ok=True)
+        meta = None if rebuild else self._load_meta()
+        change_seq = self._change_seq()
+        patched = 0
+        if meta is not None:
+            changed = self.db.cnx.execute(
+                """SELECT
+                       SUM(op = 'delete'),
+                       GROUP_CONCAT(CASE WHEN op = 'update' THEN row_uid END, ',')
+                   FROM change_log WHERE entity = 'movement' AND seq > ?""",
+                (meta["change_seq"],)
+            ).fetchone()
+            if changed[0]:
+                meta = None
+            elif changed[1]:
+                patched = self._patch(changed[1].split(","), meta["last_id"])
+        rebuilt = meta is None
+        if rebuilt:
+            for name in COLUMNS:
+                (self.directory / f"{name}.npy").unlink(missing_ok=True)
+            meta = {"origin": origin_of(self.db), "rows": 0, "last_id": 0, "change_seq": 0}
+
+        appended = 0
+        while True:
+            rows = self.db.cnx.execute(_SELECT + " WHERE id > ? ORDER BY id LIMIT ?",
+                                       (meta["last_id"], self.batch)).fetchall()
+            if not rows:
+                break
+            data = np.array([tuple(r) for r in rows], dtype=[(n, t) for n, t in COLUMNS.items()])
+            for name in COLUMNS:
+                _append(self.directory / f"{name}.npy", data[name])
+            meta["rows"] += len(rows)
+            meta["last_id"] = int(data["id"][-1])
+            appended += len(rows)
+            self._save_meta(dict(meta))
+        if meta["rows"] == 0:
+            for name, dtype in COLUMNS.items():
+                np.save(self.directory / f"{name}.npy", np.zeros(0, dtype=dtype))
+        meta["change_seq"] = change_seq
+        self._save_meta(meta)
+        return {"appended": appended, "patched": patched, "rebuilt": rebuilt, "rows": meta["rows"]}
+
+    def _patch(self, uids, last_id: int) -> int:
+        """Réécrit sur place les lignes déjà exportées qui ont été modifiées."""
+        rows = []
+        uids = sorted(set(uids))
+        for i in range(0, len(uids), 500):
+            chunk = uids[i:i + 500]
+            rows += self.db.cnx.execute(
+                _SELECT + f" WHERE id <= ? AND uid IN ({','.join('?' * len(chunk))})", [last_id] + chunk
+            ).fetchall()
+        if not rows:
+            return 0
+        data = np.array([tuple(r) for r in rows], dtype=[(n, t) for n, t in COLUMNS.items()])
+        ids = np.load(self.directory / "id.npy", mmap_mode="r")
+        pos = np.searchsorted(ids, data["id"])
+        for name in COLUMNS:
+            if name == "id":
+                continue
+            col = np.load(self.directory / f"{name}.npy", mmap_mode="r+")
+            col[pos] = data[name]
+            col.flush()
+            del col
+        return len(rows)
@@ -0,0 +1,245 @@
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+from db import TYPE_CODES
+
+
+# --- Module compact.py ---
+# Disposition compacte du journal des mouvements, pour les bases d'archive et
+# d'analyse (copie d'une base, exercices clos) :
+#
+#   movement_data(id, product_id, shop_id, type_code, qty_kg, unit_price_kg,
+#                 unit_price_sac, cost, ts)      -- type en entier (TYPE_CODES),
+#                                                -- ts en secondes depuis 1970
+#   movement_note(movement_id, note)             -- seulement les notes non vides
+#   VIEW movement                                -- colonnes d'origine, pour les lectures
+#
+# La vue rend le texte du type et created_at au format ISO : les requêtes de
+# Database (ouverte en lecture seule) fonctionnent telles quelles sur la copie.
+# La base de travail garde la disposition en lignes : les triggers de
+# synchronisation, d'alertes et d'écriture portent sur la table `movement`.
+#
+#   python compact.py migrate provenderie.db archive-2024.db
+#   python compact.py bench --rows 1000000
+
+_TYPE_TEXT = "CASE {col} " + " ".join(f"WHEN {c} THEN '{t}'" for t, c in TYPE_CODES.items()) + " END"
+_TYPE_CODE = "CASE {col} " + " ".join(f"WHEN '{t}' THEN {c}" for t, c in TYPE_CODES.items()) + " END"
+_ISO = "strftime('%Y-%m-%dT%H:%M:%S', {col}, 'unixepoch')"
+_EPOCH = "CAST(strftime('%s', {col}) AS INTEGER)"
+
+COMPACT_SCHEMA = f"""
+    CREATE TABLE movement_data (
+        id INTEGER PRIMARY KEY,
+        product_id INTEGER NOT NULL,
+        shop_id INTEGER NOT NULL,
+        type_code INTEGER NOT NULL CHECK(type_code IN ({', '.join(str(c) for c in TYPE_CODES.values())})),
+        qty_kg REAL NOT NULL,
+        unit_price_kg REAL,
+        unit_price_sac REAL,
+        cost REAL,
+        ts INTEGER NOT NULL
+    );
+    CREATE TABLE movement_note (
+        movement_id INTEGER PRIMARY KEY,
+        note TEXT NOT NULL
+    );
+"""
+COMPACT_VIEW = f"""
+    CREATE VIEW movement AS
+        SELECT d.id, d.product_id, d.shop_id, {_TYPE_TEXT.format(col="d.type_code")} AS type,
+               d.qty_kg, d.unit_price_kg, d.unit_price_sac, d.cost, COALESCE(n.note, '') AS note,
+               {_ISO.format(col="d.ts")} AS created_at
+        FROM movement_data d LEFT JOIN movement_note n ON n.movement_id = d.id;
+"""
+COMPACT_INDEXES = """
+    CREATE INDEX idx_movement_data_ts ON movement_data(ts, id);
+    CREATE INDEX idx_movement_data_key ON movement_data(product_id, shop_id, ts);
+"""
+
+
+def migrate(src_path, out_path) -> Dict:
+    """
+    Écrit dans `out_path` une copie de la base avec le journal en disposition compacte.
+    Les triggers de la table movement (synchronisation, alertes) ne sont pas repris :
+    la copie est destinée à la lecture.
+    """
+    out_path = Path(out_path)
+    if out_path.exists():
+        raise FileExistsError(out_path)
+    src = sqlite3.connect(src_path, timeout=30)
+    out = sqlite3.connect(out_path)
+    try:
+        src.backup(out)
+    finally:
+        src.close()
+    try:
+        out.execute("PRAGMA journal_mode = DELETE")
+        for (name,) in out.execute("SELECT name FROM sqlite_master WHERE type='trigger' AND tbl_name='movement'").fetchall():
+            out.execute(f'DROP TRIGGER "{name}"')
+        out.executescript(COMPACT_SCHEMA)
+        out.execute(f"""INSERT INTO movement_data
+                        SELECT id, product_id, shop_id, {_TYPE_CODE.format(col="type")}, qty_kg,
+                               unit_price_kg, unit_price_sac, cost, {_EPOCH.format(col="created_at")}
+                        FROM movement ORDER BY id""")
+        out.execute("INSERT INTO movement_note SELECT id, note FROM movement WHERE note IS NOT NULL AND note <> ''")
+        rows = out.execute("SELECT COUNT(*) FROM movement").fetchone()[0]
+        notes = out.execute("SELECT COUNT(*) FROM movement_note").fetchone()[0]
+        out.execute("DROP TABLE movement")
+        out.executescript(COMPACT_VIEW + COMPACT_INDEXES)
+        out.commit()
+        out.execute("VACUUM")
+    finally:
+        out.close()
+    return {"rows": rows, "notes": notes, "size": out_path.stat().st_size}
+
+
+# ----------------------------------------------------------------------
+# Mesure : même journal généré dans les deux dispositions
+
+ROW_SCHEMA = """
+    CREATE TABLE movement (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        product_id INTEGER NOT NULL,
+        shop_id INTEGER NOT NULL,
+        type TEXT NOT NULL CHECK(type IN ('IN','OUT','ADJ')),
+        qty_kg REAL NOT NULL,
+        unit_price_kg REAL,
+        unit_price_sac REAL,
+        cost REAL,
+        note TEXT,
+        created_at TEXT NOT NULL,
+        uid TEXT
+    );
+    CREATE INDEX idx_movement_created ON movement(created_at, id);
+    CREATE INDEX idx_movement_key_date ON movement(product_id, shop_id, created_at);
+"""
+
+
+def _generate(rows: int, seed: int = 1):
+    """Journal réaliste : 200 produits, 5 boutiques, 3 ans, une note sur dix."""
+    rnd = random.Random(seed)
+    start = 1_700_000_000
+    span = 3 * 365 * 86400
+    step = span / rows
+    for i in range(rows):
+        t = rnd.choice(("IN", "OUT", "OUT", "OUT", "ADJ"))
+        qty = rnd.uniform(1, 500)
+        if t == "OUT":
+            qty = -qty
+        price = rnd.choice((250.0, 300.0, 325.0, 400.0))
+        note = "" if rnd.random() > 0.1 else f"Ajustement inventaire -> cible {rnd.uniform(0, 900):.2f} kg"
+        ts = int(start + i * step)
+        yield (rnd.randint(1, 200), rnd.randint(1, 5), t, qty, price, price * 50, abs(qty) * price, note, ts,
+               "%032x" % rnd.getrandbits(128))
+
+
+def _best(cnx, sql: str, params=(), repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        cnx.execute(sql, params).fetchall()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+
+def bench(rows: int = 1_000_000, directory=None, repeat: int = 3) -> Dict:
+    directory = Path(directory or tempfile.mkdtemp(prefix="provenderie-compact-"))
+    directory.mkdir(parents=True, exist_ok=True)
+    row_path, compact_path = directory / "lignes.db", directory / "compacte.db"
+    for p in (row_path, compact_path):
+        p.unlink(missing_ok=True)
+
+    row = sqlite3.connect(row_path)
+    row.executescript(ROW_SCHEMA)
+    row.executemany(
+        f"INSERT INTO movement(product_id, shop_id, type, qty_kg, unit_price_kg, unit_price_sac, cost, note, created_at, uid)"
+        f" VALUES (?,?,?,?,?,?,?,?,{_ISO.format(col='?')},?)",
+        _generate(rows)
+    )
+    row.commit()
+    row.execute("VACUUM")
+
+    compact = sqlite3.connect(compact_path)
+    compact.executescript(COMPACT_SCHEMA + COMPACT_VIEW)
+    compact.execute("ATTACH DATABASE ? AS src", (str(row_path),))
+    compact.execute(f"""INSERT INTO movement_data
+                        SELECT id, product_id, shop_id, {_TYPE_CODE.format(col="type")}, qty_kg,
+                               unit_price_kg, unit_price_sac, cost, {_EPOCH.format(col="created_at")}
+                        FROM src.movement ORDER BY id""")
+    compact.execute("INSERT INTO movement_note SELECT id, note FROM src.movement WHERE note <> ''")
+    compact.commit()
+    compact.execute("DETACH DATABASE src")
+    compact.executescript(COMPACT_INDEXES)
+    compact.execute("VACUUM")
+
+    # Mois au milieu de l'historique, produit 42 boutique 1
+    month_from, month_to = "2024-06-01", "2024-07-01"
+    queries = {
+        "totaux par type (parcours complet)": (
+            "SELECT type, SUM(qty_kg), SUM(cost) FROM movement GROUP BY type", (),
+            "SELECT type_code, SUM(qty_kg), SUM(cost) FROM movement_data GROUP BY type_code", ()),
+        "ventes d'un mois par produit": (
+            "SELECT product_id, SUM(cost) FROM movement WHERE type='OUT' AND created_at >= ? AND created_at < ? GROUP BY product_id",
+            (month_from, month_to),
+            f"SELECT product_id, SUM(cost) FROM movement_data WHERE type_code={TYPE_CODES['OUT']} AND ts >= {_EPOCH.format(col='?')} "
+            f"AND ts < {_EPOCH.format(col='?')} GROUP BY product_id",
+            (month_from, month_to)),
+        "stock d'un produit à une date": (
+            "SELECT SUM(qty_kg) FROM movement WHERE product_id=42 AND shop_id=1 AND created_at <= ?", ("2025-01-01T00:00:00",),
+            f"SELECT SUM(qty_kg) FROM movement_data WHERE product_id=42 AND shop_id=1 AND ts <= {_EPOCH.format(col='?')}",
+            ("2025-01-01T00:00:00",)),
+        "totaux par type (vue de compatibilité)": (
+            "SELECT type, SUM(qty_kg), SUM(cost) FROM movement GROUP BY type", (),
+            "SELECT type, SUM(qty_kg), SUM(cost) FROM movement GROUP BY type", ()),
+    }
+    report = {"rows": rows, "directory": str(directory), "size": {}, "pages": {}, "table_bytes": {}, "queries": {}}
+    for label, cnx, path, tables in (("lignes", row, row_path, ("movement",)),
+                                     ("compacte", compact, compact_path, ("movement_data", "movement_note"))):
+        report["size"][label] = os.path.getsize(path)
+        report["pages"][label] = cnx.execute("PRAGMA page_count").fetchone()[0]
+        report["table_bytes"][label] = cnx.execute(
+            f"SELECT SUM(pgsize) FROM dbstat WHERE name IN ({','.join('?' * len(tables))})", tables
+        ).fetchone()[0]
+    for name, (row_sql, row_params, compact_sql, compact_params) in queries.items():
+        report["queries"][name] = (_best(row, row_sql, row_params, repeat), _best(compact, compact_sql, compact_params, repeat))
+    row.close()
+    compact.close()
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Disposition compacte du journal des mouvements")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("migrate", help="copie compacte d'une base (lecture, archive)")
+    p.add_argument("src")
+    p.add_argument("out")
+    p = sub.add_parser("bench", help="comparer taille et vitesse de parcours des deux dispositions")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--dir", help="dossier des bases générées (défaut : dossier temporaire)")
+    p.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate":
+        r = migrate(args.src, args.out)
+        print(f"{args.out} : {r['rows']} mouvements, {r['notes']} notes, {r['size'] / 1e6:.1f} Mo")
+        return 0
+    r = bench(args.rows, args.dir, args.repeat)
+    print(f"{r['rows']} mouvements générés dans {r['directory']}")
+    print(f"{'':<40} {'lignes':>12} {'compacte':>12}")
+    print(f"{'fichier (Mo)':<40} {r['size']['lignes'] / 1e6:>12.1f} {r['size']['compacte'] / 1e6:>12.1f}")
+    print(f"{'pages':<40} {r['pages']['lignes']:>12} {r['pages']['compacte']:>12}")
+    print(f"{'tables du journal sans index (Mo)':<40} {r['table_bytes']['lignes'] / 1e6:>12.1f} {r['table_bytes']['compacte'] / 1e6:>12.1f}")
+    for name, (a, b) in r["queries"].items():
+        print(f"{name + ' (ms)':<40} {a:>12.1f} {b:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,441 @@
+import argparse
+import math
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from checkpoints import as_of_bound
+from db import Database
+from valuation import METHODS, CostEngine
+
+
+# --- Module crosscheck.py ---
+# Vérification différentielle des chemins rapides de Database.
+#
+# Des journaux aléatoires sont construits (boutiques, produits, entrées, sorties,
+# ajustements datés sur deux ans) puis modifiés par une suite aléatoire
+# d'opérations : ajout, modification de mouvement, inventaire, modification et
+# archivage de produit, écritures depuis un second poste. Après chaque opération,
+# chaque chemin optimisé (tables tenues par triggers, points de contrôle, cache
+# des agrégats, fenêtres SQL) est comparé à la requête naïve d'origine, exécutée
+# sur une connexion à part, sans table dérivée ni cache. La valorisation tenue
+# mouvement par mouvement (movement_cost, cost_state, stock_value, cogs) est
+# comparée à un CostEngine.rebuild() complet sur une copie en mémoire du journal.
+#
+# tests/test_crosscheck.py en rejoue quelques journaux à graine fixe.
+#
+#   python crosscheck.py --runs 50 --ops 200
+#   python crosscheck.py --seed 1234 --runs 1 -v      (rejouer un échec)
+#
+# Les sommes des tables dérivées sont tenues par ajouts successifs : les valeurs
+# sont comparées à TOL près, et un produit exactement à son seuil peut tomber
+# d'un côté ou de l'autre selon l'arrondi.
+
+TOL = 1e-6
+DAYS = [f"{y}-{m:02d}-{d:02d}" for y in (2024, 2025) for m in range(1, 13) for d in (1, 5, 9, 14, 20, 28)]
+
+
+class Mismatch(AssertionError):
+    pass
+
+
+def _close(a: float, b: float) -> bool:
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=TOL)
+
+
+class Naive:
+    """Requêtes d'origine, sur une connexion en lecture seule distincte de celle de Database."""
+
+    def __init__(self, path):
+        self.cnx = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True)
+        self.cnx.row_factory = sqlite3.Row
+
+    def list_products(self) -> List[Dict]:
+        # ORDER BY libelle d'origine ; les libellés générés sont uniques
+        return [dict(r) for r in self.cnx.execute("SELECT * FROM product WHERE actif=1 ORDER BY libelle, id")]
+
+    def stock_kg(self, product_id: int, shop_id: int) -> float:
+        row = self.cnx.execute("SELECT COALESCE(SUM(qty_kg),0) FROM movement WHERE product_id=? AND shop_id=?",
+                               (product_id, shop_id)).fetchone()
+        return float(row[0] or 0.0)
+
+    def all_stocks(self, shop_id: int) -> List[Tuple[Dict, float]]:
+        return [(p, self.stock_kg(p["id"], shop_id)) for p in self.list_products()]
+
+    def low_stock_products(self, shop_id: int) -> List[Dict]:
+        items = []
+        for p, qty in self.all_stocks(shop_id):
+            if qty <= p.get("seuil_kg", 0):
+                d = dict(p)
+                d["stock_kg"] = qty
+                items.append(d)
+        return items
+
+    @staticmethod
+    def _where(shop_id, q, date_from, date_to, mtype=None) -> Tuple[str, List]:
+        where, params = [], []
+        if mtype:
+            where.append("m.type = ?")
+            params.append(mtype)
+        if shop_id:
+            where.append("m.shop_id = ?")
+            params.append(shop_id)
+        if q:
+            where.append("(p.libelle LIKE ? OR ifnull(p.sku,'') LIKE ?)")
+            params.extend([f"%{q.strip()}%", f"%{q.strip()}%"])
+        if date_from:
+            where.append("date(m.created_at) >= date(?)")
+            params.append(date_from)
+        if date_to:
+            where.append("date(m.created_at) <= date(?)")
+            params.append(date_to)
+        return (" WHERE " + " AND ".join(where)) if where else "", params
+
+    def total_sales_and_cogs(self, shop_id, q, date_from, date_to) -> Tuple[float, float]:
+        where, params = self._where(shop_id, q, date_from, date_to)
+        row = self.cnx.execute(
+            """SELECT SUM(CASE WHEN m.type='OUT' THEN m.cost ELSE 0 END),
+                      SUM(CASE WHEN m.type='IN' THEN m.cost ELSE 0 END)
+               FROM movement m JOIN product p ON p.id = m.product_id""" + where, params
+        ).fetchone()
+        return float(row[0] or 0), float(row[1] or 0)
+
+    def count_movements(self, mtype, shop_id, q, date_from, date_to) -> int:
+        where, params = self._where(shop_id, q, date_from, date_to, mtype)
+        return self.cnx.execute("SELECT COUNT(*) FROM movement m JOIN product p ON p.id = m.product_id" + where,
+                                params).fetchone()[0]
+
+    def stock_kg_at(self, product_id: int, shop_id: int, day: str) -> float:
+        row = self.cnx.execute(
+            "SELECT COALESCE(SUM(qty_kg),0) FROM movement WHERE product_id=? AND shop_id=? AND created_at <= ?",
+            (product_id, shop_id, f"{day}T23:59:59")
+        ).fetchone()
+        return float(row[0] or 0.0)
+
+    def daily_series(self, product_id, shop_id, date_from, date_to) -> List[Tuple[str, float, float]]:
+        net, sales = defaultdict(float), defaultdict(float)
+        for m in self.cnx.execute("SELECT * FROM movement ORDER BY created_at, id"):
+            if (product_id and m["product_id"] != product_id) or (shop_id and m["shop_id"] != shop_id):
+                continue
+            day = m["created_at"][:10]
+            if date_to and day > date_to:
+                continue
+            net[day] += m["qty_kg"]
+            if m["type"] == "OUT":
+                sales[day] += m["cost"] or 0
+        rows, stock = [], 0.0
+        for day in sorted(net):
+            stock += net[day]
+            rows.append((day, sales[day], stock))
+        if date_from:
+            before = [i for i, r in enumerate(rows) if r[0] < date_from]
+            rows = rows[before[-1]:] if before else [r for r in rows if r[0] >= date_from]
+        return rows
+
+    def sales_by_product(self, shop_id, date_from, date_to) -> Dict[int, Tuple[float, float]]:
+        where, params = self._where(shop_id, "", date_from, date_to, "OUT")
+        return {r[0]: (float(r[1]), float(r[2])) for r in self.cnx.execute(
+            "SELECT m.product_id, SUM(COALESCE(m.cost, 0)), SUM(-m.qty_kg) FROM movement m "
+            "JOIN product p ON p.id = m.product_id" + where + " GROUP BY m.product_id", params)}
+
+
+class Rebuilt:
+    """Valorisation recalculée de zéro (CostEngine.rebuild) sur une copie en mémoire du journal."""
+
+    COST_COLUMNS = ("product_id", "shop_id", "value_delta", "qty_after", "value_after", "unit_after",
+                    "consumed_after", "cum_in_after", "cogs_after")
+    STATE_COLUMNS = ("qty_kg", "value", "unit_cost", "consumed_kg", "cum_in_kg", "cogs")
+
+    def __init__(self, path, method: str):
+        src = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True)
+        self.cnx = sqlite3.connect(":memory:")
+        try:
+            src.backup(self.cnx)
+        finally:
+            src.close()
+        self.cnx.row_factory = sqlite3.Row
+        self.engine = CostEngine(self.cnx, method)
+        self.engine.rebuild()
+
+    @classmethod
+    def read_cost_state(cls, cnx) -> Dict[Tuple[int, int], Tuple]:
+        # Un couple vidé par update_movement garde un état nul ; le rebuild n'en crée pas
+        return {(r[0], r[1]): tuple(r[2:]) for r in cnx.execute(
+            f"SELECT product_id, shop_id, {', '.join(cls.STATE_COLUMNS)} FROM cost_state") if any(r[2:])}
+
+    @classmethod
+    def read_movement_cost(cls, cnx) -> Dict[int, Tuple]:
+        return {r[0]: tuple(r[1:]) for r in cnx.execute(
+            f"SELECT movement_id, {', '.join(cls.COST_COLUMNS)} FROM movement_cost")}
+
+    def cogs(self, shop_id, q, date_from, date_to) -> float:
+        where, params = Naive._where(shop_id, q, date_from, date_to, "OUT")
+        return float(self.cnx.execute(
+            """SELECT COALESCE(SUM(-mc.value_delta), 0) FROM movement_cost mc
+                JOIN movement m ON m.id = mc.movement_id JOIN product p ON p.id = m.product_id""" + where, params
+        ).fetchone()[0])
+
+    def close(self):
+        self.cnx.close()
+
+
+def _same_rows(fast: Dict, slow: Dict) -> bool:
+    return set(fast) == set(slow) and all(
+        all(_close(a, b) for a, b in zip(fast[k], slow[k])) for k in fast)
+
+
+class Scenario:
+    """Un journal aléatoire et sa suite d'opérations, rejouable par sa graine."""
+
+    def __init__(self, path, seed: int, verbose: bool = False):
+        self.rnd = random.Random(seed)
+        self.seed = seed
+        self.verbose = verbose
+        self.path = path
+        self.method = self.rnd.choice(METHODS)
+        self.db = Database(str(path), valuation_method=self.method)
+        # Second poste : ses écritures doivent invalider le cache du premier
+        # (ref_version relue à chaque accès, sans délai, pour comparer au naïf)
+        self.other = Database(str(path), valuation_method=self.method)
+        self.db.refs_check_seconds = 0
+        self.naive = Naive(path)
+        self.shops = [1] + [self.db.add_shop(f"Boutique {i}") for i in range(self.rnd.randint(1, 3))]
+        self.products: List[int] = []
+        for _ in range(self.rnd.randint(3, 10)):
+            self.add_product()
+        self.checks = 0
+        self.step = "initialisation"
+
+    def close(self):
+        for cnx in (self.db.cnx, self.other.cnx, self.naive.cnx):
+            cnx.close()
+
+    # ------------------------------------------------------------------
+    # Opérations
+
+    def writer(self) -> Database:
+        return self.other if self.rnd.random() < 0.25 else self.db
+
+    def _movement(self) -> Dict:
+        rnd = self.rnd
+        mtype = rnd.choice(("IN", "IN", "OUT", "OUT", "OUT", "ADJ"))
+        qty = round(rnd.uniform(0.5, 250), 2)
+        if mtype == "OUT" or (mtype == "ADJ" and rnd.random() < 0.5):
+            qty = -qty
+        price = rnd.choice((150.0, 275.0, 310.5, 400.0))
+        return {"product_id": rnd.choice(self.products), "shop_id": rnd.choice(self.shops), "mtype": mtype,
+                "qty_kg": qty, "unit_price_kg": price, "cost": round(abs(qty) * price, 2)}
+
+    def add_product(self):
+        n = len(self.products)
+        pid = self.writer().add_product(f"SKU-{n:03d}", f"Produit {self.rnd.randint(0, 999):03d}-{n:03d}",
+                                        self.rnd.choice((25.0, 50.0)), 300.0, 15000.0,
+                                        float(self.rnd.choice((0, 20, 50, 100, 250))))
+        self.products.append(pid)
+        return f"add_product -> {pid}"
+
+    def add_movements(self):
+        items = []
+        for _ in range(self.rnd.randint(1, 6)):
+            m = self._movement()
+            m["created_at"] = f"{self.rnd.choice(DAYS)}T{self.rnd.randint(6, 20):02d}:{self.rnd.randint(0, 59):02d}:00"
+            items.append(m)
+        self.writer().add_movements(items)
+        return f"add_movements x{len(items)}"
+
+    def add_movement(self):
+        m = self._movement()
+        mid = self.writer().add_movement(**m)
+        return f"add_movement -> {mid}"
+
+    def update_movement(self):
+        ids = [r[0] for r in self.naive.cnx.execute("SELECT id FROM movement")]
+        if not ids:
+            return self.add_movement()
+        mid = self.rnd.choice(ids)
+        self.writer().update_movement(mid, **self._movement())
+        return f"update_movement {mid}"
+
+    def inventory(self):
+        shop_id = self.rnd.choice(self.shops)
+        counts = {pid: round(self.rnd.uniform(0, 300), 2) for pid in self.rnd.sample(self.products, min(3, len(self.products)))}
+        # Produit compté exactement à son seuil : cas limite de low_stock_products
+        pid = self.rnd.choice(list(counts))
+        p = self.db.get_product(pid)
+        if self.rnd.random() < 0.3:
+            counts[pid] = p["seuil_kg"]
+        self.writer().post_inventory_counts(counts, shop_id=shop_id)
+        return f"post_inventory_counts shop {shop_id} {counts}"
+
+    def update_product(self):
+        pid = self.rnd.choice(self.products)
+        p = self.db.get_product(pid)
+        seuil = float(self.rnd.choice((0, 20, 50, 100, 250, 1000)))
+        actif = 1 if self.rnd.random() < 0.8 else p["actif"]
+        self.writer().update_product(pid, p["sku"], p["libelle"], p["poids_sac_kg"], p["prix_kg"], p["prix_sac"], seuil, actif)
+        return f"update_product {pid} seuil={seuil} actif={actif}"
+
+    def archive_product(self):
+        pid = self.rnd.choice(self.products)
+        self.writer().archive_product(pid)
+        return f"archive_product {pid}"
+
+    OPS = (("add_movements", 6), ("add_movement", 3), ("update_movement", 3), ("inventory", 1),
+           ("update_product", 2), ("archive_product", 1), ("add_product", 1))
+
+    def run(self, ops: int):
+        names = [n for n, _ in self.OPS]
+        weights = [w for _, w in self.OPS]
+        self.check()
+        for i in range(ops):
+            self.step = f"opération {i + 1} : " + getattr(self, self.rnd.choices(names, weights)[0])()
+            if self.verbose:
+                print(f"  {self.step}")
+            self.check()
+
+    # ------------------------------------------------------------------
+    # Comparaisons
+
+    def fail(self, path: str, args, fast, naive):
+        raise Mismatch(f"graine {self.seed}, {self.step}\n  {path}{args}\n  rapide : {fast!r}\n  naïf   : {naive!r}")
+
+    def _filters(self) -> Tuple:
+        rnd = self.rnd
+        shop_id = rnd.choice([None] + self.shops)
+        q = rnd.choice(("", "", "Produit 1", "SKU-00", "-00"))
+        date_from = rnd.choice((None, rnd.choice(DAYS)))
+        date_to = rnd.choice((None, rnd.choice(DAYS)))
+        return shop_id, q, date_from, date_to
+
+    def check(self):
+        self.checks += 1
+        db, naive = self.db, self.naive
+        for sid in self.shops:
+            for pid in self.products:
+                fast, slow = db.stock_kg(pid, sid), naive.stock_kg(pid, sid)
+                if not _close(fast, slow):
+                    self.fail("stock_kg", (pid, sid), fast, slow)
+
+            fast = [(p["id"], q) for p, q in db.all_stocks(sid)]
+            slow = [(p["id"], q) for p, q in naive.all_stocks(sid)]
+            if [i for i, _ in fast] != [i for i, _ in slow] or not all(_close(a, b) for (_, a), (_, b) in zip(fast, slow)):
+                self.fail("all_stocks", (sid,), fast, slow)
+
+            fast = {p["id"]: p["stock_kg"] for p in db.low_stock_products(sid)}
+            slow = {p["id"]: p["stock_kg"] for p in naive.low_stock_products(sid)}
+            seuils = {p["id"]: p["seuil_kg"] for p in naive.list_products()}
+            for pid in set(fast) ^ set(slow):
+                qty = naive.stock_kg(pid, sid)
+                if pid not in seuils or not _close(qty, seuils[pid]):
+                    self.fail("low_stock_products", (sid,), sorted(fast.items()), sorted(slow.items()))
+            if not all(_close(fast[i], slow[i]) for i in set(fast) & set(slow)):
+                self.fail("low_stock_products", (sid,), sorted(fast.items()), sorted(slow.items()))
+
+        for _ in range(3):
+            shop_id, q, date_from, date_to = self._filters()
+            mtype = self.rnd.choice((None, "IN", "OUT", "ADJ"))
+            # Deux appels : le second est servi par le cache
+            for _ in range(2):
+                fast = db.total_sales_and_cogs(mtype, shop_id, q, date_from, date_to)
+                slow = naive.total_sales_and_cogs(shop_id, q, date_from, date_to)
+                if not (_close(fast[0], slow[0]) and _close(fast[1], slow[1])):
+                    self.fail("total_sales_and_cogs", (mtype, shop_id, q, date_from, date_to), fast, slow)
+                fast = db.count_movements(mtype, shop_id, q, date_from, date_to)
+                slow = naive.count_movements(mtype, shop_id, q, date_from, date_to)
+                if fast != slow:
+                    self.fail("count_movements", (mtype, shop_id, q, date_from, date_to), fast, slow)
+
+            pid, sid, day = self.rnd.choice(self.products), self.rnd.choice(self.shops), self.rnd.choice(DAYS)
+            fast, slow = db.stock_kg_at(pid, sid, day), naive.stock_kg_at(pid, sid, day)
+            if not _close(fast, slow):
+                self.fail("stock_kg_at", (pid, sid, day), fast, slow)
+
+            args = (self.rnd.choice([None] + self.products), shop_id, date_from, date_to)
+            fast, slow = db.daily_series(*args), naive.daily_series(*args)
+            if [r[0] for r in fast] != [r[0] for r in slow] or not all(
+                    _close(a[1], b[1]) and _close(a[2], b[2]) for a, b in zip(fast, slow)):
+                self.fail("daily_series", args, fast, slow)
+
+            ranking = db.product_ranking(shop_id, date_from, date_to)
+            slow = naive.sales_by_product(shop_id, date_from, date_to)
+            fast = {r["id"]: (r["revenue"], r["volume_kg"]) for r in ranking}
+            if set(fast) != set(slow) or not all(
+                    _close(fast[i][0], slow[i][0]) and _close(fast[i][1], slow[i][1]) for i in fast):
+                self.fail("product_ranking", (shop_id, date_from, date_to), sorted(fast.items()), sorted(slow.items()))
+            for r in ranking:
+                better = [v for v, _ in slow.values() if v > r["revenue"] + TOL]
+                ties = [v for v, _ in slow.values() if abs(v - r["revenue"]) <= TOL]
+                if not len(better) + 1 <= r["revenue_rank"] <= len(better) + len(ties):
+                    self.fail("product_ranking.revenue_rank", (shop_id, date_from, date_to, r["id"]), r["revenue_rank"],
+                              len(better) + 1)
+
+        self.check_valuation()
+
+    def check_valuation(self):
+        """État incrémental (on_insert / on_update) contre un rebuild complet."""
+        db = self.db
+        rebuilt = Rebuilt(self.path, self.method)
+        try:
+            for name, read in (("movement_cost", Rebuilt.read_movement_cost), ("cost_state", Rebuilt.read_cost_state)):
+                fast, slow = read(db.cnx), read(rebuilt.cnx)
+                if not _same_rows(fast, slow):
+                    diff = {k: (fast.get(k), slow.get(k)) for k in set(fast) | set(slow) if fast.get(k) != slow.get(k)}
+                    self.fail(name, (self.method,), sorted(diff.items())[:5], "rebuild")
+
+            for sid in [None] + self.shops:
+                fast, slow = db.stock_value(shop_id=sid), rebuilt.engine.stock_value(shop_id=sid)
+                if not _close(fast, slow):
+                    self.fail("stock_value", (sid,), fast, slow)
+                day = self.rnd.choice(DAYS)
+                fast, slow = db.stock_value_at(sid, day), rebuilt.engine.stock_value_at(as_of_bound(day), shop_id=sid)
+                if not _close(fast, slow):
+                    self.fail("stock_value_at", (sid, day), fast, slow)
+            for _ in range(2):
+                args = self._filters()
+                fast, slow = db.cogs(*args), rebuilt.cogs(*args)
+                if not _close(fast, slow):
+                    self.fail("cogs", args, fast, slow)
+        finally:
+            rebuilt.close()
+
+
+def run(runs: int = 20, ops: int = 100, seed: Optional[int] = None, verbose: bool = False) -> Dict:
+    """Enchaîne `runs` scénarios ; s'arrête au premier écart (Mismatch)."""
+    base = seed if seed is not None else random.randrange(1 << 30)
+    t = time.perf_counter()
+    checks = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for i in range(runs):
+            s = Scenario(Path(tmp) / f"crosscheck-{i}.db", base + i, verbose)
+            try:
+                s.run(ops)
+            finally:
+                s.close()
+            checks += s.checks
+    return {"runs": runs, "ops": ops, "seed": base, "checks": checks, "seconds": time.perf_counter() - t}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Comparer les chemins rapides de Database aux requêtes naïves")
+    parser.add_argument("--runs", type=int, default=20, help="nombre de journaux aléatoires")
+    parser.add_argument("--ops", type=int, default=100, help="opérations par journal")
+    parser.add_argument("--seed", type=int, help="graine du premier journal (aléatoire par défaut)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="afficher chaque opération")
+    args = parser.parse_args(argv)
+    try:
+        r = run(args.runs, args.ops, args.seed, args.verbose)
+    except Mismatch as e:
+        print(f"ÉCART : {e}", file=sys.stderr)
+        return 1
+    print(f"OK : {r['runs']} journaux x {r['ops']} opérations, {r['checks']} vérifications "
+          f"(graines {r['seed']}..{r['seed'] + r['runs'] - 1}) en {r['seconds']:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
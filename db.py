@@ -1,19 +1,165 @@
+import functools
+import random
 import sqlite3
+import time
 from datetime import datetime
+from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 
+from valuation import CostEngine
+from forecast import ConsumptionTracker
+from checkpoints import StockCheckpoints, as_of_bound
+from events import EventBus, ChangeEvent
+from sync import install_change_capture
+from alerts import install_stock_alerts
+from cache import LRUCache
+
+
+# Codes entiers des types de mouvement (colonnes NumPy, encodage compact)
+TYPE_CODES = {"IN": 1, "OUT": 2, "ADJ": 3}
+
+# Tris autorisés (clé -> colonnes ORDER BY) ; chaque tri a un index correspondant
+MOVEMENT_ORDER = {
+    "date": "m.created_at {d}, m.id {d}",
+    "type": "m.type {d}, m.created_at {d}, m.id {d}",
+    "produit": "p.libelle {d}, p.id {d}, m.id {d}",
+    "boutique": "s.libelle {d}, m.id {d}",
+    "quantite": "m.qty_kg {d}, m.id {d}",
+    "prix_unit_kg": "m.unit_price_kg {d}, m.id {d}",
+    "prix_sac": "m.unit_price_sac {d}, m.id {d}",
+    "cout": "m.cost {d}, m.id {d}",
+}
+# Tri sur un libellé : la table triée mène la jointure (CROSS JOIN fixe l'ordre pour SQLite)
+_MOVEMENT_FROM = {
+    "produit": "product p CROSS JOIN movement m ON p.id = m.product_id JOIN shop s ON s.id = m.shop_id",
+    "boutique": "shop s CROSS JOIN movement m ON s.id = m.shop_id JOIN product p ON p.id = m.product_id",
+}
+_MOVEMENT_FROM_DEFAULT = "movement m JOIN product p ON p.id = m.product_id JOIN shop s ON s.id = m.shop_id"
+PRODUCT_ORDER = {
+    "id": "id {d}",
+    "sku": "sku {d}, id {d}",
+    "libelle": "libelle {d}, id {d}",
+    "poids_sac_kg": "poids_sac_kg {d}, id {d}",
+    "prix_kg": "prix_kg {d}, id {d}",
+    "prix_sac": "prix_sac {d}, id {d}",
+    "seuil_kg": "seuil_kg {d}, id {d}",
+    "actif": "actif {d}, id {d}",
+}
+
+
+# Plusieurs postes ou processus sur le même fichier : une écriture attend le verrou
+# (busy_timeout) puis, si la base reste occupée, est rejouée avec un délai croissant.
+BUSY_TIMEOUT = 5.0
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.05
+
+# Délai maximal avant de voir un produit ou une boutique modifié par un autre poste
+REFS_CHECK_SECONDS = 2.0
+
+# Tables créées par _install : une base qui n'en a pas toutes vient d'une version
+# précédente et doit être ouverte une fois en écriture avant toute lecture seule
+SCHEMA_TABLES = ("shop", "product", "movement", "app_setting", "ref_version", "change_log", "sync_flag",
+                 "stock_balance", "stock_alert", "cost_state", "movement_cost", "cost_layer",
+                 "consumption_rate", "stock_checkpoint", "stock_checkpoint_state")
+
+
+def _is_busy(e: Exception) -> bool:
+    msg = str(e).lower()
+    return isinstance(e, sqlite3.OperationalError) and ("locked" in msg or "busy" in msg)
+
+
+def _retry_on_busy(method):
+    """
+    Rejoue une méthode d'écriture quand la base est verrouillée par un autre processus.
+    La transaction en échec est annulée avant chaque nouvel essai ; une méthode appelée
+    dans une transaction ouverte par l'appelant n'est pas rejouée (son travail serait perdu).
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.cnx.in_transaction:
+            return method(self, *args, **kwargs)
+        delay = RETRY_BASE_DELAY
+        for attempt in range(RETRY_ATTEMPTS):
+            try:
+                return method(self, *args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == RETRY_ATTEMPTS - 1:
+                    raise
+                if self.cnx.in_transaction:
+                    self.cnx.rollback()
+                self.busy_retries += 1
+                # Délai aléatoire : deux processus en conflit ne se relancent pas ensemble
+                time.sleep(delay * (1 + random.random()))
+                delay *= 2
+    return wrapper
+
+
+def missing_tables(cnx: sqlite3.Connection) -> List[str]:
+    """Tables de SCHEMA_TABLES absentes de la base."""
+    tables = {r[0] for r in cnx.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    return [t for t in SCHEMA_TABLES if t not in tables]
+
+
+def _order_clause(orders: Dict[str, str], key: str, descending: bool) -> str:
+    if key not in orders:
+        raise ValueError(f"Tri non autorisé : {key}")
+    return orders[key].format(d="DESC" if descending else "ASC")
 
 
 # --- Module db.py (mis à jour) ---
 class Database:
-    def __init__(self, path: str = "provenderie.db"):
+    def __init__(self, path: str = "provenderie.db", valuation_method: str = "avg", readonly: bool = False,
+                 busy_timeout: float = BUSY_TIMEOUT):
         self.path = path
-        self.cnx = sqlite3.connect(self.path)
+        self.readonly = readonly
+        # Écritures rejouées après un verrou (voir _retry_on_busy)
+        self.busy_retries = 0
+        # Totaux et comptages filtrés, valables jusqu'à la prochaine écriture
+        self.aggregates = LRUCache()
+        # Notifications de changement (publiées après chaque commit)
+        self.events = EventBus()
+        # Carte d'identité des produits et boutiques (remplie au premier accès)
+        self._refs: Optional[Dict] = None
+        self._refs_version = None
+        self._refs_checked = 0.0
+        self.refs_check_seconds = REFS_CHECK_SECONDS
+        if readonly:
+            # Lecteur d'une base déjà initialisée (pool de lecture du mode serveur) :
+            # ni création de schéma, ni migration, utilisable depuis un autre thread.
+            uri = Path(path).absolute().as_uri() + "?mode=ro"
+            self.cnx = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=busy_timeout)
+            self.cnx.row_factory = sqlite3.Row
+            self.valuation = CostEngine(self.cnx, valuation_method, readonly=True)
+            self.consumption = ConsumptionTracker(self.cnx, readonly=True)
+            self.checkpoints = StockCheckpoints(self.cnx, readonly=True)
+            return
+        # IMMEDIATE : les transactions implicites prennent le verrou d'écriture dès leur début ;
+        # en WAL, une transaction différée qui lit puis écrit échouerait sans attendre
+        # si un autre processus a écrit entre-temps.
+        self.cnx = sqlite3.connect(self.path, timeout=busy_timeout, isolation_level="IMMEDIATE")
         self.cnx.row_factory = sqlite3.Row
         self.cnx.execute("PRAGMA foreign_keys = ON;")
         self.cnx.execute("PRAGMA journal_mode = WAL;")
+        self._install(valuation_method)
+
+    @_retry_on_busy
+    def _install(self, valuation_method: str):
+        """Schéma, migrations et tables dérivées ; rejoué si un autre poste démarre en même temps."""
         self._init_db()
         self._migrate_db()
+        # Journal des changements (origine + séquence) pour la synchronisation entre boutiques
+        install_change_capture(self.cnx)
+        # Soldes et alertes de stock bas tenus par triggers
+        install_stock_alerts(self.cnx)
+        # Valorisation des stocks (coût moyen pondéré ou FIFO), tenue à jour à chaque écriture
+        self.valuation = CostEngine(self.cnx, valuation_method)
+        # Taux de consommation journaliers (EWMA des sorties)
+        self.consumption = ConsumptionTracker(self.cnx)
+        # Points de contrôle mensuels du stock (stock à une date donnée), complétés
+        # ici jusqu'au dernier mois clos : les lectures « à la date » n'écrivent pas
+        self.checkpoints = StockCheckpoints(self.cnx)
+        self.cnx.commit()
+        self.checkpoints.build()
 
     def _init_db(self):
         cur = self.cnx.cursor()
@@ -48,6 +194,40 @@ class Database:
                 FOREIGN KEY(product_id) REFERENCES product(id),
                 FOREIGN KEY(shop_id) REFERENCES shop(id)
             );
+
+            CREATE TABLE IF NOT EXISTS app_setting (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+
+            -- Version des référentiels (produits, boutiques) : seules leurs écritures la font
+            -- avancer, quel que soit le poste ; les ventes ne rechargent pas la carte d'identité.
+            CREATE TABLE IF NOT EXISTS ref_version (
+                id INTEGER PRIMARY KEY CHECK(id = 1),
+                version INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO ref_version(id, version) VALUES (1, 0);
+            CREATE TRIGGER IF NOT EXISTS ref_version_product_insert AFTER INSERT ON product
+                BEGIN UPDATE ref_version SET version = version + 1 WHERE id = 1; END;
+            CREATE TRIGGER IF NOT EXISTS ref_version_product_update AFTER UPDATE ON product
+                BEGIN UPDATE ref_version SET version = version + 1 WHERE id = 1; END;
+            CREATE TRIGGER IF NOT EXISTS ref_version_product_delete AFTER DELETE ON product
+                BEGIN UPDATE ref_version SET version = version + 1 WHERE id = 1; END;
+            CREATE TRIGGER IF NOT EXISTS ref_version_shop_insert AFTER INSERT ON shop
+                BEGIN UPDATE ref_version SET version = version + 1 WHERE id = 1; END;
+            CREATE TRIGGER IF NOT EXISTS ref_version_shop_update AFTER UPDATE ON shop
+                BEGIN UPDATE ref_version SET version = version + 1 WHERE id = 1; END;
+            CREATE TRIGGER IF NOT EXISTS ref_version_shop_delete AFTER DELETE ON shop
+                BEGIN UPDATE ref_version SET version = version + 1 WHERE id = 1; END;
+
+            -- Index des tris et de la pagination des listes
+            CREATE INDEX IF NOT EXISTS idx_movement_created ON movement(created_at, id);
+            CREATE INDEX IF NOT EXISTS idx_movement_type ON movement(type, created_at, id);
+            CREATE INDEX IF NOT EXISTS idx_movement_product ON movement(product_id, id);
+            CREATE INDEX IF NOT EXISTS idx_movement_shop ON movement(shop_id, id);
+            CREATE INDEX IF NOT EXISTS idx_movement_qty ON movement(qty_kg, id);
+            CREATE INDEX IF NOT EXISTS idx_movement_price_kg ON movement(unit_price_kg, id);
+            CREATE INDEX IF NOT EXISTS idx_product_libelle ON product(libelle, id);
         """)
         cur.execute("INSERT OR IGNORE INTO shop(id, libelle) VALUES (1, 'Boutique Principale');")
         self.cnx.commit()
@@ -67,95 +247,361 @@ class Database:
                 print("Colonne 'cost' ajoutée à la table 'movement'.")
             except sqlite3.OperationalError:
                 pass
+        # Index des tris sur les colonnes ajoutées ci-dessus (absentes des anciennes bases)
+        self.cnx.executescript("""
+            CREATE INDEX IF NOT EXISTS idx_movement_price_sac ON movement(unit_price_sac, id);
+            CREATE INDEX IF NOT EXISTS idx_movement_cost ON movement(cost, id);
+        """)
         self.cnx.commit()
 
+    # ------------------------------------------------------------------
+    # Carte d'identité : produits et boutiques par id, SKU et libellé
+    # ------------------------------------------------------------------
+    def _ref_version(self):
+        try:
+            return self.cnx.execute("SELECT version FROM ref_version WHERE id = 1").fetchone()[0]
+        except sqlite3.OperationalError:
+            # Base pas encore migrée, ouverte en lecture seule : tout commit compte
+            return ("data_version", self.cnx.execute("PRAGMA data_version").fetchone()[0])
+
+    def _ref_maps(self) -> Dict:
+        """
+        Charge produits et boutiques une fois, servis ensuite sans requête.
+        Rechargés après une écriture de cette connexion (invalidate_refs) ; les écritures
+        des autres postes sont vues par ref_version (triggers sur product et shop),
+        relue au plus une fois toutes les `refs_check_seconds` (ou sur une clé inconnue, voir _ref).
+        """
+        now = time.monotonic()
+        if self._refs is not None and now - self._refs_checked < self.refs_check_seconds:
+            return self._refs
+        version = self._ref_version()
+        self._refs_checked = now
+        if self._refs is None or version != self._refs_version:
+            products = {r["id"]: dict(r) for r in self.cnx.execute("SELECT * FROM product ORDER BY id")}
+            shops = {r["id"]: dict(r) for r in self.cnx.execute("SELECT * FROM shop ORDER BY id")}
+            by_label: Dict[str, Dict] = {}
+            for p in products.values():
+                by_label.setdefault(p["libelle"], p)
+            self._refs = {
+                "product": products,
+                "product_sku": {p["sku"]: p for p in products.values() if p["sku"]},
+                "product_label": by_label,
+                "shop": shops,
+                "shop_label": {s["libelle"]: s for s in shops.values()},
+            }
+            self._refs_version = version
+        return self._refs
+
+    def invalidate_refs(self):
+        """À appeler après toute écriture sur product ou shop (ou à la réception d'un tel événement)."""
+        self._refs = None
+
+    def _ref(self, kind: str, key) -> Optional[Dict]:
+        row = self._ref_maps()[kind].get(key)
+        if row is None and self._refs_checked:
+            # Clé inconnue : peut-être créée par un autre poste depuis la dernière lecture
+            self._refs_checked = 0.0
+            row = self._ref_maps()[kind].get(key)
+        return dict(row) if row else None
+
     def list_shops(self) -> List[Dict]:
-        rows = self.cnx.execute("SELECT * FROM shop ORDER BY id").fetchall()
-        return [dict(r) for r in rows]
+        return [dict(s) for s in self._ref_maps()["shop"].values()]
 
     def get_shop(self, sid: int) -> Optional[Dict]:
-        r = self.cnx.execute("SELECT * FROM shop WHERE id=?", (sid,)).fetchone()
-        return dict(r) if r else None
+        return self._ref("shop", sid)
 
-    def add_shop(self, libelle: str):
-        self.cnx.execute("INSERT INTO shop(libelle) VALUES (?)", (libelle,))
-        self.cnx.commit()
+    def shop_by_label(self, libelle: str) -> Optional[Dict]:
+        return self._ref("shop_label", libelle)
+
+    def product_by_sku(self, sku: str) -> Optional[Dict]:
+        return self._ref("product_sku", sku)
+
+    def product_by_label(self, libelle: str) -> Optional[Dict]:
+        """Premier produit (plus petit id) portant ce libellé."""
+        return self._ref("product_label", libelle)
 
+    def _begin(self):
+        """Ouvre une transaction d'écriture (verrou pris tout de suite) si aucune n'est en cours."""
+        if not self.cnx.in_transaction:
+            self.cnx.execute("BEGIN IMMEDIATE")
+
+    def _publish(self, entity: str, op: str, ids, product_ids=(), shop_ids=()):
+        self.events.publish(ChangeEvent(entity, op, tuple(ids), tuple(product_ids), tuple(shop_ids)))
+
+    @_retry_on_busy
+    def add_shop(self, libelle: str) -> int:
+        try:
+            cur = self.cnx.execute("INSERT INTO shop(libelle) VALUES (?)", (libelle,))
+            self.cnx.commit()
+        except Exception:
+            self.cnx.rollback()
+            raise
+        self.invalidate_refs()
+        self._publish("shop", "insert", (cur.lastrowid,), shop_ids=(cur.lastrowid,))
+        return cur.lastrowid
+
+    @_retry_on_busy
     def rename_shop(self, shop_id: int, libelle: str):
-        self.cnx.execute("UPDATE shop SET libelle=? WHERE id=?", (libelle, shop_id))
-        self.cnx.commit()
+        try:
+            self.cnx.execute("UPDATE shop SET libelle=? WHERE id=?", (libelle, shop_id))
+            self.cnx.commit()
+        except Exception:
+            self.cnx.rollback()
+            raise
+        self.invalidate_refs()
+        self._publish("shop", "update", (shop_id,), shop_ids=(shop_id,))
 
+    @_retry_on_busy
     def delete_shop(self, shop_id: int) -> bool:
+        self._begin()
         in_use = self.cnx.execute("SELECT 1 FROM movement WHERE shop_id=? LIMIT 1", (shop_id,)).fetchone()
         if in_use:
+            self.cnx.rollback()
             return False
-        self.cnx.execute("DELETE FROM shop WHERE id=?", (shop_id,))
-        self.cnx.commit()
+        try:
+            self.cnx.execute("DELETE FROM shop WHERE id=?", (shop_id,))
+            self.cnx.commit()
+        except Exception:
+            self.cnx.rollback()
+            raise
+        self.invalidate_refs()
+        self._publish("shop", "delete", (shop_id,), shop_ids=(shop_id,))
         return True
 
-    def add_product(self, sku: Optional[str], libelle: str, poids_sac_kg: float, prix_kg: float, prix_sac: float, seuil_kg: float):
-        self.cnx.execute(
-            "INSERT INTO product(sku, libelle, poids_sac_kg, prix_kg, prix_sac, seuil_kg) VALUES (?,?,?,?,?,?)",
-            (sku, libelle, float(poids_sac_kg), float(prix_kg), float(prix_sac), float(seuil_kg))
-        )
-        self.cnx.commit()
+    @_retry_on_busy
+    def add_product(self, sku: Optional[str], libelle: str, poids_sac_kg: float, prix_kg: float, prix_sac: float, seuil_kg: float) -> int:
+        try:
+            cur = self.cnx.execute(
+                "INSERT INTO product(sku, libelle, poids_sac_kg, prix_kg, prix_sac, seuil_kg) VALUES (?,?,?,?,?,?)",
+                (sku, libelle, float(poids_sac_kg), float(prix_kg), float(prix_sac), float(seuil_kg))
+            )
+            self.cnx.commit()
+        except Exception:
+            self.cnx.rollback()
+            raise
+        self.invalidate_refs()
+        self._publish("product", "insert", (cur.lastrowid,), product_ids=(cur.lastrowid,))
+        return cur.lastrowid
 
+    @_retry_on_busy
     def update_product(self, pid: int, sku: Optional[str], libelle: str, poids_sac_kg: float, prix_kg: float, prix_sac: float, seuil_kg: float, actif: int = 1):
-        self.cnx.execute(
-            """UPDATE product SET sku=?, libelle=?, poids_sac_kg=?, prix_kg=?, prix_sac=?, seuil_kg=?, actif=?
-                WHERE id=?""",
-            (sku, libelle, float(poids_sac_kg), float(prix_kg), float(prix_sac), float(seuil_kg), int(actif), pid)
-        )
+        try:
+            self.cnx.execute(
+                """UPDATE product SET sku=?, libelle=?, poids_sac_kg=?, prix_kg=?, prix_sac=?, seuil_kg=?, actif=?
+                    WHERE id=?""",
+                (sku, libelle, float(poids_sac_kg), float(prix_kg), float(prix_sac), float(seuil_kg), int(actif), pid)
+            )
+            self.cnx.commit()
+        except Exception:
+            self.cnx.rollback()
+            raise
+        self.invalidate_refs()
+        self._publish("product", "update", (pid,), product_ids=(pid,))
+
+    @_retry_on_busy
+    def upsert_products(self, rows: List[Dict], columns) -> None:
+        """
+        Crée ou met à jour des produits par SKU (executemany, une transaction).
+        `columns` : colonnes présentes dans `rows` ; les autres gardent leur valeur
+        (ou la valeur par défaut pour un nouveau produit).
+        """
+        allowed = ("libelle", "poids_sac_kg", "prix_kg", "prix_sac", "seuil_kg", "actif")
+        cols = ["sku"] + [c for c in columns if c != "sku"]
+        for c in cols[1:]:
+            if c not in allowed:
+                raise ValueError(f"Colonne inconnue : {c}")
+        if not rows:
+            return
+        updates = cols[1:]
+        # SQLite vérifie NOT NULL avant le conflit : le libellé actuel complète les lignes sans libellé
+        skus = self._ref_maps()["product_sku"]
+        insert_cols = cols if "libelle" in cols else cols + ["libelle"]
+        values = [tuple(r.get(c) if c != "libelle" else r.get(c) or skus.get(r["sku"], {}).get("libelle")
+                        for c in insert_cols) for r in rows]
+        sql = f"INSERT INTO product({', '.join(insert_cols)}) VALUES ({', '.join('?' * len(insert_cols))}) ON CONFLICT(sku) DO "
+        if updates:
+            # Les lignes identiques ne sont pas réécrites (ni journalisées)
+            sql += "UPDATE SET " + ", ".join(f"{c}=excluded.{c}" for c in updates)
+            sql += " WHERE " + " OR ".join(f"product.{c} IS NOT excluded.{c}" for c in updates)
+        else:
+            sql += "NOTHING"
+        known = set(skus)
+        self._begin()
+        try:
+            self.cnx.executemany(sql, values)
+        except Exception:
+            self.cnx.rollback()
+            raise
         self.cnx.commit()
+        self.invalidate_refs()
+        skus = self._ref_maps()["product_sku"]
+        ids = [skus[r["sku"]]["id"] for r in rows if r["sku"] in skus]
+        op = "insert" if any(r["sku"] not in known for r in rows) else "update"
+        self._publish("product", op, ids, product_ids=ids)
 
+    @_retry_on_busy
     def archive_product(self, pid: int):
-        self.cnx.execute("UPDATE product SET actif=0 WHERE id=?", (pid,))
-        self.cnx.commit()
+        try:
+            self.cnx.execute("UPDATE product SET actif=0 WHERE id=?", (pid,))
+            self.cnx.commit()
+        except Exception:
+            self.cnx.rollback()
+            raise
+        self.invalidate_refs()
+        self._publish("product", "update", (pid,), product_ids=(pid,))
 
-    def list_products(self, q: str = "", include_inactive: bool = False) -> List[Dict]:
+    def list_products(self, q: str = "", include_inactive: bool = False, order_by: str = "libelle", descending: bool = False) -> List[Dict]:
         q = f"%{q.strip()}%" if q else "%"
         sql = "SELECT * FROM product WHERE (libelle LIKE ? OR ifnull(sku,'') LIKE ?)"
         params = [q, q]
         if not include_inactive:
             sql += " AND actif=1"
-        sql += " ORDER BY libelle"
+        sql += " ORDER BY " + _order_clause(PRODUCT_ORDER, order_by, descending)
         rows = self.cnx.execute(sql, params).fetchall()
         return [dict(r) for r in rows]
 
     def get_product(self, pid: int) -> Optional[Dict]:
-        r = self.cnx.execute("SELECT * FROM product WHERE id=?", (pid,)).fetchone()
-        return dict(r) if r else None
+        return self._ref("product", pid)
 
     # Méthode pour obtenir un mouvement par son ID
     def get_movement(self, mid: int) -> Optional[Dict]:
         r = self.cnx.execute("SELECT * FROM movement WHERE id=?", (mid,)).fetchone()
         return dict(r) if r else None
 
-    def add_movement(self, product_id: int, shop_id: int, mtype: str, qty_kg: float, unit_price_kg: Optional[float] = None, unit_price_sac: Optional[float] = None, cost: float = 0, note: str = ""):
-        self.cnx.execute(
+    def _insert_movement(self, product_id: int, shop_id: int, mtype: str, qty_kg: float, unit_price_kg: Optional[float] = None, unit_price_sac: Optional[float] = None, cost: float = 0, note: str = "", created_at: Optional[str] = None) -> int:
+        """Insère un mouvement et met à jour les tables dérivées, sans valider la transaction."""
+        created_at = created_at or datetime.now().isoformat(timespec="seconds")
+        cur = self.cnx.execute(
             "INSERT INTO movement(product_id, shop_id, type, qty_kg, unit_price_kg, unit_price_sac, cost, note, created_at) VALUES (?,?,?,?,?,?,?,?,?)",
-            (product_id, shop_id, mtype, float(qty_kg), unit_price_kg, unit_price_sac, float(cost), note, datetime.now().isoformat(timespec="seconds"))
+            (product_id, shop_id, mtype, float(qty_kg), unit_price_kg, unit_price_sac, float(cost), note, created_at)
         )
-        self.cnx.commit()
+        self.valuation.on_insert(cur.lastrowid)
+        m = {"product_id": product_id, "shop_id": shop_id, "type": mtype, "qty_kg": qty_kg, "created_at": created_at}
+        self.consumption.on_insert(m)
+        self.checkpoints.on_insert(m)
+        return cur.lastrowid
+
+    @_retry_on_busy
+    def add_movement(self, product_id: int, shop_id: int, mtype: str, qty_kg: float, unit_price_kg: Optional[float] = None, unit_price_sac: Optional[float] = None, cost: float = 0, note: str = "") -> int:
+        try:
+            mid = self._insert_movement(product_id, shop_id, mtype, qty_kg, unit_price_kg, unit_price_sac, cost, note)
+            self.cnx.commit()
+        except Exception:
+            self.cnx.rollback()
+            raise
+        self._publish("movement", "insert", (mid,), product_ids=(product_id,), shop_ids=(shop_id,))
+        return mid
+
+    @_retry_on_busy
+    def add_movements(self, items: List[Dict]) -> List:
+        """
+        Insère plusieurs mouvements (dictionnaires d'arguments de add_movement,
+        avec 'created_at' facultatif) dans une seule transaction, dans l'ordre.
+        Chaque mouvement est isolé par un savepoint : un échec n'annule pas les autres.
+        Retourne, pour chaque élément, l'id créé ou l'exception levée.
+        """
+        results: List = []
+        if not items:
+            return results
+        self._begin()
+        try:
+            for item in items:
+                self.cnx.execute("SAVEPOINT movement_item")
+                try:
+                    results.append(self._insert_movement(**item))
+                    self.cnx.execute("RELEASE movement_item")
+                except Exception as e:
+                    self.cnx.execute("ROLLBACK TO movement_item")
+                    self.cnx.execute("RELEASE movement_item")
+                    results.append(e)
+            self.cnx.commit()
+        except Exception:
+            self.cnx.rollback()
+            raise
+
+        ok = [(r, item) for r, item in zip(results, items) if not isinstance(r, Exception)]
+        if ok:
+            self._publish("movement", "insert", [r for r, _ in ok],
+                          product_ids={item["product_id"] for _, item in ok},
+                          shop_ids={item["shop_id"] for _, item in ok})
+        return results
+
+    @_retry_on_busy
+    def post_inventory_counts(self, counts: Dict[int, float], shop_id: int = 1, note: str = "Inventaire") -> List[Tuple[int, float]]:
+        """
+        Valide une session de comptage {product_id: quantité comptée (kg)}.
+        Les écarts avec le stock courant sont calculés en une seule requête, puis
+        tous les ajustements (ADJ) sont insérés dans la même transaction : la
+        session est enregistrée entière ou pas du tout. Retourne [(product_id, écart)].
+        """
+        if not counts:
+            return []
+        # Verrou d'écriture pris avant la lecture : aucun mouvement ne s'intercale
+        self._begin()
+        values = ", ".join("(?, ?)" for _ in counts)
+        params: List = [v for pid, qty in counts.items() for v in (int(pid), float(qty))]
+        try:
+            rows = self.cnx.execute(
+                f"""WITH counted(product_id, qty_kg) AS (VALUES {values})
+                    SELECT c.product_id, c.qty_kg, c.qty_kg - COALESCE(SUM(m.qty_kg), 0) AS delta
+                    FROM counted c LEFT JOIN movement m ON m.product_id = c.product_id AND m.shop_id = ?
+                    GROUP BY c.product_id, c.qty_kg""",
+                params + [shop_id]
+            ).fetchall()
+            deltas = [(r[0], r[1], r[2]) for r in rows if abs(r[2]) >= 1e-9]
+            created_at = datetime.now().isoformat(timespec="seconds")
+            ids = [
+                self._insert_movement(pid, shop_id, "ADJ", delta, created_at=created_at,
+                                      note=f"{note} -> compté {qty:.2f} kg (delta {delta:+.2f} kg)")
+                for pid, qty, delta in deltas
+            ]
+            self.cnx.commit()
+        except Exception:
+            self.cnx.rollback()
+            raise
+        if ids:
+            self._publish("movement", "insert", ids,
+                          product_ids={pid for pid, _, _ in deltas}, shop_ids=(shop_id,))
+        return [(pid, delta) for pid, _, delta in deltas]
 
     # Nouvelle méthode pour mettre à jour un mouvement
+    @_retry_on_busy
     def update_movement(self, mid: int, product_id: int, shop_id: int, mtype: str, qty_kg: float, unit_price_kg: Optional[float] = None, unit_price_sac: Optional[float] = None, cost: float = 0, note: str = ""):
-        self.cnx.execute(
-            """UPDATE movement SET product_id=?, shop_id=?, type=?, qty_kg=?, unit_price_kg=?, unit_price_sac=?, cost=?, note=?
-                WHERE id=?""",
-            (product_id, shop_id, mtype, float(qty_kg), unit_price_kg, unit_price_sac, float(cost), note, mid)
-        )
-        self.cnx.commit()
+        # L'ancienne version est lue sous le verrou d'écriture
+        self._begin()
+        old = self.get_movement(mid)
+        if old is None:
+            self.cnx.rollback()
+            return
+        try:
+            self.cnx.execute(
+                """UPDATE movement SET product_id=?, shop_id=?, type=?, qty_kg=?, unit_price_kg=?, unit_price_sac=?, cost=?, note=?
+                    WHERE id=?""",
+                (product_id, shop_id, mtype, float(qty_kg), unit_price_kg, unit_price_sac, float(cost), note, mid)
+            )
+            # Revalorisation à partir du mouvement modifié seulement
+            self.valuation.on_update(mid, (old["product_id"], old["shop_id"]))
+            new = self.get_movement(mid)
+            self.consumption.on_update(old, new)
+            self.checkpoints.on_update(old, new)
+            self.cnx.commit()
+        except Exception:
+            self.cnx.rollback()
+            raise
+        self._publish("movement", "update", (mid,),
+                      product_ids={old["product_id"], product_id}, shop_ids={old["shop_id"], shop_id})
 
-    def list_movements(self,
-                        mtype: Optional[str] = None,
-                        shop_id: Optional[int] = None,
-                        q: str = "",
-                        date_from: Optional[str] = None,
-                        date_to: Optional[str] = None) -> List[Dict]:
+    def _movement_where(self, mtype: Optional[str] = None, shop_id: Optional[int] = None, q: str = "",
+                        date_from: Optional[str] = None, date_to: Optional[str] = None,
+                        ids: Optional[List[int]] = None) -> Tuple[str, List]:
+        """Clause WHERE (et paramètres) commune à la liste et au comptage des mouvements."""
         where = []
         params: List = []
 
+        if ids is not None:
+            where.append(f"m.id IN ({','.join('?' * len(ids)) or 'NULL'})")
+            params.extend(ids)
+
         if mtype and mtype in ("IN", "OUT", "ADJ"):
             where.append("m.type = ?")
             params.append(mtype)
@@ -165,26 +611,80 @@ class Database:
         if q:
             where.append("(p.libelle LIKE ? OR ifnull(p.sku,'') LIKE ?)")
             params.extend([f"%{q.strip()}%", f"%{q.strip()}%"])
+        # Bornes sur created_at lui-même (ISO) pour profiter des index
         if date_from:
-            where.append("date(m.created_at) >= date(?)")
+            where.append("m.created_at >= date(?)")
             params.append(date_from)
         if date_to:
-            where.append("date(m.created_at) <= date(?)")
+            where.append("m.created_at < date(?, '+1 day')")
             params.append(date_to)
+        return (" WHERE " + " AND ".join(where)) if where else "", params
 
-        sql = """
-            SELECT m.*, p.libelle AS product_libelle, p.poids_sac_kg, s.libelle AS shop_libelle
-            FROM movement m
-            JOIN product p ON p.id = m.product_id
-            JOIN shop s ON s.id = m.shop_id
+    def list_movements(self,
+                        mtype: Optional[str] = None,
+                        shop_id: Optional[int] = None,
+                        q: str = "",
+                        date_from: Optional[str] = None,
+                        date_to: Optional[str] = None,
+                        ids: Optional[List[int]] = None,
+                        order_by: str = "date",
+                        descending: bool = True,
+                        limit: Optional[int] = None,
+                        offset: int = 0) -> List[Dict]:
         """
-        if where:
-            sql += " WHERE " + " AND ".join(where)
-        sql += " ORDER BY m.created_at DESC, m.id DESC"
+        Mouvements filtrés, triés selon une clé de MOVEMENT_ORDER.
+        Avec `limit`, seule la page demandée est lue (tri et découpage faits par SQLite).
+        """
+        where, params = self._movement_where(mtype, shop_id, q, date_from, date_to, ids)
+        order = _order_clause(MOVEMENT_ORDER, order_by, descending)
+        sql = "SELECT m.*, p.libelle AS product_libelle, p.poids_sac_kg, s.libelle AS shop_libelle FROM "
+        sql += _MOVEMENT_FROM.get(order_by, _MOVEMENT_FROM_DEFAULT)
+        sql += where
+        sql += " ORDER BY " + order
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([int(limit), int(offset)])
 
         rows = self.cnx.execute(sql, params).fetchall()
         return [dict(r) for r in rows]
 
+    # ------------------------------------------------------------------
+    # Agrégats mis en cache (LRU) jusqu'à la prochaine écriture
+    # ------------------------------------------------------------------
+    def _generation(self) -> Tuple[int, int]:
+        """
+        Génération des données : total_changes bouge à chaque écriture de cette
+        connexion, data_version à chaque commit d'une autre connexion.
+        """
+        return self.cnx.total_changes, self.cnx.execute("PRAGMA data_version").fetchone()[0]
+
+    def _cached(self, name: str, key: Tuple, compute):
+        return self.aggregates.get_or_compute(self._generation(), (name,) + key, compute)
+
+    @staticmethod
+    def _filter_key(mtype: Optional[str], shop_id: Optional[int], q: str,
+                    date_from: Optional[str], date_to: Optional[str]) -> Tuple:
+        """Filtres normalisés : deux combinaisons équivalentes partagent la même entrée."""
+        return (mtype if mtype in TYPE_CODES else None, int(shop_id) if shop_id else None,
+                (q or "").strip(), date_from or None, date_to or None)
+
+    def cache_stats(self) -> Dict:
+        return self.aggregates.stats()
+
+    def count_movements(self,
+                        mtype: Optional[str] = None,
+                        shop_id: Optional[int] = None,
+                        q: str = "",
+                        date_from: Optional[str] = None,
+                        date_to: Optional[str] = None) -> int:
+        key = self._filter_key(mtype, shop_id, q, date_from, date_to)
+        return self._cached("count_movements", key, lambda: self._count_movements(*key))
+
+    def _count_movements(self, mtype, shop_id, q, date_from, date_to) -> int:
+        where, params = self._movement_where(mtype, shop_id, q, date_from, date_to)
+        join = " JOIN product p ON p.id = m.product_id" if q else ""
+        return self.cnx.execute(f"SELECT COUNT(*) FROM movement m{join}{where}", params).fetchone()[0]
+
     def stock_kg(self, product_id: int, shop_id: int = 1) -> float:
         row = self.cnx.execute(
             "SELECT COALESCE(SUM(qty_kg),0) AS s FROM movement WHERE product_id=? AND shop_id=?",
@@ -192,6 +692,10 @@ class Database:
         ).fetchone()
         return float(row["s"] or 0.0)
 
+    def stock_kg_at(self, product_id: int, shop_id: int, when) -> float:
+        """Stock à une date ('YYYY-MM-DD' : fin de journée incluse) ou à un instant ISO."""
+        return self.checkpoints.stock_at(product_id, shop_id, when)
+
     def all_stocks(self, shop_id: int = 1) -> List[Tuple[Dict, float]]:
         products = self.list_products()
         result = []
@@ -205,19 +709,27 @@ class Database:
         return float(row["s"] or 0.0)
 
     def low_stock_products(self, shop_id: int = 1) -> List[Dict]:
-        items = []
-        for p, qty in self.all_stocks(shop_id=shop_id):
-            if qty <= p.get("seuil_kg", 0):
-                d = dict(p)
-                d["stock_kg"] = qty
-                items.append(d)
-        return items
+        """Produits actifs au niveau ou sous leur seuil, lus dans stock_alert (tenue par triggers)."""
+        rows = self.cnx.execute(
+            """SELECT p.*, a.stock_kg FROM stock_alert a JOIN product p ON p.id = a.product_id
+                WHERE a.shop_id=? ORDER BY p.libelle, p.id""",
+            (shop_id,)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def alert_count(self, shop_id: int = 1) -> int:
+        return self.cnx.execute("SELECT COUNT(*) FROM stock_alert WHERE shop_id=?", (shop_id,)).fetchone()[0]
 
     def total_sales_and_cogs(self, mtype: Optional[str] = None, shop_id: Optional[int] = None, q: str = "", date_from: Optional[str] = None, date_to: Optional[str] = None) -> Tuple[float, float]:
         """
         Calcule les ventes (IN) et les coûts des ventes (OUT) pour les mouvements.
         Les mouvements de type ADJ sont exclus.
         """
+        # Le type filtré n'intervient pas dans ces totaux : il ne fait pas partie de la clé
+        key = self._filter_key(None, shop_id, q, date_from, date_to)
+        return self._cached("total_sales_and_cogs", key, lambda: self._total_sales_and_cogs(*key[1:]))
+
+    def _total_sales_and_cogs(self, shop_id, q, date_from, date_to) -> Tuple[float, float]:
         where = []
         params = []
         if shop_id:
@@ -245,3 +757,146 @@ class Database:
 
         row = self.cnx.execute(base_sql, params).fetchone()
         return float(row["total_sales"] or 0), float(row["total_cogs"] or 0)
+
+    def ledger_rows(self, shop_id: Optional[int] = None, q: str = "", date_to: Optional[str] = None) -> List[Tuple]:
+        """
+        Retourne le grand livre filtré sous forme de tuples
+        (id, product_id, shop_id, type, qty_kg, cost, jour), triés par id.
+        Pas de filtre de début : les mouvements antérieurs servent au stock d'ouverture.
+        """
+        where = []
+        params: List = []
+        if shop_id:
+            where.append("m.shop_id = ?")
+            params.append(shop_id)
+        if q:
+            where.append("(p.libelle LIKE ? OR ifnull(p.sku,'') LIKE ?)")
+            params.extend([f"%{q.strip()}%", f"%{q.strip()}%"])
+        if date_to:
+            where.append("date(m.created_at) <= date(?)")
+            params.append(date_to)
+
+        sql = """
+            SELECT m.id, m.product_id, m.shop_id, m.type, m.qty_kg, COALESCE(m.cost, 0), substr(m.created_at, 1, 10)
+            FROM movement m
+            JOIN product p ON p.id = m.product_id
+        """
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY m.id"
+        return [tuple(r) for r in self.cnx.execute(sql, params).fetchall()]
+
+    def daily_series(self, product_id: Optional[int] = None, shop_id: Optional[int] = 1,
+                     date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[Tuple[str, float, float]]:
+        """
+        Une ligne (jour, ventes du jour, stock en fin de jour en kg) par jour ayant des mouvements.
+        Avec `date_from`, le dernier jour antérieur est aussi rendu : il porte le stock d'ouverture.
+        Un seul parcours, stock cumulé par fenêtre SQL ; mis en cache jusqu'à la prochaine écriture.
+        """
+        key = (int(product_id) if product_id else None, int(shop_id) if shop_id else None, date_from or None, date_to or None)
+        return self._cached("daily_series", key, lambda: self._daily_series(*key))
+
+    def _daily_series(self, product_id, shop_id, date_from, date_to) -> List[Tuple[str, float, float]]:
+        where = []
+        params: List = []
+        if product_id:
+            where.append("product_id = ?")
+            params.append(product_id)
+        if shop_id:
+            where.append("shop_id = ?")
+            params.append(shop_id)
+        if date_to:
+            where.append("created_at < date(?, '+1 day')")
+            params.append(date_to)
+        sql = f"""
+            WITH d AS (
+                SELECT substr(created_at, 1, 10) AS day, SUM(qty_kg) AS net,
+                       SUM(CASE WHEN type = 'OUT' THEN COALESCE(cost, 0) ELSE 0 END) AS sales
+                FROM movement{(" WHERE " + " AND ".join(where)) if where else ""}
+                GROUP BY day
+            ), s AS (
+                SELECT day, sales, SUM(net) OVER (ORDER BY day) AS stock_kg FROM d
+            )
+            SELECT day, sales, stock_kg FROM s
+        """
+        if date_from:
+            sql += " WHERE day >= COALESCE((SELECT MAX(day) FROM s WHERE day < date(?)), date(?))"
+            params.extend([date_from, date_from])
+        sql += " ORDER BY day"
+        return [tuple(r) for r in self.cnx.execute(sql, params).fetchall()]
+
+    def consumption_rates(self, shop_id: int = 1) -> Dict[int, float]:
+        """Consommation journalière estimée (kg/jour) par produit pour une boutique."""
+        return self.consumption.rates(shop_id=shop_id)
+
+    def stock_value(self, shop_id: Optional[int] = None, product_id: Optional[int] = None) -> float:
+        """Valeur du stock selon la méthode de valorisation (lecture directe de l'état courant)."""
+        return self.valuation.stock_value(shop_id=shop_id, product_id=product_id)
+
+    def stock_value_at(self, shop_id: Optional[int], when) -> float:
+        """Valeur du stock à une date ('YYYY-MM-DD' : fin de journée incluse) ou à un instant ISO."""
+        return self.valuation.stock_value_at(as_of_bound(when), shop_id=shop_id)
+
+    def cogs(self, shop_id: Optional[int] = None, q: str = "", date_from: Optional[str] = None, date_to: Optional[str] = None) -> float:
+        """Coût réel des sorties (OUT) valorisées, pour les filtres donnés."""
+        key = self._filter_key(None, shop_id, q, date_from, date_to)[1:]
+        return self._cached("cogs", key, lambda: self._cogs(*key))
+
+    def _cogs(self, shop_id, q, date_from, date_to) -> float:
+        where = ["m.type = 'OUT'"]
+        params: List = []
+        if shop_id:
+            where.append("m.shop_id = ?")
+            params.append(shop_id)
+        if q:
+            where.append("(p.libelle LIKE ? OR ifnull(p.sku,'') LIKE ?)")
+            params.extend([f"%{q.strip()}%", f"%{q.strip()}%"])
+        if date_from:
+            where.append("date(m.created_at) >= date(?)")
+            params.append(date_from)
+        if date_to:
+            where.append("date(m.created_at) <= date(?)")
+            params.append(date_to)
+
+        sql = """
+            SELECT COALESCE(SUM(-mc.value_delta), 0) AS s
+            FROM movement_cost mc
+            JOIN movement m ON m.id = mc.movement_id
+            JOIN product p ON p.id = m.product_id
+            WHERE """ + " AND ".join(where)
+        row = self.cnx.execute(sql, params).fetchone()
+        return float(row["s"] or 0.0)
+
+    def product_ranking(self, shop_id: Optional[int] = None, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                        a_share: float = 0.8, b_share: float = 0.95) -> List[Dict]:
+        """
+        Classement des produits vendus (OUT) sur la période : rang par chiffre d'affaires
+        et par volume, part et part cumulée du CA, classe ABC.
+        Un produit est en A tant que le cumul des produits mieux classés reste sous
+        `a_share` du CA, en B sous `b_share`, en C au-delà. Une seule requête (fenêtres SQL).
+        """
+        where, params = self._movement_where("OUT", shop_id, "", date_from, date_to)
+        sql = f"""
+            WITH sales AS (
+                SELECT m.product_id, SUM(COALESCE(m.cost, 0)) AS revenue, SUM(-m.qty_kg) AS volume_kg, COUNT(*) AS movements
+                FROM movement m{where}
+                GROUP BY m.product_id
+            ), ranked AS (
+                SELECT s.*,
+                       RANK() OVER (ORDER BY revenue DESC) AS revenue_rank,
+                       RANK() OVER (ORDER BY volume_kg DESC) AS volume_rank,
+                       SUM(revenue) OVER (ORDER BY revenue DESC, product_id ROWS UNBOUNDED PRECEDING) AS cum_revenue,
+                       NULLIF(SUM(revenue) OVER (), 0) AS total_revenue
+                FROM sales s
+            )
+            SELECT p.id, p.sku, p.libelle, r.revenue, r.volume_kg, r.movements, r.revenue_rank, r.volume_rank,
+                   COALESCE(r.revenue / r.total_revenue, 0) AS share,
+                   COALESCE(r.cum_revenue / r.total_revenue, 0) AS cum_share,
+                   CASE WHEN COALESCE((r.cum_revenue - r.revenue) / r.total_revenue, 0) < ? THEN 'A'
+                        WHEN (r.cum_revenue - r.revenue) / r.total_revenue < ? THEN 'B'
+                        ELSE 'C' END AS abc
+            FROM ranked r JOIN product p ON p.id = r.product_id
+            ORDER BY r.revenue_rank, r.cum_revenue
+        """
+        rows = self.cnx.execute(sql, params + [a_share, b_share]).fetchall()
+        return [dict(r) for r in rows]
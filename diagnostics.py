@@ -0,0 +1,317 @@
+import argparse
+import gc
+import sys
+import tkinter
+import tracemalloc
+from typing import Dict, List, Optional
+
+
+# --- Module diagnostics.py ---
+# Suivi des fuites de widgets et de mémoire au fil de la navigation.
+#
+# Mode diagnostic de l'application : PROVENDERIE_DIAG=1 python main.py
+# Après chaque navigation (App.show_page), on relève :
+#   - le nombre de widgets vivants (fenêtres secondaires comprises) ;
+#   - le nombre de variables Tk (StringVar...) encore déclarées côté Tcl ;
+#   - le nombre de commandes Tcl (chaque rappel lié à un widget en crée une) ;
+#   - le nombre d'abonnés au bus d'événements et à la file d'écriture ;
+#   - la mémoire Python allouée (tracemalloc), avec un instantané par page.
+# À la fermeture, le rapport donne la croissance par classe de page : une page
+# revisitée ne doit rien laisser derrière elle.
+#
+# Contrôle de non-régression (sans connexion, sur une copie de la base) :
+#   python diagnostics.py copie.db --cycles 10 --rebuild
+# parcourt toutes les pages et ouvre/ferme les dialogues `cycles` fois, puis
+# échoue (code 1) si un compteur augmente encore après l'échauffement.
+# Sans écran (serveur, intégration continue), `python diagnostics.py --counters`
+# vérifie seulement que les compteurs d'abonnés voient bien le bus et la file ;
+# le parcours complet est rejoué par tests/test_ui_leaks.py dès qu'un écran existe.
+
+DIAG_ENV = "PROVENDERIE_DIAG"
+
+# Compteurs qui doivent revenir exactement au même niveau à chaque passage
+COUNTERS = ("widgets", "tk_vars", "tcl_commands", "subscribers")
+
+
+def count_widgets(root) -> int:
+    todo, n = [root], 0
+    while todo:
+        w = todo.pop()
+        n += 1
+        todo.extend(w.winfo_children())
+    return n
+
+
+def count_tk_vars(root) -> int:
+    """Variables Tk vivantes : tkinter les nomme PY_VARn tant qu'elles ne sont pas libérées."""
+    return sum(1 for name in root.tk.call("info", "globals") if str(name).startswith("PY_VAR"))
+
+
+def count_tcl_commands(root) -> int:
+    return len(root.tk.call("info", "commands"))
+
+
+def count_subscribers(app) -> int:
+    """Abonnés au bus d'événements (EventBus._subscribers) et à la file d'écriture (WriteQueue.listeners)."""
+    n = len(app.db.events._subscribers)
+    writes = getattr(app, "writes", None)
+    if writes is not None:
+        n += len(writes.listeners)
+    return n
+
+
+def zombie_widgets() -> int:
+    """Objets widget encore référencés en Python alors que la fenêtre Tk a été détruite."""
+    n = 0
+    for obj in gc.get_objects():
+        if isinstance(obj, tkinter.Misc) and not isinstance(obj, tkinter.Tk):
+            try:
+                if not obj.winfo_exists():
+                    n += 1
+            except tkinter.TclError:
+                n += 1
+    return n
+
+
+class LeakTracker:
+    """Relevés après chaque navigation, regroupés par classe de page."""
+
+    def __init__(self, app, frames: int = 8, deep: bool = False):
+        self.app = app
+        # deep : compte aussi les widgets détruits encore référencés (parcours du ramasse-miettes, lent)
+        self.deep = deep
+        self.samples: Dict[str, List[Dict]] = {}
+        self.snapshots: Dict[str, List[tracemalloc.Snapshot]] = {}
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def sample(self) -> Dict:
+        gc.collect()
+        root = self.app
+        s = {
+            "widgets": count_widgets(root),
+            "tk_vars": count_tk_vars(root),
+            "tcl_commands": count_tcl_commands(root),
+            "subscribers": count_subscribers(self.app),
+            "memory_kib": tracemalloc.get_traced_memory()[0] / 1024,
+        }
+        if self.deep:
+            s["zombies"] = zombie_widgets()
+        return s
+
+    def record(self, label: str) -> Dict:
+        """Relevé après l'affichage de `label` (nom de la classe de page ou du dialogue)."""
+        self.app.update_idletasks()
+        s = self.sample()
+        self.samples.setdefault(label, []).append(s)
+        snaps = self.snapshots.setdefault(label, [])
+        # Premier et dernier instantanés seulement : la comparaison suffit au rapport
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        if len(snaps) < 2:
+            snaps.append(snap)
+        else:
+            snaps[1] = snap
+        return s
+
+    def growth(self, warmup: int = 1) -> Dict[str, Dict]:
+        """
+        Croissance moyenne par visite de chaque page, après `warmup` visites
+        (la première construit la page et remplit les caches).
+        """
+        out = {}
+        for label, samples in self.samples.items():
+            usable = samples[warmup:]
+            if len(usable) < 2:
+                continue
+            first, last = usable[0], usable[-1]
+            visits = len(usable) - 1
+            out[label] = {"visits": len(samples)}
+            out[label].update({k: (last[k] - first[k]) / visits for k in first})
+        return out
+
+    def top_allocations(self, label: str, limit: int = 5) -> List[str]:
+        snaps = self.snapshots.get(label, [])
+        if len(snaps) < 2:
+            return []
+        stats = snaps[1].compare_to(snaps[0], "lineno")
+        return [str(st) for st in stats[:limit] if st.size_diff > 0]
+
+    def report(self, warmup: int = 1, file=None) -> str:
+        lines = [f"{'Page':<22} {'visites':>7} " + " ".join(f"{k:>13}" for k in COUNTERS) + f" {'mémoire KiB':>12}"]
+        for label, g in sorted(self.growth(warmup).items()):
+            lines.append(f"{label:<22} {g['visits']:>7} " + " ".join(f"{g[k]:>+13.1f}" for k in COUNTERS)
+                         + f" {g['memory_kib']:>+12.1f}" + (f"  zombies {g['zombies']:+.1f}" if "zombies" in g else ""))
+            for st in self.top_allocations(label, 3):
+                lines.append(f"    {st}")
+        text = "Croissance moyenne par visite (après échauffement)\n" + "\n".join(lines)
+        if file is not None:
+            print(text, file=file)
+        return text
+
+    def failures(self, warmup: int = 1, max_kib: float = 64.0) -> List[str]:
+        """Compteurs qui augmentent encore d'une visite à l'autre."""
+        out = []
+        for label, g in self.growth(warmup).items():
+            for k in COUNTERS + ("zombies",):
+                if g.get(k, 0) > 0:
+                    out.append(f"{label} : {k} {g[k]:+.1f} par visite")
+            if g["memory_kib"] > max_kib:
+                out.append(f"{label} : mémoire {g['memory_kib']:+.1f} KiB par visite")
+        return out
+
+
+def install(app) -> Optional[LeakTracker]:
+    """Branche le suivi sur App.show_page si le mode diagnostic est demandé."""
+    import os
+    if not os.environ.get(DIAG_ENV):
+        return None
+    tracker = LeakTracker(app)
+    show_page = app.show_page
+
+    def traced_show_page(key: str):
+        show_page(key)
+        page = app.pages.get(key)
+        tracker.record(type(page).__name__)
+
+    app.show_page = traced_show_page
+    return tracker
+
+
+# ----------------------------------------------------------------------
+# Contrôle de non-régression
+
+def navigation_check(db_path: str, cycles: int = 10, rebuild: bool = False, dialogs: bool = True,
+                     warmup: int = 2, deep: bool = False) -> LeakTracker:
+    """Parcourt les pages (et les dialogues) `cycles` fois dans une fenêtre réelle."""
+    from db import Database
+    from main import App
+    from ui.dialogs import ProductDialog, MovementDialog, CatalogueImportDialog, LoginDialog
+
+    class CheckApp(App):
+        def _open_database(self):
+            return Database(db_path)
+
+        def start_login(self):
+            pass
+
+        def _replay_rejected(self):
+            # Le fichier de reprise appartient à la vraie base, pas à la copie contrôlée
+            pass
+
+    app = CheckApp()
+    try:
+        app.handle_login("a")
+        tracker = LeakTracker(app, deep=deep)
+        keys = [k for k in app.nav_buttons]
+        for _ in range(cycles):
+            for key in keys:
+                app.show_page(key)
+                page = app.pages[key]
+                if rebuild and hasattr(page, "build"):
+                    # Même chemin qu'un changement de boutique : la page est reconstruite
+                    page.build()
+                    page.refresh()
+                app.update()
+                tracker.record(type(page).__name__)
+            if dialogs:
+                ProductDialog(app).win.destroy()
+                app.update()
+                tracker.record("ProductDialog")
+                MovementDialog(app).destroy()
+                app.update()
+                tracker.record("MovementDialog")
+                empty = {"columns": [], "new": 0, "changed": 0, "unchanged": 0, "errors": [], "rows": []}
+                CatalogueImportDialog(app, empty, "catalogue.csv").destroy()
+                app.update()
+                tracker.record("CatalogueImportDialog")
+                LoginDialog(app, on_login=lambda role: None).destroy()
+                app.update()
+                tracker.record("LoginDialog")
+        return tracker
+    finally:
+        app.writes.close()
+        app.destroy()
+
+
+def counter_check(cycles: int = 5) -> List[str]:
+    """
+    Contrôle sans fenêtre des compteurs d'abonnés : des « pages » factices s'abonnent au
+    bus et à la file d'écriture puis se désabonnent, comme BasePage et MovementsPage.
+    Le niveau doit revenir au départ, et un abonnement oublié doit être compté.
+    """
+    import tempfile
+    from types import SimpleNamespace
+    from db import Database
+    from events import ChangeEvent
+    from writequeue import WriteQueue
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(f"{tmp}/diagnostics.db")
+        app = SimpleNamespace(db=db, writes=WriteQueue(db))
+        try:
+            base = count_subscribers(app)
+            calls = []
+            for i in range(cycles):
+                unsubscribe = [
+                    db.events.subscribe(lambda e: calls.append(e), ("movement",)),
+                    app.writes.subscribe(lambda kind, entries: calls.append(kind)),
+                ]
+                if count_subscribers(app) != base + 2:
+                    failures.append(f"cycle {i} : {count_subscribers(app) - base} abonné(s) compté(s) au lieu de 2")
+                for u in unsubscribe:
+                    u()
+            if count_subscribers(app) != base:
+                failures.append(f"après désabonnement : {count_subscribers(app) - base:+d} abonné(s)")
+            db.events.publish(ChangeEvent("movement", "insert", (1,)))
+            app.writes.submit(1, 1, "IN", 1.0)
+            app.writes.flush()
+            if calls:
+                failures.append(f"{len(calls)} notification(s) reçue(s) par des abonnés retirés")
+
+            # Témoin : un abonnement oublié de chaque côté doit faire monter le compteur de 2
+            db.events.subscribe(lambda e: None)
+            app.writes.subscribe(lambda kind, entries: None)
+            if count_subscribers(app) != base + 2:
+                failures.append(f"abonnements oubliés : {count_subscribers(app) - base:+d} compté(s) au lieu de +2")
+        finally:
+            app.writes.close()
+            db.cnx.close()
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Contrôle des fuites de widgets et de mémoire à la navigation")
+    parser.add_argument("db", nargs="?", help="copie de la base à utiliser (elle n'est pas modifiée par la navigation)")
+    parser.add_argument("--counters", action="store_true", help="seulement le contrôle des compteurs, sans fenêtre")
+    parser.add_argument("--cycles", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=2, help="visites ignorées avant la mesure")
+    parser.add_argument("--rebuild", action="store_true", help="reconstruire chaque page à chaque visite")
+    parser.add_argument("--no-dialogs", action="store_true")
+    parser.add_argument("--deep", action="store_true", help="compter aussi les widgets détruits encore référencés")
+    parser.add_argument("--max-kib", type=float, default=64.0, help="croissance mémoire tolérée par visite")
+    args = parser.parse_args(argv)
+
+    failures = counter_check()
+    for f in failures:
+        print(f"COMPTEURS {f}")
+    if args.counters or not args.db:
+        print("OK" if not failures else f"{len(failures)} erreur(s) de comptage")
+        return 1 if failures else 0
+    if failures:
+        return 1
+
+    tracker = navigation_check(args.db, args.cycles, args.rebuild, not args.no_dialogs, args.warmup, args.deep)
+    tracker.report(args.warmup, file=sys.stdout)
+    failures = tracker.failures(args.warmup, args.max_kib)
+    for f in failures:
+        print(f"FUITE {f}")
+    print("OK" if not failures else f"{len(failures)} fuite(s) détectée(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import traceback
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+
+# --- Module events.py ---
+# Bus de notification des changements : Database publie un ChangeEvent
+# après chaque commit, les pages s'abonnent aux entités qui les concernent.
+
+class ChangeEvent(NamedTuple):
+    """Changement validé en base."""
+    entity: str                      # 'product', 'shop' ou 'movement'
+    op: str                          # 'insert', 'update' ou 'delete'
+    ids: Tuple[int, ...]             # identifiants des lignes de l'entité
+    product_ids: Tuple[int, ...] = ()  # produits dont le stock ou la fiche est touché
+    shop_ids: Tuple[int, ...] = ()     # boutiques concernées
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers: List[Tuple[Callable[[ChangeEvent], None], Optional[frozenset]]] = []
+
+    def subscribe(self, callback: Callable[[ChangeEvent], None], entities: Optional[Iterable[str]] = None) -> Callable[[], None]:
+        """
+        Abonne `callback` aux événements des entités données (toutes si None).
+        Retourne une fonction de désabonnement.
+        """
+        entry = (callback, frozenset(entities) if entities is not None else None)
+        self._subscribers.append(entry)
+
+        def unsubscribe():
+            if entry in self._subscribers:
+                self._subscribers.remove(entry)
+        return unsubscribe
+
+    def publish(self, event: ChangeEvent):
+        # Copie : un abonné peut se désabonner pendant la diffusion
+        for callback, entities in list(self._subscribers):
+            if entities is not None and event.entity not in entities:
+                continue
+            try:
+                callback(event)
+            except Exception:
+                # Les données sont déjà validées : une page en erreur ne doit pas bloquer les autres
+                traceback.print_exc()
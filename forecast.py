@@ -0,0 +1,136 @@
+import sqlite3
+from datetime import date, timedelta
+from typing import Dict, Optional
+
+
+# --- Module forecast.py ---
+# Taux de consommation journalier par produit/boutique, en moyenne mobile
+# exponentielle (EWMA) des sorties (OUT) par jour.
+#
+# Pour chaque couple on conserve :
+#   - rate      : EWMA arrêtée à la veille de `last_day`
+#   - last_day  : dernier jour ayant reçu une sortie (ordinal)
+#   - pending   : total des sorties de `last_day` (jour pas encore intégré)
+#   - first_day : premier jour observé (correction du biais de démarrage)
+#
+# L'EWMA étant linéaire, une sortie ajoutée, retirée ou modifiée se répercute
+# en O(1) : sa contribution est a * (1 - a)^(écart en jours).
+
+SPAN_DAYS = 30
+ALPHA = 2 / (SPAN_DAYS + 1)
+
+# Couverture visée par la suggestion de réapprovisionnement (en jours, en plus du seuil)
+REORDER_COVER_DAYS = 30
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS consumption_rate (
+        product_id INTEGER NOT NULL,
+        shop_id INTEGER NOT NULL,
+        rate REAL NOT NULL DEFAULT 0,
+        pending REAL NOT NULL DEFAULT 0,
+        last_day INTEGER NOT NULL,
+        first_day INTEGER NOT NULL,
+        PRIMARY KEY (product_id, shop_id)
+    );
+"""
+
+
+def day_of(created_at: str) -> int:
+    """Jour ordinal d'une date ISO ('YYYY-MM-DD...')."""
+    return date.fromisoformat(created_at[:10]).toordinal()
+
+
+class ConsumptionTracker:
+    """Tient à jour les taux de consommation dans la transaction d'écriture de `Database`."""
+
+    def __init__(self, cnx: sqlite3.Connection, alpha: float = ALPHA, readonly: bool = False):
+        self.cnx = cnx
+        self.alpha = alpha
+        if readonly:
+            return
+        self.cnx.executescript(SCHEMA)
+        row = self.cnx.execute("SELECT value FROM app_setting WHERE key='consumption_alpha'").fetchone()
+        if row is None or float(row[0]) != alpha:
+            self.rebuild()
+
+    def on_insert(self, m: Dict):
+        if m["type"] == "OUT":
+            self._add(m["product_id"], m["shop_id"], day_of(m["created_at"]), -float(m["qty_kg"]))
+
+    def on_update(self, old: Dict, new: Dict):
+        """Retire la contribution de l'ancienne version et ajoute celle de la nouvelle."""
+        if old["type"] == "OUT":
+            self._add(old["product_id"], old["shop_id"], day_of(old["created_at"]), float(old["qty_kg"]))
+        self.on_insert(new)
+
+    def rebuild(self):
+        self.cnx.execute("DELETE FROM consumption_rate")
+        rows = self.cnx.execute(
+            "SELECT product_id, shop_id, type, qty_kg, created_at FROM movement WHERE type='OUT' ORDER BY created_at, id"
+        ).fetchall()
+        for m in rows:
+            self.on_insert(m)
+        self.cnx.execute(
+            "INSERT OR REPLACE INTO app_setting(key, value) VALUES ('consumption_alpha', ?)", (repr(self.alpha),)
+        )
+        self.cnx.commit()
+
+    def _add(self, product_id: int, shop_id: int, day: int, qty: float):
+        """Ajoute `qty` kg de consommation au jour `day`."""
+        a = self.alpha
+        r = self.cnx.execute(
+            "SELECT rate, pending, last_day, first_day FROM consumption_rate WHERE product_id=? AND shop_id=?",
+            (product_id, shop_id)
+        ).fetchone()
+        if r is None:
+            rate, pending, last_day, first_day = 0.0, 0.0, day, day
+        else:
+            rate, pending, last_day, first_day = r["rate"], r["pending"], r["last_day"], r["first_day"]
+
+        if day > last_day:
+            # Intègre le jour en attente puis les jours sans sortie
+            rate = (a * pending + (1 - a) * rate) * (1 - a) ** (day - last_day - 1)
+            pending, last_day = 0.0, day
+        if day == last_day:
+            pending += qty
+        else:
+            rate += a * (1 - a) ** (last_day - 1 - day) * qty
+        first_day = min(first_day, day)
+
+        self.cnx.execute(
+            """INSERT OR REPLACE INTO consumption_rate(product_id, shop_id, rate, pending, last_day, first_day)
+                VALUES (?,?,?,?,?,?)""",
+            (product_id, shop_id, rate, pending, last_day, first_day)
+        )
+
+    def rates(self, shop_id: int = 1, today: Optional[date] = None) -> Dict[int, float]:
+        """Taux journalier (kg/jour) par produit pour une boutique, évalué à la date du jour."""
+        a = self.alpha
+        t = (today or date.today()).toordinal()
+        result = {}
+        for r in self.cnx.execute(
+            "SELECT product_id, rate, pending, last_day, first_day FROM consumption_rate WHERE shop_id=?", (shop_id,)
+        ).fetchall():
+            value = (a * r["pending"] + (1 - a) * r["rate"]) * (1 - a) ** max(0, t - r["last_day"])
+            # Correction du biais de démarrage (historique plus court que la fenêtre)
+            days = max(1, max(t, r["last_day"]) - r["first_day"] + 1)
+            norm = 1 - (1 - a) ** days
+            result[r["product_id"]] = max(0.0, value / norm) if norm > 0 else 0.0
+        return result
+
+
+def cover(stock_kg: float, rate: float, seuil_kg: float = 0.0, today: Optional[date] = None) -> Dict:
+    """
+    Jours de couverture, date de rupture projetée et quantité à commander
+    pour un stock et un taux de consommation journalier donnés.
+    """
+    today = today or date.today()
+    if rate <= 0:
+        return {"rate": 0.0, "days_cover": None, "stockout": None, "reorder_kg": max(0.0, seuil_kg - stock_kg)}
+    days = max(0.0, stock_kg / rate)
+    return {
+        "rate": rate,
+        "days_cover": days,
+        "stockout": (today + timedelta(days=int(days))).isoformat(),
+        "reorder_kg": max(0.0, rate * REORDER_COVER_DAYS + seuil_kg - stock_kg),
+    }
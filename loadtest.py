@@ -0,0 +1,163 @@
+import argparse
+import multiprocessing as mp
+import random
+import sqlite3
+import sys
+import time
+from collections import Counter
+from typing import Dict, List
+
+
+# --- Module loadtest.py ---
+# Essai de charge : N processus écrivains et M lecteurs sur un même fichier,
+# comme N postes de comptoir sur provenderie.db partagé.
+#
+#   python loadtest.py copie.db --writers 4 --readers 4 --seconds 20
+#
+# Les écrivains enregistrent des sorties (add_movement, ou add_movements par lots
+# avec --batch) ; les lecteurs enchaînent les requêtes des pages (stock, liste,
+# totaux). Le rapport donne le débit, la latence des écritures (attente du verrou
+# comprise), les écritures rejouées et les erreurs par message.
+# À lancer sur une copie : des mouvements de test sont ajoutés à la base.
+
+NOTE = "essai de charge"
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def _writer(path: str, deadline: float, batch: int, busy_timeout: float, seed: int, out):
+    from db import Database
+    rnd = random.Random(seed)
+    db = Database(path, busy_timeout=busy_timeout)
+    products = [p["id"] for p in db.list_products()]
+    shops = [s["id"] for s in db.list_shops()]
+    latencies, errors, ops = [], Counter(), 0
+    while time.time() < deadline:
+        items = [{"product_id": rnd.choice(products), "shop_id": rnd.choice(shops), "mtype": "OUT",
+                  "qty_kg": -rnd.uniform(1, 50), "cost": rnd.uniform(100, 5000), "note": NOTE}
+                 for _ in range(batch)]
+        t = time.perf_counter()
+        try:
+            if batch == 1:
+                db.add_movement(**items[0])
+            else:
+                results = db.add_movements(items)
+                errors.update(type(r).__name__ + ": " + str(r) for r in results if isinstance(r, Exception))
+            ops += batch
+        except sqlite3.Error as e:
+            errors[type(e).__name__ + ": " + str(e)] += 1
+            if db.cnx.in_transaction:
+                db.cnx.rollback()
+        latencies.append(time.perf_counter() - t)
+    out.put({"role": "writer", "ops": ops, "latencies": latencies, "errors": dict(errors), "retries": db.busy_retries})
+
+
+def _reader(path: str, deadline: float, busy_timeout: float, seed: int, out):
+    from db import Database
+    rnd = random.Random(seed)
+    db = Database(path, readonly=True, busy_timeout=busy_timeout)
+    products = [p["id"] for p in db.list_products()]
+    queries = [
+        lambda: db.stock_kg(rnd.choice(products), 1),
+        lambda: db.all_stocks(1),
+        lambda: db.list_movements(limit=500),
+        lambda: db.count_movements(),
+        lambda: db.total_sales_and_cogs(),
+        lambda: db.low_stock_products(1),
+    ]
+    latencies, errors, ops = [], Counter(), 0
+    while time.time() < deadline:
+        t = time.perf_counter()
+        try:
+            rnd.choice(queries)()
+            ops += 1
+        except sqlite3.Error as e:
+            errors[type(e).__name__ + ": " + str(e)] += 1
+        latencies.append(time.perf_counter() - t)
+    out.put({"role": "reader", "ops": ops, "latencies": latencies, "errors": dict(errors), "retries": 0})
+
+
+def _worker(role: str, target, args, out):
+    """Un processus qui échoue (ouverture impossible...) rend quand même un résultat."""
+    try:
+        target(*args, out)
+    except Exception as e:
+        out.put({"role": role, "ops": 0, "latencies": [], "errors": {type(e).__name__ + ": " + str(e): 1}, "retries": 0})
+
+
+def run(path: str, writers: int = 4, readers: int = 4, seconds: float = 10.0, batch: int = 1,
+        busy_timeout: float = 5.0) -> Dict[str, Dict]:
+    """Lance les processus, attend la fin et agrège les résultats par rôle."""
+    from db import Database
+    # Schéma, migrations et tables dérivées créés une fois avant la charge
+    db = Database(path)
+    if not db.list_products():
+        db.add_product("LOAD-1", "Produit essai de charge", 50, 300, 15000, 0)
+    db.cnx.close()
+
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    start = time.time() + 1.0  # laisse les processus s'ouvrir avant de mesurer
+    deadline = start + seconds
+    procs = [ctx.Process(target=_worker, args=("writer", _writer, (path, deadline, batch, busy_timeout, i), out))
+             for i in range(writers)]
+    procs += [ctx.Process(target=_worker, args=("reader", _reader, (path, deadline, busy_timeout, 1000 + i), out))
+              for i in range(readers)]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    report = {}
+    for role in ("writer", "reader"):
+        rs = [r for r in results if r["role"] == role]
+        if not rs:
+            continue
+        lat = [x for r in rs for x in r["latencies"]]
+        errors = Counter()
+        for r in rs:
+            errors.update(r["errors"])
+        report[role] = {
+            "processes": len(rs),
+            "ops": sum(r["ops"] for r in rs),
+            "ops_per_s": sum(r["ops"] for r in rs) / seconds,
+            "p50_ms": _percentile(lat, 50) * 1000,
+            "p95_ms": _percentile(lat, 95) * 1000,
+            "p99_ms": _percentile(lat, 99) * 1000,
+            "max_ms": max(lat, default=0.0) * 1000,
+            "retries": sum(r["retries"] for r in rs),
+            "errors": dict(errors),
+        }
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Essai de charge multi-processus sur une base Provenderie")
+    parser.add_argument("db", help="copie de la base (des mouvements de test y sont ajoutés)")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--batch", type=int, default=1, help="mouvements par transaction d'écriture")
+    parser.add_argument("--busy-timeout", type=float, default=5.0, help="attente maximale du verrou (s)")
+    args = parser.parse_args(argv)
+
+    report = run(args.db, args.writers, args.readers, args.seconds, args.batch, args.busy_timeout)
+    print(f"{args.db} : {args.writers} écrivain(s), {args.readers} lecteur(s), {args.seconds:.0f} s, lots de {args.batch}")
+    for role, r in report.items():
+        label = "Écritures" if role == "writer" else "Lectures"
+        print(f"{label:<10} {r['ops']:>8} ({r['ops_per_s']:,.1f}/s)  latence p50 {r['p50_ms']:.1f} ms  "
+              f"p95 {r['p95_ms']:.1f} ms  p99 {r['p99_ms']:.1f} ms  max {r['max_ms']:.1f} ms  "
+              f"rejouées {r['retries']}  erreurs {sum(r['errors'].values())}")
+        for msg, n in r["errors"].items():
+            print(f"    {n:>6} × {msg}")
+    return 1 if any(r["errors"] for r in report.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,11 @@
 # Fichier: main.py
+import os
+import sys
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
+from ttkbootstrap.dialogs import Messagebox
 from db import Database
+from writequeue import WriteQueue
 from ui.dashboard import DashboardPage
 from ui.products import ProductsPage
 from ui.movements import MovementsPage
@@ -9,6 +13,13 @@ from ui.inventory import InventoryPage
 from ui.reports import ReportsPage
 from ui.settings import SettingsPage
 from ui.dialogs import LoginDialog
+import diagnostics
+
+# Mode multi-postes : PROVENDERIE_SERVER=hote:port pour passer par le serveur (server.py)
+SERVER_ENV = "PROVENDERIE_SERVER"
+
+# Mouvements refusés à la fermeture, réécrits au démarrage suivant (WriteQueue.replay)
+RECOVERY_FILE = "mouvements-a-rejouer.json"
 
 class App(ttk.Window):
     def __init__(self):
@@ -18,15 +29,78 @@ class App(ttk.Window):
         self.geometry("1280x800")
         self.minsize(1100, 700)
 
-        self.db = Database("provenderie.db")
+        self.db = self._open_database()
+        # Nouveaux mouvements écrits par lots (group commit) sans bloquer la saisie
+        self.writes = WriteQueue(self.db, self.after)
+        self.writes.subscribe(self._on_writes)
+        # Vrai pendant la reprise et la fermeture : un seul message, donné par elles
+        self.quiet_writes = False
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.role = None  # Variable pour stocker le rôle de l'utilisateur
+        self.pages = {}  # Pages déjà construites, masquées plutôt que détruites
+        # PROVENDERIE_DIAG=1 : relevés de widgets et de mémoire à chaque navigation
+        self.diagnostics = diagnostics.install(self)
 
         # Initialisation de la structure principale
         self._build_layout()
         
+        # Mouvements refusés à la dernière fermeture
+        self.after_idle(self._replay_rejected)
         # Lance la boîte de dialogue de connexion dès le démarrage
         self.start_login()
 
+    def _open_database(self):
+        """Base locale par défaut, ou client du serveur multi-postes si configuré."""
+        server = os.environ.get(SERVER_ENV, "").strip()
+        if not server:
+            return Database("provenderie.db")
+        from server import RemoteDatabase
+        host, _, port = server.rpartition(":")
+        db = RemoteDatabase(host or "127.0.0.1", int(port))
+        self.after(1000, self._poll_server_events)
+        return db
+
+    def _poll_server_events(self):
+        """Relaie les changements faits depuis les autres postes."""
+        try:
+            self.db.poll_events()
+        finally:
+            self.after(1000, self._poll_server_events)
+
+    def _on_writes(self, kind, entries):
+        """Signale les mouvements acceptés à la saisie mais refusés à l'écriture."""
+        if kind != "flushed" or self.quiet_writes:
+            return
+        self._show_rejected(entries, "Ces mouvements n'ont pas pu être enregistrés :")
+
+    def _show_rejected(self, entries, title: str, footer: str = ""):
+        failed = [(item, r) for _, item, r in entries if isinstance(r, Exception)]
+        if not failed:
+            return
+        lines = [f"- {item['mtype']} {abs(item['qty_kg']):.2f} kg (produit {item['product_id']}) : {r}" for item, r in failed]
+        Messagebox.show_error(title + "\n" + "\n".join(lines) + footer, "Erreur d'enregistrement")
+
+    def _replay_rejected(self):
+        footer = (f"\n\nIls restent dans {os.path.abspath(RECOVERY_FILE)} et seront réessayés au prochain démarrage "
+                  "(supprimez ce fichier pour les abandonner).")
+        self.quiet_writes = True
+        try:
+            entries = self.writes.replay(RECOVERY_FILE)
+        finally:
+            self.quiet_writes = False
+        self._show_rejected(entries, "Mouvements de la dernière session toujours refusés :", footer)
+
+    def on_close(self):
+        """Écrit les mouvements en attente avant de quitter ; les refusés sont gardés pour le prochain démarrage."""
+        self.quiet_writes = True
+        rejected = self.writes.close(RECOVERY_FILE)
+        self._show_rejected(rejected, "Ces mouvements n'ont pas pu être enregistrés :",
+                            f"\n\nIls sont conservés dans {os.path.abspath(RECOVERY_FILE)} "
+                            "et seront réessayés au prochain démarrage.")
+        if self.diagnostics is not None:
+            self.diagnostics.report(file=sys.stdout)
+        self.destroy()
+
     def start_login(self):
         """Affiche la boîte de dialogue de connexion."""
         # Crée une instance de LoginDialog. Le constructeur de LoginDialog gère l'affichage de la fenêtre.
@@ -68,9 +142,24 @@ class App(ttk.Window):
             ("Rapports", "reports", "success"),
             ("Paramètres", "settings", "secondary"),
         ]
+        self.nav_buttons = {}
         for text, key, style in items:
-            ttk.Button(self.sidebar, text=text, bootstyle=f"{style}-outline",
-                       command=lambda k=key: self.show_page(k)).pack(fill=X, pady=6)
+            btn = ttk.Button(self.sidebar, text=text, bootstyle=f"{style}-outline",
+                             command=lambda k=key: self.show_page(k))
+            btn.pack(fill=X, pady=6)
+            self.nav_buttons[key] = btn
+
+        # Badge du nombre d'alertes de stock bas (lu dans stock_alert)
+        self.update_alert_badge()
+        self.db.events.subscribe(lambda e: self.update_alert_badge(), ("product", "shop", "movement"))
+
+    def update_alert_badge(self):
+        count = self.db.alert_count(1)
+        btn = self.nav_buttons["reports"]
+        if count:
+            btn.configure(text=f"Rapports  ⚠ {count}", bootstyle="danger")
+        else:
+            btn.configure(text="Rapports", bootstyle="success-outline")
 
     def _build_content(self):
         """Construit le cadre de contenu principal."""
@@ -79,12 +168,21 @@ class App(ttk.Window):
         self.content.pack(side=LEFT, fill=BOTH, expand=YES)
 
     def show_page(self, key: str):
-        """Affiche la page demandée et détruit l'ancienne."""
-        # Détruit les widgets existants dans le cadre de contenu
+        """Affiche la page demandée et masque les autres (elles restent abonnées aux changements)."""
         for w in self.content.winfo_children():
-            w.destroy()
+            w.pack_forget()
+
+        page = self.pages.get(key)
+        if page is None:
+            page = self._create_page(key)
+            self.pages[key] = page
+
+        page.pack(fill=BOTH, expand=YES)
+        if hasattr(page, "on_show"):
+            page.on_show()
 
-        # Crée la nouvelle page
+    def _create_page(self, key: str):
+        """Crée la page correspondant à la clé de navigation."""
         if key == "dashboard":
             page = DashboardPage(self.content, self)
         elif key == "products":
@@ -99,10 +197,7 @@ class App(ttk.Window):
             page = SettingsPage(self.content, self)
         else:
             page = ttk.Label(self.content, text="Page inconnue")
-
-        page.pack(fill=BOTH, expand=YES)
-        if hasattr(page, "on_show"):
-            page.on_show()
+        return page
 
     def toggle_theme(self):
         """Bascule entre les thèmes 'flatly' et 'darkly'."""
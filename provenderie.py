@@ -0,0 +1,418 @@
+import argparse
+import csv
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from db import Database, missing_tables
+
+
+# --- Module provenderie.py ---
+# Ligne de commande sans interface graphique, pour les traitements de nuit (cron) :
+#
+#   python -m provenderie export stocks stocks.csv --shop 1
+#   python -m provenderie export movements mvts.csv --from 2024-01-01 --to 2024-01-31
+#   python -m provenderie import catalogue prix.csv --dry-run
+#   python -m provenderie archive --sku ALIM-01 --dormant 365
+#   python -m provenderie rebuild all
+#   python -m provenderie backup sauvegardes --gzip --keep 14
+#   python -m provenderie snapshot --summary --from 2024-01-01
+#   python -m provenderie bench --repeat 5
+#   python -m provenderie report --shop 1 --from 2024-01-01
+#   python -m provenderie reports rapports --from 2024-01-01 --to 2024-01-31
+#
+# N'importe jamais Tk ni ttkbootstrap : seules `Database` et les modules de calcul
+# sont chargés ; NumPy ne l'est que par les commandes qui en ont besoin.
+
+DEFAULT_DB = "provenderie.db"
+
+
+def _open(args) -> Database:
+    """
+    Base existante (un chemin erroné ne crée pas de base vide). Une base d'une version
+    précédente est mise à jour une fois en écriture avant une commande en lecture seule.
+    """
+    if not Path(args.db).is_file():
+        raise SystemExit(f"Base introuvable : {args.db}")
+    try:
+        if not getattr(args, "readonly", False):
+            return Database(args.db)
+        db = Database(args.db, readonly=True)
+        if missing_tables(db.cnx):
+            db.cnx.close()
+            print(f"Mise à jour du schéma de {args.db}...", file=sys.stderr)
+            Database(args.db).cnx.close()
+            db = Database(args.db, readonly=True)
+        return db
+    except sqlite3.DatabaseError as e:
+        raise SystemExit(f"Base illisible ({args.db}) : {e}")
+
+
+def _shop_id(db: Database, value: Optional[str]) -> Optional[int]:
+    """Boutique donnée par son id ou son libellé ; une boutique inconnue arrête la commande."""
+    if not value:
+        return None
+    shop = db.get_shop(int(value)) if value.isdigit() else None
+    if shop is None:
+        shop = db.shop_by_label(value)
+    if shop is None:
+        raise SystemExit(f"Boutique inconnue : {value}")
+    return shop["id"]
+
+
+def _writer(path: str):
+    f = sys.stdout if path == "-" else open(path, "w", newline="", encoding="utf-8")
+    return f, csv.writer(f, delimiter=";")
+
+
+# ----------------------------------------------------------------------
+# Exports
+
+def export_stocks(db: Database, path: str, shop_id: int = 1) -> int:
+    """Même fichier que « Exporter CSV (stocks) » de la page Rapports."""
+    from utils import kg_to_bag_repr_batch
+    items = db.all_stocks(shop_id=shop_id)
+    reprs = kg_to_bag_repr_batch([qty for _, qty in items], [p["poids_sac_kg"] for p, _ in items])
+    f, w = _writer(path)
+    try:
+        w.writerow(["ID", "Produit", "Stock (kg)", "Stock (sacs+kg)", "Seuil (kg)", "1 sac (kg)"])
+        w.writerows([
+            p["id"], p["libelle"], f"{qty:.2f}", aff,
+            f'{p["seuil_kg"]:.2f}', f'{p["poids_sac_kg"]:.2f}'
+        ] for (p, qty), aff in zip(items, reprs))
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return len(items)
+
+
+def export_movements(db: Database, path: str, shop_id: Optional[int] = None, mtype: Optional[str] = None,
+                     date_from: Optional[str] = None, date_to: Optional[str] = None, batch: int = 5000) -> int:
+    """Journal filtré, du plus ancien au plus récent, lu par pages pour borner la mémoire."""
+    f, w = _writer(path)
+    count = 0
+    try:
+        w.writerow(["ID", "Date", "Type", "Produit", "Boutique", "Quantité (kg)",
+                    "Prix/kg", "Prix/sac", "Coût", "Note"])
+        while True:
+            rows = db.list_movements(mtype, shop_id, "", date_from, date_to,
+                                     descending=False, limit=batch, offset=count)
+            w.writerows([
+                m["id"], m["created_at"], m["type"], m["product_libelle"], m["shop_libelle"],
+                f'{m["qty_kg"]:.2f}', m["unit_price_kg"] or "", m["unit_price_sac"] or "",
+                f'{m["cost"]:.2f}', m["note"] or ""
+            ] for m in rows)
+            count += len(rows)
+            if len(rows) < batch:
+                break
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return count
+
+
+def export_products(db: Database, path: str) -> int:
+    """Catalogue au format accepté par `import catalogue` (colonnes de catalogue.COLUMNS)."""
+    from catalogue import COLUMNS
+    items = db.list_products(include_inactive=True, order_by="sku")
+    f, w = _writer(path)
+    try:
+        w.writerow(COLUMNS)
+        w.writerows([p.get(c) if p.get(c) is not None else "" for c in COLUMNS] for p in items)
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return len(items)
+
+
+def cmd_export(args):
+    db = _open(args)
+    if args.what == "stocks":
+        n = export_stocks(db, args.path, _shop_id(db, args.shop) or 1)
+    elif args.what == "movements":
+        n = export_movements(db, args.path, _shop_id(db, args.shop), args.type, args.date_from, args.date_to)
+    else:
+        n = export_products(db, args.path)
+    print(f"{n} ligne(s) exportée(s) vers {args.path}", file=sys.stderr)
+
+
+# ----------------------------------------------------------------------
+# Imports
+
+def cmd_import(args):
+    import catalogue
+    db = _open(args)
+    diff = catalogue.import_file(db, args.path, dry_run=args.dry_run)
+    print(f"{diff['new']} nouveau(x), {diff['changed']} modifié(s), {diff['unchanged']} inchangé(s), "
+          f"{len(diff['errors'])} erreur(s)" + (" — aperçu, rien n'a été écrit" if args.dry_run else ""))
+    for e in diff["errors"]:
+        print(f"  ligne {e['line'] or '-'} {e['sku']} : {e['error']}")
+    if args.verbose:
+        for r in diff["rows"]:
+            if r["status"] != "inchangé":
+                changes = ", ".join(f"{c}: {old} -> {new}" for c, (old, new) in r["changes"].items())
+                print(f"  {r['sku']} [{r['status']}] {changes}")
+    return 1 if diff["errors"] else 0
+
+
+# ----------------------------------------------------------------------
+# Archivage
+
+def dormant_products(db: Database, days: int) -> List[int]:
+    """Produits actifs sans aucun mouvement depuis `days` jours."""
+    since = (date.today() - timedelta(days=days)).isoformat()
+    rows = db.cnx.execute(
+        """SELECT p.id FROM product p WHERE p.actif = 1
+            AND NOT EXISTS (SELECT 1 FROM movement m WHERE m.product_id = p.id AND m.created_at >= ?)
+            ORDER BY p.id""",
+        (since,)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def cmd_archive(args):
+    db = _open(args)
+    ids = list(args.id or [])
+    for sku in args.sku or []:
+        p = db.product_by_sku(sku)
+        if p is None:
+            print(f"SKU inconnu : {sku}", file=sys.stderr)
+            return 1
+        ids.append(p["id"])
+    if args.dormant:
+        ids.extend(dormant_products(db, args.dormant))
+    ids = sorted(set(ids))
+    for pid in ids:
+        p = db.get_product(pid)
+        if p is None:
+            print(f"Produit inconnu : {pid}", file=sys.stderr)
+            continue
+        print(f"{'(aperçu) ' if args.dry_run else ''}archivé : {pid} {p['libelle']}")
+        if not args.dry_run:
+            db.archive_product(pid)
+    return 0
+
+
+# ----------------------------------------------------------------------
+# Tables dérivées
+
+def rebuild(db: Database, what: str = "all") -> List[str]:
+    """Recalcule les tables dérivées du journal ; retourne celles qui l'ont été."""
+    from alerts import rebuild_stock_alerts
+    steps = {
+        "valuation": db.valuation.rebuild,
+        "consumption": db.consumption.rebuild,
+        "checkpoints": lambda: (db.checkpoints.reset(), db.cnx.commit(), db.checkpoints.build()),
+        "alerts": lambda: rebuild_stock_alerts(db.cnx),
+    }
+    done = []
+    for name, step in steps.items():
+        if what in ("all", name):
+            step()
+            done.append(name)
+    return done
+
+
+def cmd_rebuild(args):
+    db = _open(args)
+    for name in rebuild(db, args.what):
+        print(f"{name} : recalculé")
+
+
+# ----------------------------------------------------------------------
+# Copie en colonnes (analyses sans SQLite)
+
+def cmd_snapshot(args):
+    from columnar import ColumnExporter, ColumnSnapshot
+    db = _open(args)
+    exporter = ColumnExporter(db, args.dir)
+    t = time.perf_counter()
+    r = exporter.refresh(rebuild=args.rebuild)
+    print(f"{exporter.directory} : {r['rows']} lignes ({'reconstruit, ' if r['rebuilt'] else ''}"
+          f"{r['appended']} ajoutées, {r['patched']} corrigées) en {time.perf_counter() - t:.2f} s")
+    if args.summary:
+        from analytics import Ledger
+        t = time.perf_counter()
+        ledger = Ledger.from_snapshot(ColumnSnapshot(exporter.directory), db, _shop_id(db, args.shop),
+                                      args.date_from, args.date_to)
+        for row in ledger.by_shop():
+            print(f"  {row['libelle']:<30} ventes {row['sales']:>16,.2f}  achats {row['purchases']:>16,.2f}  "
+                  f"marge {row['margin']:>16,.2f}")
+        print(f"  (analyse en {time.perf_counter() - t:.3f} s)")
+
+
+# ----------------------------------------------------------------------
+# Sauvegarde
+
+def cmd_backup(args):
+    import backup
+    t = time.perf_counter()
+    path = backup.backup(args.db, args.directory, compress=args.gzip, keep=args.keep)
+    print(f"Sauvegarde vérifiée : {path} ({path.stat().st_size / 1e6:.1f} Mo, {time.perf_counter() - t:.1f} s)")
+
+
+# ----------------------------------------------------------------------
+# Mesures
+
+def _timed(fn: Callable, repeat: int) -> float:
+    """Meilleur temps (ms) sur `repeat` exécutions."""
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+
+def benchmarks(db: Database, shop_id: int = 1):
+    """Requêtes des pages de l'application, dans l'ordre où un utilisateur les rencontre."""
+    from analytics import Ledger
+    products = db.list_products()
+    pid = products[0]["id"] if products else 0
+    return [
+        ("list_products", lambda: db.list_products()),
+        ("stock_kg (tous produits)", lambda: [db.stock_kg(p["id"], shop_id) for p in products]),
+        ("all_stocks", lambda: db.all_stocks(shop_id)),
+        ("low_stock_products", lambda: db.low_stock_products(shop_id)),
+        ("list_movements (1re page)", lambda: db.list_movements(limit=500)),
+        ("list_movements (par produit)", lambda: db.list_movements(order_by="produit", limit=500)),
+        ("count_movements", lambda: db.count_movements()),
+        ("total_sales_and_cogs", lambda: db.total_sales_and_cogs()),
+        ("stock_kg_at (il y a 1 an)", lambda: db.stock_kg_at(pid, shop_id, date.today() - timedelta(days=365))),
+        ("consumption_rates", lambda: db.consumption_rates(shop_id)),
+        ("Ledger.load + by_product", lambda: Ledger.load(db).by_product()),
+    ]
+
+
+def cmd_bench(args):
+    db = _open(args)
+    n = db.cnx.execute("SELECT COUNT(*) FROM movement").fetchone()[0]
+    print(f"{args.db} : {n} mouvements, meilleur temps sur {args.repeat} exécutions")
+    for name, fn in benchmarks(db, _shop_id(db, args.shop) or 1):
+        if args.only and args.only not in name:
+            continue
+        if not args.cached:
+            # Mesure la requête elle-même, pas le cache des agrégats
+            fn = lambda fn=fn: (db.aggregates.clear(), fn())
+        print(f"  {name:<32} {_timed(fn, args.repeat):10.2f} ms")
+    if args.cached:
+        print("Cache des agrégats : " + ", ".join(f"{k} {v:.2f}" if isinstance(v, float) else f"{k} {v}"
+                                                for k, v in db.cache_stats().items()))
+
+
+# ----------------------------------------------------------------------
+# Rapports
+
+def cmd_report(args):
+    db = _open(args)
+    shop_id = _shop_id(db, args.shop)
+    stock_shop = shop_id or 1
+    sales, purchases = db.total_sales_and_cogs(shop_id=shop_id, date_from=args.date_from, date_to=args.date_to)
+    cogs = db.cogs(shop_id=shop_id, date_from=args.date_from, date_to=args.date_to)
+    shop = db.get_shop(stock_shop)
+    period = f"{args.date_from or 'début'} -> {args.date_to or 'aujourd’hui'}"
+    print(f"Période : {period}   Boutique : {'toutes' if shop_id is None else shop['libelle']}")
+    print(f"Ventes : {sales:,.2f} FCFA   Achats : {purchases:,.2f} FCFA   Marge : {sales - purchases:,.2f} FCFA")
+    print(f"Coût réel des ventes : {cogs:,.2f} FCFA   Marge réelle : {sales - cogs:,.2f} FCFA")
+    print(f"Stock total ({shop['libelle']}) : {db.total_stock_kg(stock_shop):,.2f} kg   "
+          f"Valeur : {db.stock_value(shop_id=stock_shop):,.2f} FCFA")
+    low = db.low_stock_products(shop_id=stock_shop)
+    print(f"Sous le seuil : {len(low)} produit(s)")
+    for p in low:
+        print(f"  {p['id']:>5} {p['libelle']:<40} {p['stock_kg']:>10.2f} kg  (seuil {p['seuil_kg']:.2f})")
+
+
+def cmd_reports(args):
+    import shop_reports
+    db = _open(args)
+    shop_ids = [_shop_id(db, s) for s in args.shop] if args.shop else None
+    db.cnx.close()
+    r = shop_reports.run(args.db, args.directory, args.date_from, args.date_to, shop_ids, args.workers)
+    for path in r["files"]:
+        print(path)
+    print(f"{len(r['files'])} rapport(s) + {r['summary']} en {r['seconds']:.2f} s "
+          f"({r['workers']} processus, {r['cpu_seconds']:.2f} s de calcul cumulé)")
+
+
+# ----------------------------------------------------------------------
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m provenderie", description="Provenderie en ligne de commande")
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"fichier de base (défaut : {DEFAULT_DB})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def filters(p, shop=True, dates=True):
+        if shop:
+            p.add_argument("--shop", help="id ou libellé de la boutique")
+        if dates:
+            p.add_argument("--from", dest="date_from", help="date de début (AAAA-MM-JJ)")
+            p.add_argument("--to", dest="date_to", help="date de fin incluse (AAAA-MM-JJ)")
+
+    p = sub.add_parser("export", help="exporter en CSV")
+    p.add_argument("what", choices=["stocks", "movements", "products"])
+    p.add_argument("path", help="fichier CSV, ou - pour la sortie standard")
+    p.add_argument("--type", choices=["IN", "OUT", "ADJ"])
+    filters(p)
+    p.set_defaults(func=cmd_export, readonly=True)
+
+    p = sub.add_parser("import", help="importer un catalogue / une liste de prix (CSV par SKU)")
+    p.add_argument("what", choices=["catalogue"])
+    p.add_argument("path")
+    p.add_argument("--dry-run", action="store_true", help="afficher les différences sans écrire")
+    p.add_argument("-v", "--verbose", action="store_true")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("archive", help="archiver des produits")
+    p.add_argument("--id", type=int, action="append")
+    p.add_argument("--sku", action="append")
+    p.add_argument("--dormant", type=int, metavar="JOURS", help="produits sans mouvement depuis JOURS jours")
+    p.add_argument("--dry-run", action="store_true")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("rebuild", help="recalculer les tables dérivées")
+    p.add_argument("what", nargs="?", default="all", choices=["all", "valuation", "consumption", "checkpoints", "alerts"])
+    p.set_defaults(func=cmd_rebuild)
+
+    p = sub.add_parser("snapshot", help="mettre à jour la copie en colonnes .npy du journal")
+    p.add_argument("--dir", help="dossier des colonnes (défaut : <base>.columns)")
+    p.add_argument("--rebuild", action="store_true")
+    p.add_argument("--summary", action="store_true", help="afficher ventes et achats par boutique depuis la copie")
+    filters(p)
+    p.set_defaults(func=cmd_snapshot)
+
+    p = sub.add_parser("backup", help="sauvegarde à chaud vérifiée (voir backup.py pour la restauration)")
+    p.add_argument("directory", nargs="?", default="sauvegardes")
+    p.add_argument("--gzip", action="store_true")
+    p.add_argument("--keep", type=int, help="nombre de sauvegardes conservées")
+    p.set_defaults(func=cmd_backup)
+
+    p = sub.add_parser("bench", help="mesurer les requêtes principales")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--only", help="ne mesurer que les requêtes dont le nom contient ce texte")
+    p.add_argument("--cached", action="store_true", help="garder le cache des agrégats entre deux exécutions")
+    filters(p, dates=False)
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("report", help="afficher ventes, marge, stock et ruptures")
+    filters(p)
+    p.set_defaults(func=cmd_report, readonly=True)
+
+    p = sub.add_parser("reports", help="rapports de fin de mois, un fichier CSV par boutique (calcul en parallèle)")
+    p.add_argument("directory", nargs="?", default="rapports")
+    p.add_argument("--shop", action="append", help="id ou libellé de boutique (toutes par défaut)")
+    p.add_argument("--workers", type=int, help="processus de calcul (défaut : nombre de cœurs)")
+    filters(p, shop=False)
+    p.set_defaults(func=cmd_reports, readonly=True)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import json
+import queue
+import select
+import socket
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from db import Database
+from events import EventBus, ChangeEvent
+
+
+# --- Module server.py ---
+# Mode multi-postes : un processus serveur possède la seule connexion en
+# écriture sur provenderie.db ; les caisses dialoguent avec lui en JSON
+# (une ligne par message) sur TCP local.
+#
+#   requête  : {"id": 1, "method": "add_movement", "args": [...], "kwargs": {...}}
+#   réponse  : {"id": 1, "result": ...}  ou  {"id": 1, "error": "...", "type": "IntegrityError"}
+#   événement: {"event": {"entity": "movement", "op": "insert", "ids": [...], ...}}
+#
+# Les add_movement reçus en rafale sont validés ensemble (group commit) ;
+# les lectures sont servies par un pool de connexions en lecture seule.
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+WRITE_METHODS = {
+    "add_shop", "rename_shop", "delete_shop",
+    "add_product", "update_product", "upsert_products", "archive_product",
+    "add_movement", "add_movements", "post_inventory_counts", "update_movement",
+}
+READ_METHODS = {
+    "list_shops", "get_shop", "shop_by_label", "list_products", "get_product", "product_by_sku", "product_by_label", "get_movement",
+    "list_movements", "count_movements", "stock_kg", "stock_kg_at", "all_stocks", "total_stock_kg", "low_stock_products", "alert_count",
+    "total_sales_and_cogs", "ledger_rows", "daily_series", "consumption_rates", "stock_value", "stock_value_at", "cogs", "product_ranking", "cache_stats",
+}
+
+
+class DatabaseServer:
+    def __init__(self, path: str = "provenderie.db", host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 readers: int = 4, batch_window: float = 0.02, batch_max: int = 200):
+        self.path = path
+        self.host = host
+        self.port = port
+        self.readers = readers
+        self.batch_window = batch_window
+        self.batch_max = batch_max
+        # Un seul thread d'écriture : il crée et utilise seul la connexion en écriture
+        self.writer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self.reader_pool = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self.reader_dbs: "queue.Queue[Database]" = queue.Queue()
+        self.db: Optional[Database] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.writes: Optional[asyncio.Queue] = None
+        self.clients: List[asyncio.StreamWriter] = []
+        self.stats = {"requests": 0, "writes": 0, "batches": 0}
+        # Incrémenté à chaque écriture de produit ou de boutique (voir _read)
+        self.refs_generation = 0
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self.loop = loop
+        self.db = await loop.run_in_executor(self.writer_pool, Database, self.path)
+        self.db.events.subscribe(self._on_db_event)
+        for _ in range(self.readers):
+            self.reader_dbs.put(Database(self.path, readonly=True))
+        self.writes = asyncio.Queue()
+        self.writer_task = asyncio.create_task(self._writer_loop())
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        # Port effectif (utile avec port=0 pour les essais en local)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        # Vide la file d'écriture avant de fermer la connexion
+        if self.writes is not None:
+            await self.writes.join()
+            self.writer_task.cancel()
+        for w in list(self.clients):
+            w.close()
+        self.writer_pool.shutdown(wait=True)
+        self.reader_pool.shutdown(wait=True)
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Serveur Provenderie sur {self.host}:{self.port} ({self.path})")
+        async with self.server:
+            await self.server.serve_forever()
+
+    # ------------------------------------------------------------------
+    # Clients
+    # ------------------------------------------------------------------
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients.append(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    continue
+                # Chaque requête est traitée à part : une lecture lente ne bloque pas la suivante
+                asyncio.create_task(self._dispatch(msg, writer))
+        finally:
+            if writer in self.clients:
+                self.clients.remove(writer)
+            writer.close()
+
+    async def _dispatch(self, msg: Dict, writer: asyncio.StreamWriter):
+        self.stats["requests"] += 1
+        method = msg.get("method")
+        args, kwargs = msg.get("args") or [], msg.get("kwargs") or {}
+        try:
+            if method in WRITE_METHODS:
+                fut = self.loop.create_future()
+                await self.writes.put((method, args, kwargs, fut))
+                result = await fut
+            elif method in READ_METHODS:
+                result = await self.loop.run_in_executor(self.reader_pool, self._read, method, args, kwargs)
+            else:
+                raise AttributeError(f"Méthode inconnue : {method}")
+            reply = {"id": msg.get("id"), "result": result}
+        except Exception as e:
+            reply = {"id": msg.get("id"), "error": str(e), "type": type(e).__name__}
+        self._send(writer, reply)
+
+    def _send(self, writer: asyncio.StreamWriter, payload: Dict):
+        if writer.is_closing():
+            return
+        writer.write(json.dumps(payload).encode("utf-8") + b"\n")
+
+    def _read(self, method: str, args, kwargs):
+        db = self.reader_dbs.get()
+        if getattr(db, "refs_generation", 0) != self.refs_generation:
+            db.invalidate_refs()
+            db.refs_generation = self.refs_generation
+        try:
+            return _jsonable(getattr(db, method)(*args, **kwargs))
+        finally:
+            self.reader_dbs.put(db)
+
+    def _on_db_event(self, event: ChangeEvent):
+        # Appelé dans le thread d'écriture, après le commit
+        if event.entity in ("product", "shop"):
+            # Les lecteurs rechargent leur carte d'identité avant leur prochaine requête
+            self.refs_generation += 1
+        payload = {"event": event._asdict()}
+        self.loop.call_soon_threadsafe(lambda: [self._send(w, payload) for w in list(self.clients)])
+
+    # ------------------------------------------------------------------
+    # Écritures
+    # ------------------------------------------------------------------
+    async def _writer_loop(self):
+        carry = None
+        while True:
+            item = carry or await self.writes.get()
+            carry = None
+            batch = [item]
+            if item[0] == "add_movement":
+                # Regroupe les mouvements arrivés pendant la fenêtre de group commit
+                deadline = self.loop.time() + self.batch_window
+                while len(batch) < self.batch_max:
+                    timeout = deadline - self.loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        nxt = await asyncio.wait_for(self.writes.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if nxt[0] != "add_movement":
+                        carry = nxt
+                        break
+                    batch.append(nxt)
+            await self._run_batch(batch)
+            for _ in batch:
+                self.writes.task_done()
+
+    async def _run_batch(self, batch):
+        self.stats["batches"] += 1
+        self.stats["writes"] += len(batch)
+        if batch[0][0] == "add_movement":
+            items = [_movement_kwargs(args, kwargs) for _, args, kwargs, _ in batch]
+            try:
+                results = await self.loop.run_in_executor(self.writer_pool, self.db.add_movements, items)
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, _, _, fut), r in zip(batch, results):
+                if isinstance(r, Exception):
+                    fut.set_exception(r)
+                else:
+                    fut.set_result(r)
+            return
+
+        method, args, kwargs, fut = batch[0]
+        try:
+            result = await self.loop.run_in_executor(self.writer_pool, self._write, method, args, kwargs)
+            fut.set_result(_jsonable(result))
+        except Exception as e:
+            fut.set_exception(e)
+
+    def _write(self, method: str, args, kwargs):
+        try:
+            return getattr(self.db, method)(*args, **kwargs)
+        except Exception:
+            # Une écriture refusée ne doit pas laisser de transaction ouverte pour les suivantes
+            self.db.cnx.rollback()
+            raise
+
+
+_MOVEMENT_ARGS = ("product_id", "shop_id", "mtype", "qty_kg", "unit_price_kg", "unit_price_sac", "cost", "note")
+
+
+def _movement_kwargs(args, kwargs) -> Dict:
+    """Normalise les arguments d'add_movement en dictionnaire pour add_movements."""
+    d = dict(zip(_MOVEMENT_ARGS, args))
+    d.update(kwargs)
+    return d
+
+
+def _jsonable(value):
+    if isinstance(value, Exception):
+        # Échec d'un élément d'add_movements : transmis comme une erreur de requête
+        return {"error": str(value), "type": type(value).__name__}
+    if isinstance(value, tuple):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    return value
+
+
+# ----------------------------------------------------------------------
+# Client
+# ----------------------------------------------------------------------
+_ERRORS = {
+    "IntegrityError": sqlite3.IntegrityError,
+    "OperationalError": sqlite3.OperationalError,
+    "ValueError": ValueError,
+    "AttributeError": AttributeError,
+}
+
+# Résultats dont les clés entières ont été converties en texte par JSON
+_INT_KEYS = {"consumption_rates"}
+
+
+class RemoteDatabase:
+    """
+    Remplaçant de `Database` côté caisse : mêmes méthodes, exécutées par le serveur.
+    Les événements de changement (y compris ceux des autres postes) sont republiés
+    sur `self.events` après chaque appel ou lors de `poll_events`.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, timeout: float = 30.0):
+        self.path = f"{host}:{port}"
+        self.events = EventBus()
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.lock = threading.Lock()
+        self._buffer = b""
+        self._next_id = 0
+        self._events: List[ChangeEvent] = []
+
+    def close(self):
+        self.sock.close()
+
+    def call(self, method: str, *args, **kwargs):
+        with self.lock:
+            self._next_id += 1
+            rid = self._next_id
+            self.sock.sendall(json.dumps({"id": rid, "method": method, "args": list(args), "kwargs": kwargs}).encode("utf-8") + b"\n")
+            while True:
+                msg = self._read_message()
+                if msg.get("id") == rid:
+                    break
+        self._flush_events()
+        if "error" in msg:
+            raise _ERRORS.get(msg.get("type"), RuntimeError)(msg["error"])
+        result = msg.get("result")
+        if method in _INT_KEYS and isinstance(result, dict):
+            result = {int(k): v for k, v in result.items()}
+        if method == "add_movements":
+            result = [_ERRORS.get(r.get("type"), RuntimeError)(r["error"]) if isinstance(r, dict) else r for r in result]
+        return result
+
+    def poll_events(self):
+        """Lit les notifications déjà reçues, sans bloquer, et les republie."""
+        with self.lock:
+            while select.select([self.sock], [], [], 0)[0]:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                self._buffer += data
+            while b"\n" in self._buffer:
+                self._read_message()
+        self._flush_events()
+
+    def _read_message(self) -> Dict:
+        while b"\n" not in self._buffer:
+            data = self.sock.recv(65536)
+            if not data:
+                raise ConnectionError("Connexion au serveur perdue")
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        msg = json.loads(line)
+        if "event" in msg:
+            e = msg["event"]
+            self._events.append(ChangeEvent(e["entity"], e["op"], tuple(e["ids"]), tuple(e["product_ids"]), tuple(e["shop_ids"])))
+        return msg
+
+    def _flush_events(self):
+        events, self._events = self._events, []
+        for e in events:
+            self.events.publish(e)
+
+    def __getattr__(self, name: str):
+        if name in WRITE_METHODS or name in READ_METHODS:
+            return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+        raise AttributeError(name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serveur multi-postes Provenderie")
+    parser.add_argument("--db", default="provenderie.db")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args(argv)
+    server = DatabaseServer(args.db, args.host, args.port, readers=args.readers)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import argparse
+import csv
+import multiprocessing as mp
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from db import Database, missing_tables
+
+
+# --- Module shop_reports.py ---
+# Rapports de fin de mois, un fichier par boutique :
+# stock par produit, ventes / achats / marge, coût réel des ventes, valeur du
+# stock, produits sous le seuil et meilleures ventes.
+#
+# Chaque boutique est calculée dans un processus séparé (ProcessPoolExecutor)
+# avec sa propre connexion en lecture seule : en WAL les lecteurs ne se
+# bloquent pas entre eux ni ne bloquent les postes qui écrivent. Les résultats
+# reviennent au processus principal, qui écrit les fichiers et la synthèse.
+#
+#   python shop_reports.py provenderie.db rapports --from 2024-01-01 --to 2024-01-31
+#   python -m provenderie reports rapports --from 2024-01-01 --to 2024-01-31 --workers 4
+
+TOP_PRODUCTS = 10
+
+
+def shop_report(db_path: str, shop_id: int, date_from: Optional[str] = None, date_to: Optional[str] = None) -> Dict:
+    """
+    Rapport d'une boutique (exécuté dans un processus du pool : ne retourne que des types simples).
+    Les ventes et la marge portent sur la période ; le stock est celui du `date_to` inclus
+    (points de contrôle mensuels), ou le stock actuel sans date de fin.
+    """
+    t = time.perf_counter()
+    db = Database(db_path, readonly=True)
+    try:
+        shop = db.get_shop(shop_id)
+        sales, purchases = db.total_sales_and_cogs(shop_id=shop_id, date_from=date_from, date_to=date_to)
+        cogs = db.cogs(shop_id=shop_id, date_from=date_from, date_to=date_to)
+        if date_to:
+            # Produits archivés depuis compris : ils peuvent avoir du stock à la date
+            qty = {p["id"]: db.stock_kg_at(p["id"], shop_id, date_to) for p in db.list_products(include_inactive=True)}
+            stocks = [(p, qty[p["id"]]) for p in db.list_products()]
+            low = [dict(p, stock_kg=q) for p, q in stocks if q <= p.get("seuil_kg", 0)]
+            stock_kg = sum(qty.values())
+            stock_value = db.stock_value_at(shop_id, date_to)
+        else:
+            stocks = db.all_stocks(shop_id=shop_id)
+            low = db.low_stock_products(shop_id=shop_id)
+            stock_kg = db.total_stock_kg(shop_id)
+            stock_value = db.stock_value(shop_id=shop_id)
+        return {
+            "shop_id": shop_id,
+            "libelle": shop["libelle"] if shop else str(shop_id),
+            "sales": sales,
+            "purchases": purchases,
+            "margin": sales - purchases,
+            "cogs": cogs,
+            "real_margin": sales - cogs,
+            # Date du stock rapporté ; None : stock actuel, calculé le jour du rapport
+            "stock_as_of": date_to,
+            "stock_kg": stock_kg,
+            "stock_value": stock_value,
+            "stocks": [
+                {"id": p["id"], "sku": p["sku"], "libelle": p["libelle"], "stock_kg": q,
+                 "seuil_kg": p["seuil_kg"], "poids_sac_kg": p["poids_sac_kg"]}
+                for p, q in stocks
+            ],
+            "low_stock": [
+                {"id": p["id"], "libelle": p["libelle"], "stock_kg": p["stock_kg"], "seuil_kg": p["seuil_kg"]}
+                for p in low
+            ],
+            "top": db.product_ranking(shop_id=shop_id, date_from=date_from, date_to=date_to)[:TOP_PRODUCTS],
+            "seconds": time.perf_counter() - t,
+        }
+    finally:
+        db.cnx.close()
+
+
+def _stock_label(report: Dict) -> str:
+    """Le stock n'appartient pas à la période : sa date est écrite à côté de chaque valeur."""
+    if report["stock_as_of"]:
+        return f"au {report['stock_as_of']}"
+    return f"actuel (au {date.today().isoformat()})"
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^0-9A-Za-z]+", "-", text).strip("-").lower() or "boutique"
+
+
+def write_shop_report(report: Dict, directory: Path, period: str) -> Path:
+    path = directory / f"rapport-{report['shop_id']}-{_slug(report['libelle'])}.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f, delimiter=";")
+        w.writerow(["Boutique", report["libelle"]])
+        w.writerow(["Période des ventes", period])
+        for label, key in (("Ventes", "sales"), ("Achats", "purchases"), ("Marge", "margin"),
+                           ("Coût réel des ventes", "cogs"), ("Marge réelle", "real_margin")):
+            w.writerow([label, f"{report[key]:.2f}"])
+        w.writerow([])
+        when = _stock_label(report)
+        w.writerow([f"Stock total {when} (kg)", f"{report['stock_kg']:.2f}"])
+        w.writerow([f"Valeur du stock {when}", f"{report['stock_value']:.2f}"])
+        w.writerow([])
+        w.writerow(["Meilleures ventes"])
+        w.writerow(["Rang", "ID", "Produit", "Ventes", "Volume (kg)", "Part", "Classe"])
+        for r in report["top"]:
+            w.writerow([r["revenue_rank"], r["id"], r["libelle"], f"{r['revenue']:.2f}", f"{r['volume_kg']:.2f}",
+                        f"{r['share']:.4f}", r["abc"]])
+        w.writerow([])
+        w.writerow([f"Sous le seuil {when}"])
+        w.writerow(["ID", "Produit", f"Stock {when} (kg)", "Seuil (kg)"])
+        for p in report["low_stock"]:
+            w.writerow([p["id"], p["libelle"], f"{p['stock_kg']:.2f}", f"{p['seuil_kg']:.2f}"])
+        w.writerow([])
+        w.writerow([f"Stocks {when}"])
+        w.writerow(["ID", "SKU", "Produit", f"Stock {when} (kg)", "Seuil (kg)", "1 sac (kg)"])
+        for p in report["stocks"]:
+            w.writerow([p["id"], p["sku"] or "", p["libelle"], f"{p['stock_kg']:.2f}", f"{p['seuil_kg']:.2f}",
+                        f"{p['poids_sac_kg']:.2f}"])
+    return path
+
+
+def write_summary(reports: List[Dict], directory: Path, period: str) -> Path:
+    path = directory / "rapport-synthese.csv"
+    keys = ("sales", "purchases", "margin", "cogs", "real_margin", "stock_kg", "stock_value")
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f, delimiter=";")
+        when = _stock_label(reports[0]) if reports else ""
+        w.writerow(["Période des ventes", period])
+        w.writerow(["ID", "Boutique", "Ventes", "Achats", "Marge", "Coût réel des ventes", "Marge réelle",
+                    f"Stock {when} (kg)", f"Valeur du stock {when}", f"Sous le seuil {when}"])
+        for r in reports:
+            w.writerow([r["shop_id"], r["libelle"]] + [f"{r[k]:.2f}" for k in keys] + [len(r["low_stock"])])
+        w.writerow(["", "Total"] + [f"{sum(r[k] for r in reports):.2f}" for k in keys]
+                   + [sum(len(r["low_stock"]) for r in reports)])
+    return path
+
+
+def run(db_path: str, directory, date_from: Optional[str] = None, date_to: Optional[str] = None,
+        shop_ids: Optional[List[int]] = None, workers: Optional[int] = None) -> Dict:
+    """
+    Calcule et écrit les rapports de toutes les boutiques (ou de `shop_ids`) ; un id inconnu,
+    une base absente ou d'une version précédente lèvent ValueError.
+    `workers=1` calcule tout dans le processus courant, sur une seule connexion à la fois.
+    Retourne {"files", "summary", "seconds", "cpu_seconds", "workers"}.
+    """
+    t = time.perf_counter()
+    if not Path(db_path).is_file():
+        raise ValueError(f"Base introuvable : {db_path}")
+    db = Database(db_path, readonly=True)
+    try:
+        if missing_tables(db.cnx):
+            raise ValueError(f"Base d'une version précédente : ouvrez-la une fois dans l'application "
+                             f"ou lancez « python -m provenderie --db {db_path} rebuild all ».")
+        known = [s["id"] for s in db.list_shops()]
+    finally:
+        db.cnx.close()
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    if shop_ids is None:
+        shop_ids = known
+    unknown = [sid for sid in shop_ids if sid not in known]
+    if unknown:
+        raise ValueError(f"Boutique inconnue : {', '.join(map(str, unknown))}")
+    workers = max(1, min(workers or os.cpu_count() or 1, len(shop_ids) or 1))
+
+    if workers == 1:
+        reports = [shop_report(db_path, sid, date_from, date_to) for sid in shop_ids]
+    else:
+        # spawn : même comportement sous Windows (poste de la boutique) et sous Linux
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as pool:
+            futures = [pool.submit(shop_report, db_path, sid, date_from, date_to) for sid in shop_ids]
+            reports = [f.result() for f in as_completed(futures)]
+    reports.sort(key=lambda r: r["shop_id"])
+
+    period = f"{date_from or 'début'} -> {date_to or 'aujourd’hui'}"
+    files = [write_shop_report(r, directory, period) for r in reports]
+    return {
+        "files": files,
+        "summary": write_summary(reports, directory, period),
+        "seconds": time.perf_counter() - t,
+        "cpu_seconds": sum(r["seconds"] for r in reports),
+        "workers": workers,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Rapports de fin de mois, un fichier par boutique")
+    parser.add_argument("db", help="base, ex. provenderie.db")
+    parser.add_argument("directory", nargs="?", default="rapports")
+    parser.add_argument("--from", dest="date_from", help="date de début (AAAA-MM-JJ)")
+    parser.add_argument("--to", dest="date_to", help="date de fin incluse (AAAA-MM-JJ)")
+    parser.add_argument("--shop", type=int, action="append", help="id de boutique (toutes par défaut)")
+    parser.add_argument("--workers", type=int, help="processus de calcul (défaut : nombre de cœurs)")
+    args = parser.parse_args(argv)
+    try:
+        r = run(args.db, args.directory, args.date_from, args.date_to, args.shop, args.workers)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(f"{len(r['files'])} rapport(s) + {r['summary']} en {r['seconds']:.2f} s "
+          f"({r['workers']} processus, {r['cpu_seconds']:.2f} s de calcul cumulé)")
+    return 0
+
+
+if __name__ == "__main__":
+    mp.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,394 @@
+import argparse
+import hashlib
+import json
+import sqlite3
+import uuid
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+
+# --- Module sync.py ---
+# Synchronisation incrémentale entre bases de boutiques.
+#
+# Chaque ligne de shop / product / movement porte un `uid` stable d'une base
+# à l'autre. Des triggers consignent chaque insertion, modification ou
+# suppression dans `change_log`, avec l'origine (identifiant de la base qui a
+# fait le changement) et un numéro de séquence propre à cette origine.
+#
+# Le point de synchronisation est le vecteur de versions de chaque base
+# (MAX(origin_seq) par origine) : on n'échange que les entrées au-delà.
+# La fusion est déterministe : pour une même ligne, la version la plus récente
+# selon (changed_at, origin, origin_seq) l'emporte, quel que soit l'ordre
+# dans lequel les bases se synchronisent.
+
+ENTITIES = ("shop", "product", "movement")
+
+# Données consignées pour chaque entité (les clés étrangères sont traduites en uid)
+_JSON = {
+    "shop": "json_object('libelle', r.libelle)",
+    "product": """json_object('sku', r.sku, 'libelle', r.libelle, 'poids_sac_kg', r.poids_sac_kg,
+                    'prix_kg', r.prix_kg, 'prix_sac', r.prix_sac, 'seuil_kg', r.seuil_kg, 'actif', r.actif)""",
+    "movement": """json_object('product_uid', (SELECT uid FROM product WHERE id = r.product_id),
+                    'shop_uid', (SELECT uid FROM shop WHERE id = r.shop_id),
+                    'type', r.type, 'qty_kg', r.qty_kg, 'unit_price_kg', r.unit_price_kg,
+                    'unit_price_sac', r.unit_price_sac, 'cost', r.cost, 'note', r.note, 'created_at', r.created_at)""",
+}
+
+# uid attribué à la création : clé naturelle pour les boutiques et produits
+# (deux bases qui créent « Boutique Nord » parlent de la même), aléatoire sinon.
+# La boutique par défaut (id 1, créée par chaque base) a un uid propre à sa base,
+# voir _lineage : deux boutiques différentes ne fusionnent pas leur stock.
+_NATURAL_UID = {
+    "shop": "'shop:' || NEW.libelle",
+    "product": "'product:' || COALESCE(NEW.sku, NEW.libelle)",
+    "movement": "NULL",
+}
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        origin TEXT NOT NULL,
+        origin_seq INTEGER NOT NULL,
+        entity TEXT NOT NULL,
+        row_uid TEXT NOT NULL,
+        op TEXT NOT NULL,
+        data TEXT,
+        changed_at TEXT NOT NULL,
+        UNIQUE (origin, origin_seq)
+    );
+    CREATE INDEX IF NOT EXISTS idx_change_log_row ON change_log(entity, row_uid);
+
+    CREATE TABLE IF NOT EXISTS sync_flag (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        applying INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT OR IGNORE INTO sync_flag(id, applying) VALUES (1, 0);
+
+    CREATE TABLE IF NOT EXISTS sync_peer (
+        peer_origin TEXT PRIMARY KEY,
+        last_sync_at TEXT NOT NULL,
+        received INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0
+    );
+"""
+
+_LOCAL = "(SELECT value FROM app_setting WHERE key='origin')"
+_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now')"
+_NOT_APPLYING = "(SELECT applying FROM sync_flag WHERE id = 1) = 0"
+
+
+def _log_sql(entity: str, op: str, row_id: str) -> str:
+    data = "NULL" if op == "delete" else _JSON[entity]
+    uid = "OLD.uid" if op == "delete" else "r.uid"
+    source = "(SELECT OLD.uid AS uid)" if op == "delete" else f"{entity} r WHERE r.id = {row_id}"
+    return f"""
+        INSERT INTO change_log(origin, origin_seq, entity, row_uid, op, data, changed_at)
+        SELECT {_LOCAL},
+               (SELECT COALESCE(MAX(origin_seq), 0) + 1 FROM change_log WHERE origin = {_LOCAL}),
+               '{entity}', {uid}, '{op}', {data}, {_NOW}
+        FROM {source};"""
+
+
+def _triggers(entity: str) -> str:
+    random_uid = "lower(hex(randomblob(16)))"
+    natural = _NATURAL_UID[entity]
+    uid_expr = (random_uid if natural == "NULL" else
+                f"CASE WHEN EXISTS (SELECT 1 FROM {entity} WHERE uid = {natural}) THEN {random_uid} ELSE {natural} END")
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS cdc_{entity}_insert AFTER INSERT ON {entity}
+        WHEN {_NOT_APPLYING}
+        BEGIN
+            UPDATE {entity} SET uid = COALESCE(NEW.uid, {uid_expr}) WHERE id = NEW.id;
+            {_log_sql(entity, "insert", "NEW.id")}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS cdc_{entity}_update AFTER UPDATE ON {entity}
+        WHEN {_NOT_APPLYING} AND OLD.uid IS NOT NULL
+        BEGIN
+            {_log_sql(entity, "update", "NEW.id")}
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS cdc_{entity}_delete AFTER DELETE ON {entity}
+        WHEN {_NOT_APPLYING}
+        BEGIN
+            {_log_sql(entity, "delete", "OLD.id")}
+        END;
+    """
+
+
+def _content_uid(*values) -> str:
+    """uid d'une ligne existante, tiré de son contenu (même forme qu'un uid aléatoire)."""
+    return hashlib.sha1("|".join(str(v) for v in values).encode("utf-8")).hexdigest()[:32]
+
+
+def _lineage(cnx: sqlite3.Connection) -> str:
+    """
+    Identité du fichier d'origine d'une base : tirée de son premier mouvement, commune
+    à toutes les copies d'un même fichier ; l'origine (aléatoire) pour une base vide.
+    """
+    first = cnx.execute(
+        """SELECT m.id, m.created_at, m.type, m.qty_kg, COALESCE(p.sku, p.libelle), s.libelle FROM movement m
+            LEFT JOIN product p ON p.id = m.product_id LEFT JOIN shop s ON s.id = m.shop_id
+            ORDER BY m.id LIMIT 1"""
+    ).fetchone()
+    if first is None:
+        return cnx.execute(f"SELECT {_LOCAL}").fetchone()[0][:12]
+    return _content_uid(*first)[:12]
+
+
+def install_change_capture(cnx: sqlite3.Connection):
+    """Crée le journal, les uid et les triggers ; amorce le journal avec les lignes existantes."""
+    cnx.executescript(SCHEMA)
+    if cnx.execute("SELECT value FROM app_setting WHERE key='origin'").fetchone() is None:
+        cnx.execute("INSERT INTO app_setting(key, value) VALUES ('origin', ?)", (uuid.uuid4().hex,))
+
+    for entity in ENTITIES:
+        cols = [r[1] for r in cnx.execute(f"PRAGMA table_info({entity})").fetchall()]
+        if "uid" not in cols:
+            cnx.execute(f"ALTER TABLE {entity} ADD COLUMN uid TEXT")
+        cnx.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{entity}_uid ON {entity}(uid)")
+
+    # Lignes antérieures au journal : uid puis entrée 'insert' d'amorçage.
+    # Les uid sont tirés du contenu : deux copies d'un même fichier, migrées chacune
+    # de leur côté, donnent les mêmes uid et ne dupliquent rien en se synchronisant.
+    pending = any(cnx.execute(f"SELECT 1 FROM {e} WHERE uid IS NULL LIMIT 1").fetchone() for e in ENTITIES)
+    if pending:
+        cnx.execute("""UPDATE shop SET uid = 'shop:' || libelle || CASE WHEN id = 1 THEN '@' || ? ELSE '' END
+                        WHERE uid IS NULL""", (_lineage(cnx),))
+        cnx.execute("""UPDATE product SET uid = 'product:' || COALESCE(sku, libelle) || CASE
+                            WHEN (SELECT COUNT(*) FROM product p2 WHERE COALESCE(p2.sku, p2.libelle) = COALESCE(product.sku, product.libelle)) > 1
+                            THEN ':' || id ELSE '' END
+                        WHERE uid IS NULL""")
+        rows = cnx.execute(
+            """SELECT m.id, m.created_at, p.uid, s.uid FROM movement m
+                LEFT JOIN product p ON p.id = m.product_id LEFT JOIN shop s ON s.id = m.shop_id
+                WHERE m.uid IS NULL"""
+        ).fetchall()
+        cnx.executemany("UPDATE movement SET uid = ? WHERE id = ?", [(_content_uid(*r), r[0]) for r in rows])
+        for entity in ENTITIES:
+            base = cnx.execute(f"SELECT COALESCE(MAX(origin_seq), 0) FROM change_log WHERE origin = {_LOCAL}").fetchone()[0]
+            cnx.execute(f"""
+                INSERT INTO change_log(origin, origin_seq, entity, row_uid, op, data, changed_at)
+                SELECT {_LOCAL}, ? + ROW_NUMBER() OVER (ORDER BY r.id), '{entity}', r.uid, 'insert', {_JSON[entity]}, {_NOW}
+                FROM {entity} r WHERE NOT EXISTS (SELECT 1 FROM change_log c WHERE c.entity = '{entity}' AND c.row_uid = r.uid)
+                ORDER BY r.id""", (base,))
+
+    for entity in ENTITIES:
+        cnx.executescript(_triggers(entity))
+    cnx.commit()
+
+
+# ----------------------------------------------------------------------
+# Échange
+# ----------------------------------------------------------------------
+def origin_of(db) -> str:
+    return db.cnx.execute("SELECT value FROM app_setting WHERE key='origin'").fetchone()[0]
+
+
+def version_vector(db) -> Dict[str, int]:
+    """Dernier numéro de séquence connu, par origine."""
+    rows = db.cnx.execute("SELECT origin, MAX(origin_seq) FROM change_log GROUP BY origin").fetchall()
+    return {r[0]: r[1] for r in rows}
+
+
+def changes_since(db, vector: Dict[str, int]) -> List[Dict]:
+    """Entrées du journal de `db` absentes d'une base dont le vecteur est `vector`."""
+    out: List[Dict] = []
+    for origin, last in version_vector(db).items():
+        known = vector.get(origin, 0)
+        if last <= known:
+            continue
+        rows = db.cnx.execute(
+            "SELECT origin, origin_seq, entity, row_uid, op, data, changed_at FROM change_log WHERE origin=? AND origin_seq>? ORDER BY origin_seq",
+            (origin, known)
+        ).fetchall()
+        out.extend(dict(r) for r in rows)
+    return out
+
+
+def _version_key(c) -> Tuple:
+    return (c["changed_at"], c["origin"], c["origin_seq"])
+
+
+def apply_changes(db, changes: List[Dict]) -> Dict:
+    """
+    Applique des changements reçus à `db`, dans une seule transaction.
+    Retourne le nombre d'entrées appliquées, ignorées (version plus ancienne) et les conflits.
+    """
+    cnx = db.cnx
+    report = {"applied": 0, "skipped": 0, "conflicts": []}
+    touched: Dict[str, Dict] = {e: {"ids": set(), "product_ids": set(), "shop_ids": set()} for e in ENTITIES}
+    todo = sorted(changes, key=_version_key)
+
+    cnx.execute("UPDATE sync_flag SET applying = 1 WHERE id = 1")
+    try:
+        while todo:
+            deferred = []
+            for c in todo:
+                if cnx.execute("SELECT 1 FROM change_log WHERE origin=? AND origin_seq=?", (c["origin"], c["origin_seq"])).fetchone():
+                    continue
+                latest = cnx.execute(
+                    """SELECT changed_at, origin, origin_seq FROM change_log WHERE entity=? AND row_uid=?
+                        ORDER BY changed_at DESC, origin DESC, origin_seq DESC LIMIT 1""",
+                    (c["entity"], c["row_uid"])
+                ).fetchone()
+                if latest is not None and _version_key(latest) > _version_key(c):
+                    report["skipped"] += 1
+                else:
+                    try:
+                        if not _apply_one(db, c, touched):
+                            deferred.append(c)
+                            continue
+                        report["applied"] += 1
+                    except sqlite3.IntegrityError as e:
+                        report["conflicts"].append({"entity": c["entity"], "uid": c["row_uid"], "error": str(e)})
+                _record(cnx, c)
+            if len(deferred) == len(todo):
+                # Références introuvables : consignées comme conflits pour ne pas bloquer la suite
+                for c in deferred:
+                    report["conflicts"].append({"entity": c["entity"], "uid": c["row_uid"], "error": "référence manquante"})
+                    _record(cnx, c)
+                break
+            todo = deferred
+        cnx.execute("UPDATE sync_flag SET applying = 0 WHERE id = 1")
+        cnx.commit()
+    except Exception:
+        cnx.rollback()
+        cnx.execute("UPDATE sync_flag SET applying = 0 WHERE id = 1")
+        cnx.commit()
+        raise
+
+    db.invalidate_refs()
+    for entity, t in touched.items():
+        if t["ids"]:
+            db._publish(entity, "update", sorted(t["ids"]), product_ids=t["product_ids"], shop_ids=t["shop_ids"])
+    return report
+
+
+def _record(cnx: sqlite3.Connection, c: Dict):
+    cnx.execute(
+        "INSERT INTO change_log(origin, origin_seq, entity, row_uid, op, data, changed_at) VALUES (?,?,?,?,?,?,?)",
+        (c["origin"], c["origin_seq"], c["entity"], c["row_uid"], c["op"], c["data"], c["changed_at"])
+    )
+
+
+def _local_id(cnx: sqlite3.Connection, entity: str, uid: str):
+    r = cnx.execute(f"SELECT id FROM {entity} WHERE uid=?", (uid,)).fetchone()
+    return r[0] if r else None
+
+
+def _shop_label(cnx: sqlite3.Connection, libelle: str, uid: str, local_id) -> str:
+    """
+    Libellé d'une boutique reçue : une autre boutique du même nom (la boutique par
+    défaut de chaque base) reste distincte, suffixée par la fin de son uid.
+    """
+    taken = cnx.execute("SELECT id FROM shop WHERE libelle=? AND id IS NOT ?", (libelle, local_id)).fetchone()
+    return f"{libelle} ({uid.rsplit('@', 1)[-1][:6]})" if taken else libelle
+
+
+def _apply_one(db, c: Dict, touched: Dict) -> bool:
+    """Applique un changement ; False si une référence (produit, boutique) manque encore."""
+    cnx = db.cnx
+    entity, uid = c["entity"], c["row_uid"]
+    data = json.loads(c["data"]) if c["data"] else {}
+    local_id = _local_id(cnx, entity, uid)
+    t = touched[entity]
+
+    if c["op"] == "delete":
+        if local_id is not None:
+            cnx.execute(f"DELETE FROM {entity} WHERE id=?", (local_id,))
+            t["ids"].add(local_id)
+        return True
+
+    if entity == "shop":
+        libelle = _shop_label(cnx, data["libelle"], uid, local_id)
+        if local_id is None:
+            local_id = cnx.execute("INSERT INTO shop(uid, libelle) VALUES (?,?)", (uid, libelle)).lastrowid
+        else:
+            cnx.execute("UPDATE shop SET libelle=? WHERE id=?", (libelle, local_id))
+        t["ids"].add(local_id)
+        t["shop_ids"].add(local_id)
+        return True
+
+    if entity == "product":
+        values = (data["sku"], data["libelle"], data["poids_sac_kg"], data["prix_kg"], data["prix_sac"], data["seuil_kg"], data["actif"])
+        if local_id is None:
+            local_id = cnx.execute(
+                "INSERT INTO product(sku, libelle, poids_sac_kg, prix_kg, prix_sac, seuil_kg, actif, uid) VALUES (?,?,?,?,?,?,?,?)",
+                values + (uid,)
+            ).lastrowid
+        else:
+            cnx.execute(
+                "UPDATE product SET sku=?, libelle=?, poids_sac_kg=?, prix_kg=?, prix_sac=?, seuil_kg=?, actif=? WHERE id=?",
+                values + (local_id,)
+            )
+        t["ids"].add(local_id)
+        t["product_ids"].add(local_id)
+        return True
+
+    # Mouvement : les tables dérivées (valorisation, consommation) suivent comme pour une saisie locale
+    pid = _local_id(cnx, "product", data["product_uid"]) if data.get("product_uid") else None
+    sid = _local_id(cnx, "shop", data["shop_uid"]) if data.get("shop_uid") else None
+    if pid is None or sid is None:
+        return False
+    values = (pid, sid, data["type"], data["qty_kg"], data["unit_price_kg"], data["unit_price_sac"], data["cost"], data["note"])
+    if local_id is None:
+        local_id = cnx.execute(
+            "INSERT INTO movement(product_id, shop_id, type, qty_kg, unit_price_kg, unit_price_sac, cost, note, created_at, uid) VALUES (?,?,?,?,?,?,?,?,?,?)",
+            values + (data["created_at"], uid)
+        ).lastrowid
+        db.valuation.on_insert(local_id)
+        new = db.get_movement(local_id)
+        db.consumption.on_insert(new)
+        db.checkpoints.on_insert(new)
+    else:
+        old = db.get_movement(local_id)
+        cnx.execute(
+            "UPDATE movement SET product_id=?, shop_id=?, type=?, qty_kg=?, unit_price_kg=?, unit_price_sac=?, cost=?, note=? WHERE id=?",
+            values + (local_id,)
+        )
+        db.valuation.on_update(local_id, (old["product_id"], old["shop_id"]))
+        new = db.get_movement(local_id)
+        db.consumption.on_update(old, new)
+        db.checkpoints.on_update(old, new)
+        t["product_ids"].add(old["product_id"])
+        t["shop_ids"].add(old["shop_id"])
+    t["ids"].add(local_id)
+    t["product_ids"].add(pid)
+    t["shop_ids"].add(sid)
+    return True
+
+
+def sync_databases(local, peer) -> Dict:
+    """Échange dans les deux sens les seuls changements manquants à chaque base."""
+    received = apply_changes(local, changes_since(peer, version_vector(local)))
+    sent = apply_changes(peer, changes_since(local, version_vector(peer)))
+    now = datetime.now().isoformat(timespec="seconds")
+    for db, other, r, s in ((local, peer, received, sent), (peer, local, sent, received)):
+        db.cnx.execute(
+            """INSERT INTO sync_peer(peer_origin, last_sync_at, received, sent) VALUES (?,?,?,?)
+                ON CONFLICT(peer_origin) DO UPDATE SET last_sync_at=excluded.last_sync_at,
+                    received=received + excluded.received, sent=sent + excluded.sent""",
+            (origin_of(other), now, r["applied"], s["applied"])
+        )
+        db.cnx.commit()
+    return {"received": received, "sent": sent}
+
+
+def main(argv=None):
+    from db import Database
+    parser = argparse.ArgumentParser(description="Synchronise deux bases Provenderie (échange des seuls changements)")
+    parser.add_argument("local", help="base locale, ex. provenderie.db")
+    parser.add_argument("peer", help="base de l'autre boutique")
+    args = parser.parse_args(argv)
+    report = sync_databases(Database(args.local), Database(args.peer))
+    for direction in ("received", "sent"):
+        r = report[direction]
+        print(f"{'Reçus' if direction == 'received' else 'Envoyés'} : {r['applied']} appliqués, "
+              f"{r['skipped']} ignorés, {len(r['conflicts'])} conflits")
+        for c in r["conflicts"]:
+            print(f"  conflit {c['entity']} {c['uid']} : {c['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Modules à la racine du dépôt (pas de paquet) : importables depuis les tests
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,8 @@
+import crosscheck
+
+
+def test_fast_paths_match_naive_queries_and_rebuild():
+    # Graines fixes (coût moyen et FIFO) : un échec se rejoue avec
+    # python crosscheck.py --seed <graine> --runs 1 -v
+    r = crosscheck.run(runs=4, ops=60, seed=20240131)
+    assert r["checks"] == 4 * 61
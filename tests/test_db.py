@@ -0,0 +1,53 @@
+import sqlite3
+
+import pytest
+
+from db import Database
+
+
+def test_failed_write_releases_the_lock(tmp_path):
+    path = str(tmp_path / "p.db")
+    db = Database(path)
+    pid = db.add_product("MAIS-50", "Maïs", 50.0, 300.0, 15000.0, 0.0)
+    with pytest.raises(sqlite3.IntegrityError):
+        db.add_movement(pid, 999, "IN", 5, 300.0)   # boutique inconnue (clé étrangère)
+    assert not db.cnx.in_transaction
+
+    # Un autre poste écrit sans attendre le verrou
+    other = Database(path, busy_timeout=0.1)
+    other.add_movement(pid, 1, "IN", 5, 300.0, cost=1500)
+    # La transaction annulée n'a laissé aucune trace dans les tables dérivées
+    assert db.cnx.execute("SELECT COUNT(*) FROM movement_cost").fetchone()[0] == 1
+    assert db.stock_value(shop_id=1) == 1500
+
+
+def _legacy_schema(path):
+    """Base de la première version : ni prix au sac, ni coût, ni table dérivée."""
+    cnx = sqlite3.connect(path)
+    cnx.executescript("""
+        CREATE TABLE shop (id INTEGER PRIMARY KEY AUTOINCREMENT, libelle TEXT NOT NULL UNIQUE);
+        CREATE TABLE product (id INTEGER PRIMARY KEY AUTOINCREMENT, sku TEXT UNIQUE, libelle TEXT NOT NULL,
+            poids_sac_kg REAL NOT NULL DEFAULT 50, prix_kg REAL NOT NULL DEFAULT 0, prix_sac REAL NOT NULL DEFAULT 0,
+            seuil_kg REAL NOT NULL DEFAULT 0, actif INTEGER NOT NULL DEFAULT 1);
+        CREATE TABLE movement (id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER NOT NULL, shop_id INTEGER NOT NULL,
+            type TEXT NOT NULL, qty_kg REAL NOT NULL, unit_price_kg REAL, note TEXT, created_at TEXT NOT NULL);
+        INSERT INTO shop VALUES (1, 'Boutique Principale');
+        INSERT INTO product(sku, libelle) VALUES ('MAIS-50', 'Maïs');
+        INSERT INTO movement(product_id, shop_id, type, qty_kg, unit_price_kg, created_at)
+            VALUES (1, 1, 'IN', 100, 300, '2024-01-05T10:00:00');
+    """)
+    cnx.commit()
+    cnx.close()
+
+
+def test_readonly_command_migrates_an_old_base(tmp_path):
+    from types import SimpleNamespace
+    from provenderie import _open
+    path = str(tmp_path / "ancienne.db")
+    _legacy_schema(path)
+    db = _open(SimpleNamespace(db=path, readonly=True))
+    assert db.readonly
+    assert db.total_stock_kg(1) == 100
+
+    with pytest.raises(SystemExit, match="Base introuvable"):
+        _open(SimpleNamespace(db=str(tmp_path / "absente.db"), readonly=True))
@@ -0,0 +1,59 @@
+import shutil
+import sqlite3
+
+from db import Database
+from sync import ENTITIES, sync_databases
+
+
+def _legacy_file(path, qty=5):
+    """Base telle qu'avant le journal des changements : ni uid, ni change_log, ni origine."""
+    db = Database(str(path))
+    pid = db.add_product("MAIS-50", "Maïs", 50.0, 300.0, 15000.0, 0.0)
+    db.add_movement(pid, 1, "IN", qty, 300.0)
+    for _ in range(4):
+        db.add_movement(pid, 1, "OUT", -1, 300.0)
+    db.cnx.close()
+    cnx = sqlite3.connect(path)
+    for (name,) in cnx.execute("SELECT name FROM sqlite_master WHERE type='trigger' AND name LIKE 'cdc_%'").fetchall():
+        cnx.execute(f"DROP TRIGGER {name}")
+    for entity in ENTITIES:
+        cnx.execute(f"DROP INDEX idx_{entity}_uid")
+        cnx.execute(f"ALTER TABLE {entity} DROP COLUMN uid")
+    cnx.execute("DROP TABLE change_log")
+    cnx.execute("DELETE FROM app_setting WHERE key='origin'")
+    cnx.commit()
+    cnx.close()
+
+
+def _counts(db):
+    return {e: db.cnx.execute(f"SELECT COUNT(*) FROM {e}").fetchone()[0] for e in ENTITIES}
+
+
+def test_copies_of_one_file_do_not_duplicate(tmp_path):
+    _legacy_file(tmp_path / "source.db")
+    shutil.copy(tmp_path / "source.db", tmp_path / "a.db")
+    shutil.copy(tmp_path / "source.db", tmp_path / "b.db")
+    a, b = Database(str(tmp_path / "a.db")), Database(str(tmp_path / "b.db"))
+    before = _counts(a)
+    assert before == _counts(b)
+
+    sync_databases(a, b)
+
+    for db in (a, b):
+        assert _counts(db) == before
+        assert db.total_stock_kg(1) == 1
+
+
+def test_default_shops_of_two_files_stay_apart(tmp_path):
+    # Deux boutiques distinctes : chacune sa « Boutique Principale » (id 1), même produit
+    _legacy_file(tmp_path / "a.db", qty=5)
+    _legacy_file(tmp_path / "b.db", qty=8)
+    a, b = Database(str(tmp_path / "a.db")), Database(str(tmp_path / "b.db"))
+
+    sync_databases(a, b)
+
+    assert a.total_stock_kg(1) == 1
+    assert b.total_stock_kg(1) == 4
+    for db in (a, b):
+        assert len(db.list_shops()) == 2
+        assert db.cnx.execute("SELECT COUNT(*) FROM movement").fetchone()[0] == 10
@@ -0,0 +1,67 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from db import Database
+
+# Fenêtres Tk réelles : il faut un écran (ou un serveur X virtuel, ex. xvfb-run)
+pytestmark = pytest.mark.skipif(sys.platform != "win32" and not os.environ.get("DISPLAY"),
+                                reason="pas d'écran (DISPLAY)")
+
+PAGES = ("DashboardPage", "ProductsPage", "MovementsPage", "InventoryPage", "ReportsPage", "SettingsPage")
+DIALOGS = ("ProductDialog", "MovementDialog", "CatalogueImportDialog", "LoginDialog")
+
+
+def _sample_db(path) -> str:
+    db = Database(str(path))
+    pid = db.add_product("MAIS-50", "Maïs", 50.0, 300.0, 15000.0, 20.0)
+    db.add_movement(pid, 1, "IN", 100, 300.0, cost=30000)
+    db.add_movement(pid, 1, "OUT", -30, 300.0, cost=9000)
+    db.cnx.close()
+    return str(path)
+
+
+def test_navigation_leaves_counters_flat(tmp_path):
+    from diagnostics import COUNTERS, navigation_check
+    warmup = 2
+    tracker = navigation_check(_sample_db(tmp_path / "p.db"), cycles=5, rebuild=True, warmup=warmup)
+    growth = tracker.growth(warmup)
+    assert set(PAGES + DIALOGS) <= set(growth)
+    leaks = {f"{label} : {k}": g[k] for label, g in growth.items() for k in COUNTERS if g[k] > 0}
+    assert leaks == {}
+
+
+def test_base_page_unsubscribes_on_destroy(tmp_path):
+    import ttkbootstrap as ttk
+    from ui.base import BasePage
+
+    class Page(BasePage):
+        watch = ("product",)
+
+        def build(self):
+            self.var = ttk.StringVar(value="")
+            ttk.Entry(self, textvariable=self.var).pack()
+
+        def on_change(self, events):
+            calls.append(events)
+
+    calls = []
+    db = Database(str(tmp_path / "p.db"))
+    root = ttk.Window()
+    try:
+        before = len(db.events._subscribers)
+        page = Page(root, SimpleNamespace(db=db))
+        page.pack()
+        page.on_show()
+        root.update()
+        assert len(db.events._subscribers) == before + 1
+
+        page.destroy()
+        root.update()
+        assert len(db.events._subscribers) == before
+        db.add_product("MAIS-50", "Maïs", 50.0, 300.0, 15000.0, 0.0)
+        assert calls == []
+    finally:
+        root.destroy()
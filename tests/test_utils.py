@@ -0,0 +1,11 @@
+import pytest
+
+import utils
+
+
+@pytest.mark.parametrize("weight", [0.0, -1.0, 50.0])
+@pytest.mark.parametrize("order", [(-0.0, 0.0), (0.0, -0.0)])
+def test_bag_repr_batch_matches_scalar_for_signed_zero(weight, order):
+    utils._REPR_CACHE.clear()
+    assert utils.kg_to_bag_repr_batch(order, [weight] * 2) == [utils.kg_to_bag_repr(q, weight) for q in order]
+    assert utils.kg_to_bag_repr(-0.0, weight) == utils.kg_to_bag_repr(0.0, weight)
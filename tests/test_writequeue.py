@@ -0,0 +1,29 @@
+import json
+
+from db import Database
+from writequeue import WriteQueue
+
+
+def test_rejected_movements_survive_close_and_replay(tmp_path):
+    db = Database(str(tmp_path / "p.db"))
+    recovery = tmp_path / "mouvements-a-rejouer.json"
+    writes = WriteQueue(db)
+    pid = db.add_product("MAIS-50", "Maïs", 50.0, 300.0, 15000.0, 0.0)
+    writes.submit(pid, 1, "IN", 10, 300.0, cost=3000)
+    writes.submit(pid + 1, 1, "IN", 5, 300.0, cost=1500)   # produit pas encore créé
+    ticket_time = writes.pending()[1][1]["created_at"]
+
+    rejected = writes.close(recovery)
+    assert len(rejected) == 1
+    assert [i["product_id"] for i in json.loads(recovery.read_text(encoding="utf-8"))] == [pid + 1]
+
+    # Toujours refusé : reste dans le fichier
+    entries = WriteQueue(db).replay(recovery)
+    assert isinstance(entries[0][2], Exception) and recovery.exists()
+
+    db.add_product("SOJA-50", "Soja", 50.0, 400.0, 20000.0, 0.0)
+    entries = WriteQueue(db).replay(recovery)
+    assert not isinstance(entries[0][2], Exception)
+    assert not recovery.exists()
+    assert db.get_movement(entries[0][2])["created_at"] == ticket_time
+    assert db.total_stock_kg(1) == 15
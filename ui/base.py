@@ -1,9 +1,111 @@
 import ttkbootstrap as ttk
+from typing import Dict
+
+
+def _sort_value(text: str):
+    """Valeur de tri d'une cellule formatée (« 1,234.50 », « 12.3% ») : nombre si possible, sinon texte."""
+    try:
+        return (0, float(text.replace(",", "").replace(" ", "").rstrip("%")), "")
+    except ValueError:
+        return (1, 0.0, text.lower())
+
+
+def bind_local_sort(tree):
+    """
+    Tri par clic sur l'en-tête, fait sur les lignes déjà affichées.
+    Réservé aux petits tableaux calculés (agrégats) ; les listes issues de la base
+    utilisent BasePage.bind_sort, qui relance la requête.
+    """
+    texts = {c: tree.heading(c, "text") for c in tree["columns"]}
+    state = {"col": None, "desc": False}
+
+    def sort_by(col):
+        state["desc"] = not state["desc"] if state["col"] == col else False
+        state["col"] = col
+        rows = [(_sort_value(str(tree.set(iid, col))), iid) for iid in tree.get_children("")]
+        rows.sort(reverse=state["desc"])
+        for index, (_, iid) in enumerate(rows):
+            tree.move(iid, "", index)
+        for c, text in texts.items():
+            tree.heading(c, text=text + ((" ▼" if state["desc"] else " ▲") if c == col else ""))
+
+    for c in tree["columns"]:
+        tree.heading(c, command=lambda c=c: sort_by(c))
 
 class BasePage(ttk.Frame):
+    # Entités ('product', 'shop', 'movement') dont les changements concernent la page
+    watch = ()
+
     def __init__(self, parent, app):
         super().__init__(parent)
         self.app = app
+        self.built = False
+        self.pending = []
+        self._unsubscribe = app.db.events.subscribe(self._on_event, self.watch) if self.watch else None
+        self.bind("<Destroy>", self._on_destroy, add="+")
 
     def on_show(self):
-        pass
\ No newline at end of file
+        """
+        Construit la page au premier affichage ; ensuite, n'applique que
+        les changements reçus pendant qu'elle était masquée.
+        """
+        if not self.built:
+            self.build()
+            self.built = True
+            self.pending = []
+            self.refresh()
+        elif self.pending:
+            events, self.pending = self.pending, []
+            self.on_change(events)
+
+    def build(self):
+        pass
+
+    def bind_sort(self, tree, sortable: Dict[str, str], key: str, descending: bool = False):
+        """
+        Rend cliquables les en-têtes de `sortable` (colonne -> clé de tri de la base).
+        Un clic change self.sort_key / self.sort_desc puis appelle on_sort, qui relance la requête.
+        """
+        self.sort_tree = tree
+        self.sortable = sortable
+        self.sort_key, self.sort_desc = key, descending
+        self._heading_texts = {c: tree.heading(c, "text") for c in tree["columns"]}
+        for col in sortable:
+            tree.heading(col, command=lambda c=col: self._sort_by(c))
+        self._show_sort()
+
+    def _sort_by(self, col: str):
+        key = self.sortable[col]
+        self.sort_desc = not self.sort_desc if key == self.sort_key else False
+        self.sort_key = key
+        self._show_sort()
+        self.on_sort()
+
+    def _show_sort(self):
+        for col, text in self._heading_texts.items():
+            arrow = (" ▼" if self.sort_desc else " ▲") if self.sortable.get(col) == self.sort_key else ""
+            self.sort_tree.heading(col, text=text + arrow)
+
+    def on_sort(self):
+        self.refresh()
+
+    def refresh(self):
+        pass
+
+    def on_change(self, events):
+        """Réagit à une liste de ChangeEvent ; par défaut, rafraîchit toute la page."""
+        self.refresh()
+
+    def _on_event(self, event):
+        if not self.built:
+            return
+        self.pending.append(event)
+        # Page masquée : rien n'est recalculé avant le prochain affichage
+        if self.winfo_ismapped():
+            events, self.pending = self.pending, []
+            self.on_change(events)
+
+    def _on_destroy(self, event):
+        if event.widget is self and self._unsubscribe:
+            self._unsubscribe()
+            self._unsubscribe = None
@@ -0,0 +1,66 @@
+import time
+import numpy as np
+import ttkbootstrap as ttk
+from analytics import lttb
+
+
+class Sparkline(ttk.Canvas):
+    """
+    Courbe compacte sur un Canvas. La série complète est gardée en mémoire ;
+    à chaque dessin elle est réduite (LTTB) à un point par pixel de largeur,
+    et tracée en une seule ligne : le nombre d'objets du Canvas ne dépend pas
+    de la longueur de l'historique.
+    """
+
+    PAD = 4
+
+    def __init__(self, master, color: str = "primary", height: int = 70, fmt: str = "{:,.0f}", **kw):
+        super().__init__(master, height=height, highlightthickness=0, **kw)
+        self.color = color
+        self.fmt = fmt
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.points = 0        # points réellement tracés au dernier dessin
+        self.draw_ms = 0.0
+        self.bind("<Configure>", lambda e: self.redraw())
+        self.bind("<<ThemeChanged>>", lambda e: self.redraw(), add="+")
+
+    def set_series(self, x, y):
+        self.x = np.asarray(x)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.redraw()
+
+    def redraw(self):
+        t = time.perf_counter()
+        self.delete("all")
+        colors = ttk.Style().colors
+        self.configure(background=colors.bg)
+        w, h = self.winfo_width(), self.winfo_height()
+        if w <= 2 * self.PAD or len(self.x) == 0:
+            self.points = 0
+            return
+        label_w = 80
+        plot_w = max(w - label_w - 2 * self.PAD, 10)
+        xs, ys = lttb(self.x, self.y, plot_w)
+        x0, x1 = float(self.x[0]), float(self.x[-1])
+        lo, hi = float(self.y.min()), float(self.y.max())
+        span_x = (x1 - x0) or 1.0
+        span_y = (hi - lo) or 1.0
+        px = self.PAD + (xs - x0) / span_x * plot_w
+        py = self.PAD + (hi - ys) / span_y * (h - 2 * self.PAD)
+        color = getattr(colors, self.color, self.color)
+        if lo < 0 < hi:
+            zero = self.PAD + hi / span_y * (h - 2 * self.PAD)
+            self.create_line(self.PAD, zero, self.PAD + plot_w, zero, fill=colors.border, dash=(2, 2))
+        if len(px) == 1:
+            self.create_oval(px[0] - 2, py[0] - 2, px[0] + 2, py[0] + 2, fill=color, outline=color)
+        else:
+            self.create_line(*np.column_stack((px, py)).ravel().tolist(), fill=color, width=1.5)
+        self.create_oval(px[-1] - 2, py[-1] - 2, px[-1] + 2, py[-1] + 2, fill=color, outline=color)
+        text_x = self.PAD * 2 + plot_w
+        self.create_text(text_x, self.PAD, text=self.fmt.format(hi), anchor="nw", fill=colors.secondary, font="-size 8")
+        self.create_text(text_x, h / 2, text=self.fmt.format(float(self.y[-1])), anchor="w", fill=colors.fg,
+                         font="-size 10 -weight bold")
+        self.create_text(text_x, h - self.PAD, text=self.fmt.format(lo), anchor="sw", fill=colors.secondary, font="-size 8")
+        self.points = len(xs)
+        self.draw_ms = (time.perf_counter() - t) * 1000
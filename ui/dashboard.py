@@ -1,11 +1,16 @@
 import ttkbootstrap as ttk
+from datetime import date, timedelta
 from ttkbootstrap.constants import *
 from .base import BasePage
+from .charts import Sparkline
+from analytics import daily_grid
+
+# Fenêtres proposées pour les tendances (libellé -> jours, None = tout l'historique)
+TREND_PERIODS = {"90 jours": 90, "1 an": 365, "3 ans": 3 * 365, "Tout": None}
 
 # Dans la classe DashboardPage
 class DashboardPage(BasePage):
-    def on_show(self):
-        self.build()
+    watch = ("product", "shop", "movement")
 
     def build(self):
         for w in self.winfo_children():
@@ -13,14 +18,97 @@ class DashboardPage(BasePage):
 
         cards = ttk.Frame(self)
         cards.pack(fill=X)
+        self.metric_vars = {}
         metrics = [
-            ("Stock total (kg)", f"{self.app.db.total_stock_kg(1):.2f}", "primary"),
-            ("Nombre de produits", str(len(self.app.db.list_products())), "success"),
-            ("Boutiques", str(len(self.app.db.list_shops())), "info"),
+            ("stock", "Stock total (kg)", "primary"),
+            ("value", "Valeur du stock (FCFA)", "warning"),
+            ("products", "Nombre de produits", "success"),
+            ("shops", "Boutiques", "info"),
         ]
-        for title, value, style in metrics:
+        for key, title, style in metrics:
             f = ttk.Frame(cards, padding=15, bootstyle=style)
             f.pack(side=LEFT, padx=10, pady=10, fill=X, expand=YES)
+            self.metric_vars[key] = ttk.StringVar()
             # Utilise le nouveau style pour les étiquettes
             ttk.Label(f, text=title, font="-size 12 -weight bold", style="Card.TLabel").pack(anchor=W)
-            ttk.Label(f, text=value, font="-size 16 -weight bold", style="Card.TLabel").pack(anchor=W)
\ No newline at end of file
+            ttk.Label(f, textvariable=self.metric_vars[key], font="-size 16 -weight bold", style="Card.TLabel").pack(anchor=W)
+
+        # Tendances : stock et ventes journalières
+        box = ttk.Labelframe(self, text="Tendances")
+        box.pack(fill=X, padx=10, pady=10)
+        f = ttk.Frame(box); f.pack(fill=X, padx=10, pady=(8, 4))
+        self.trend_shop_var = ttk.StringVar()
+        self.trend_product_var = ttk.StringVar(value="Tous les produits")
+        self.trend_period_var = ttk.StringVar(value="1 an")
+        ttk.Label(f, text="Boutique").pack(side=LEFT, padx=(0, 6))
+        self.trend_shop_cb = ttk.Combobox(f, textvariable=self.trend_shop_var, width=22, state="readonly")
+        self.trend_shop_cb.pack(side=LEFT)
+        ttk.Label(f, text="Produit").pack(side=LEFT, padx=(10, 6))
+        self.trend_product_cb = ttk.Combobox(f, textvariable=self.trend_product_var, width=30, state="readonly")
+        self.trend_product_cb.pack(side=LEFT)
+        ttk.Label(f, text="Période").pack(side=LEFT, padx=(10, 6))
+        ttk.Combobox(f, values=list(TREND_PERIODS), textvariable=self.trend_period_var, width=9, state="readonly").pack(side=LEFT)
+        for cb in f.winfo_children():
+            if isinstance(cb, ttk.Combobox):
+                cb.bind("<<ComboboxSelected>>", lambda e: self.refresh_trends())
+        self.trend_info_var = ttk.StringVar(value="")
+        ttk.Label(f, textvariable=self.trend_info_var, bootstyle="secondary").pack(side=RIGHT)
+
+        self.sparklines = {}
+        for key, title, color in (("stock", "Stock (kg)", "primary"), ("sales", "Ventes / jour (FCFA)", "success")):
+            row = ttk.Frame(box); row.pack(fill=X, padx=10, pady=4)
+            ttk.Label(row, text=title, width=20).pack(side=LEFT, anchor=N)
+            self.sparklines[key] = Sparkline(row, color=color)
+            self.sparklines[key].pack(side=LEFT, fill=X, expand=YES)
+        self._fill_trend_choices()
+
+    def _fill_trend_choices(self):
+        self.trend_shops = {s["libelle"]: s["id"] for s in self.app.db.list_shops()}
+        self.trend_products = {p["libelle"]: p["id"] for p in self.app.db.list_products()}
+        self.trend_shop_cb.configure(values=["Toutes"] + list(self.trend_shops))
+        self.trend_product_cb.configure(values=["Tous les produits"] + list(self.trend_products))
+        if self.trend_shop_var.get() not in self.trend_shops and self.trend_shop_var.get() != "Toutes":
+            self.trend_shop_var.set(next(iter(self.trend_shops), "Toutes"))
+        if self.trend_product_var.get() not in self.trend_products:
+            self.trend_product_var.set("Tous les produits")
+
+    def refresh(self):
+        self.metric_vars["stock"].set(f"{self.app.db.total_stock_kg(1):.2f}")
+        self.metric_vars["value"].set(f"{self.app.db.stock_value(1):,.0f}")
+        self.metric_vars["products"].set(str(len(self.app.db.list_products())))
+        self.metric_vars["shops"].set(str(len(self.app.db.list_shops())))
+        self.refresh_trends()
+
+    def _trend_filters(self):
+        days = TREND_PERIODS.get(self.trend_period_var.get())
+        return (self.trend_products.get(self.trend_product_var.get()),
+                self.trend_shops.get(self.trend_shop_var.get()),
+                (date.today() - timedelta(days=days)).isoformat() if days else None)
+
+    def refresh_trends(self):
+        """Agrégats journaliers (une requête, en cache) puis réduction au pixel dans chaque Sparkline."""
+        product_id, shop_id, date_from = self._trend_filters()
+        rows = self.app.db.daily_series(product_id=product_id, shop_id=shop_id, date_from=date_from)
+        days, sales, stock = daily_grid(rows, date_from)
+        self.sparklines["stock"].set_series(days, stock)
+        self.sparklines["sales"].set_series(days, sales)
+        points = max(s.points for s in self.sparklines.values())
+        self.trend_info_var.set(f"{len(days)} jours, {points} points tracés" if len(days) else "Aucun mouvement")
+
+    def on_change(self, events):
+        """Seuls les agrégats concernés sont recalculés."""
+        entities = {e.entity for e in events}
+        if "movement" in entities:
+            self.metric_vars["stock"].set(f"{self.app.db.total_stock_kg(1):.2f}")
+            self.metric_vars["value"].set(f"{self.app.db.stock_value(1):,.0f}")
+        if "product" in entities:
+            self.metric_vars["products"].set(str(len(self.app.db.list_products())))
+        if "shop" in entities:
+            self.metric_vars["shops"].set(str(len(self.app.db.list_shops())))
+        if entities & {"product", "shop"}:
+            self._fill_trend_choices()
+        product_id, shop_id, _ = self._trend_filters()
+        if any(e.entity != "movement"
+               or ((product_id is None or product_id in e.product_ids) and (shop_id is None or shop_id in e.shop_ids))
+               for e in events):
+            self.refresh_trends()
@@ -5,6 +5,7 @@ from utils import safe_float
 from ttkbootstrap import DateEntry
 from typing import Optional, Dict
 from utils import kg_to_bag_repr
+import catalogue
 
 class ProductDialog:
     def __init__(self, app, product=None, on_saved=None):
@@ -73,13 +74,67 @@ class ProductDialog:
             Messagebox.show_error(str(e), "Erreur")
 
 
+class CatalogueImportDialog(ttk.Toplevel):
+    """Aperçu des différences d'un import de catalogue (CSV par SKU) avant écriture."""
+
+    def __init__(self, parent, diff: Dict, path: str):
+        super().__init__(parent)
+        self.title("Import du catalogue")
+        self.transient(parent)
+        self.grab_set()
+        self.app = parent
+        self.diff = diff
+
+        frm = ttk.Frame(self, padding=15)
+        frm.pack(fill=BOTH, expand=YES)
+        ttk.Label(frm, text=path, font="-size 10 -weight bold").pack(anchor=W)
+        ttk.Label(frm, text=(
+            f"{diff['new']} nouveaux, {diff['changed']} modifiés, {diff['unchanged']} inchangés, "
+            f"{len(diff['errors'])} lignes en erreur"
+        )).pack(anchor=W, pady=(4, 10))
+
+        tree = ttk.Treeview(frm, columns=("sku", "statut", "details"), show="headings", height=18)
+        tree.heading("sku", text="SKU")
+        tree.heading("statut", text="Statut")
+        tree.heading("details", text="Changements")
+        tree.column("sku", width=120)
+        tree.column("statut", width=90)
+        tree.column("details", width=560)
+        tree.pack(fill=BOTH, expand=YES)
+        for e in diff["errors"]:
+            tree.insert("", END, values=(e["sku"], "erreur", f"ligne {e['line'] or '-'} : {e['error']}"))
+        for r in diff["rows"]:
+            if r["status"] == "inchangé":
+                continue
+            details = ", ".join(
+                f"{c}: {new}" if r["status"] == "nouveau" else f"{c}: {old} → {new}"
+                for c, (old, new) in r["changes"].items()
+            )
+            tree.insert("", END, values=(r["sku"], r["status"], details))
+
+        btns = ttk.Frame(frm)
+        btns.pack(fill=X, pady=(10, 0))
+        ttk.Button(btns, text="Annuler", bootstyle="secondary", command=self.destroy).pack(side=RIGHT)
+        ttk.Button(btns, text="Appliquer", bootstyle="success", command=self.apply,
+                   state="normal" if diff["new"] or diff["changed"] else "disabled").pack(side=RIGHT, padx=(0, 10))
+
+    def apply(self):
+        try:
+            n = catalogue.apply(self.app.db, self.diff)
+            Messagebox.show_info(f"{n} produits enregistrés.", "Import terminé", parent=self)
+            self.destroy()
+        except Exception as e:
+            Messagebox.show_error(str(e), "Erreur", parent=self)
+
+
 class MovementDialog(ttk.Toplevel):
-    def __init__(self, parent, on_saved, movement_data=None, product=None, mtype=None, shop=None):
+    def __init__(self, parent, on_saved=None, movement_data=None, product=None, mtype=None, shop=None):
         """
         Initialise le dialogue de mouvement.
         
         :param parent: La fenêtre parente (généralement la fenêtre principale de l'application).
-        :param on_saved: La fonction de rappel à exécuter après un enregistrement réussi.
+        :param on_saved: (Optionnel) Fonction de rappel après un enregistrement réussi.
+                         Les pages sont déjà notifiées par les événements de la base.
         :param movement_data: (Optionnel) Un dictionnaire contenant les données d'un mouvement existant à modifier.
         """
         super().__init__(parent)
@@ -283,6 +338,8 @@ class MovementDialog(ttk.Toplevel):
 
             # Vérifier si c'est une mise à jour ou un nouvel enregistrement
             if self.movement_data:
+                # Les saisies en attente passent d'abord, pour garder l'ordre des écritures
+                self.app.writes.flush()
                 # Mise à jour du mouvement existant
                 self.app.db.update_movement(
                     mid=self.movement_data.get('id'), # Correction ici: utilisation de 'mid'
@@ -296,8 +353,8 @@ class MovementDialog(ttk.Toplevel):
                     note=note
                 )
             else:
-                # Enregistrement d'un nouveau mouvement
-                self.app.db.add_movement(
+                # Nouveau mouvement : accepté tout de suite, écrit avec le prochain lot
+                self.app.writes.submit(
                     product_id=self.product["id"],
                     shop_id=shop_id,
                     mtype=mtype,
@@ -309,7 +366,8 @@ class MovementDialog(ttk.Toplevel):
                 )
             
             self.result = "saved"
-            self.on_saved()
+            if callable(self.on_saved):
+                self.on_saved()
             self.destroy()
 
         except ValueError:
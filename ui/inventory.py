@@ -1,14 +1,14 @@
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from ttkbootstrap.dialogs import Messagebox
+from ttkbootstrap import DateEntry
 from .base import BasePage
-from utils import kg_to_bag_repr, safe_float
+from utils import kg_to_bag_repr_batch, parse_number, safe_float
+from forecast import cover
 from .dialogs import MovementDialog
 
 class InventoryPage(BasePage):
-    def on_show(self):
-        self.build()
-        self.refresh()
+    watch = ("product", "movement")
 
     def build(self):
         for w in self.winfo_children():
@@ -17,6 +17,13 @@ class InventoryPage(BasePage):
         header = ttk.Frame(self); header.pack(fill=X)
         ttk.Label(header, text="Inventaire (comptage et ajustements)", font="-size 14 -weight bold").pack(side=LEFT)
         ttk.Button(header, text="Ajustement rapide", bootstyle="warning", command=self.adjust_selected).pack(side=RIGHT)
+        # Session de comptage : quantités saisies dans la grille, validées en une fois
+        self.counts = {}
+        self.posting = False
+        self.cancel_btn = ttk.Button(header, text="Annuler comptage", bootstyle="secondary", command=self.cancel_count)
+        self.post_btn = ttk.Button(header, text="Valider (0)", bootstyle="success", command=self.post_counts)
+        self.count_btn = ttk.Button(header, text="Démarrer comptage", bootstyle="primary", command=self.start_count)
+        self.count_btn.pack(side=RIGHT, padx=6)
  
         ttk.Separator(self).pack(fill=X, pady=10)
 
@@ -24,19 +31,32 @@ class InventoryPage(BasePage):
         s = ttk.Frame(self); s.pack(fill=X)
         ttk.Entry(s, textvariable=self.q_var).pack(side=LEFT)
         ttk.Button(s, text="Rechercher", bootstyle="secondary", command=self.refresh).pack(side=LEFT, padx=6)
+        # Stock à une date passée (vide : stock actuel)
+        ttk.Label(s, text="Stock au").pack(side=LEFT, padx=(20, 6))
+        self.as_of_entry = DateEntry(s, width=12, dateformat="%Y-%m-%d", bootstyle="warning")
+        self.as_of_entry.entry.delete(0, END)
+        self.as_of_entry.pack(side=LEFT)
+        ttk.Button(s, text="Afficher", bootstyle="secondary", command=self.refresh).pack(side=LEFT, padx=6)
+        ttk.Button(s, text="Aujourd'hui", bootstyle="info", command=self.reset_as_of).pack(side=LEFT)
 
-        cols = ("id","libelle","poids_sac","stock_kg","stock_aff","seuil")
+        cols = ("id","libelle","poids_sac","stock_kg","stock_aff","seuil","conso","couverture","rupture","reappro","compte","ecart")
         self.tree = ttk.Treeview(self, columns=cols, show="headings", height=22, bootstyle="warning")
         self.tree.pack(fill=BOTH, expand=YES, pady=10)
 
         headers = {
             "id":"ID","libelle":"Produit","poids_sac":"1 sac (kg)", "stock_kg":"Stock (kg)",
-            "stock_aff":"Stock (sacs+kg)", "seuil":"Seuil (kg)"
+            "stock_aff":"Stock (sacs+kg)", "seuil":"Seuil (kg)", "conso":"Conso/jour (kg)",
+            "couverture":"Couverture (j)", "rupture":"Rupture prévue", "reappro":"Réappro suggéré",
+            "compte":"Compté (kg)", "ecart":"Écart (kg)"
         }
         for c in cols:
             self.tree.heading(c, text=headers[c])
-            anchor = E if c in ("poids_sac","stock_kg","seuil") else W
+            anchor = E if c in ("poids_sac","stock_kg","seuil","conso","couverture","compte","ecart") else W
             self.tree.column(c, width=120 if c!="libelle" else 260, anchor=anchor)
+        self.bind_sort(self.tree, {"id": "id", "libelle": "libelle", "poids_sac": "poids_sac_kg", "seuil": "seuil_kg"}, "libelle")
+        self.tree.bind("<Double-1>", self.edit_count)
+        self.count_entry = None
+        self.count_error = False
 
         # Footer - set target
         form = ttk.Labelframe(self, text="Ajuster au stock ciblé")
@@ -53,13 +73,216 @@ class InventoryPage(BasePage):
         for i in self.tree.get_children():
             self.tree.delete(i)
 
-        items = self.app.db.list_products(self.q_var.get())
-        for p in items:
-            stock = self.app.db.stock_kg(p["id"], shop_id=1)
-            self.tree.insert("", END, values=(
+        self.as_of = self.as_of_entry.entry.get().strip() or None
+        items = self.app.db.list_products(self.q_var.get(), order_by=self.sort_key, descending=self.sort_desc)
+        rates = self.app.db.consumption_rates(shop_id=1)
+        for p, values in zip(items, self._rows(items, rates)):
+            self.tree.insert("", END, iid=str(p["id"]), values=values)
+
+    def reset_as_of(self):
+        self.as_of_entry.entry.delete(0, END)
+        self.refresh()
+
+    def _rows(self, products, rates):
+        """Valeurs des lignes ; les quantités en sacs sont formatées en un seul lot."""
+        weights = [p["poids_sac_kg"] for p in products]
+        if self.as_of:
+            # Stock historique : les prévisions (calculées pour aujourd'hui) ne s'appliquent pas
+            stocks = [self.app.db.stock_kg_at(p["id"], 1, self.as_of) for p in products]
+            return [(
                 p["id"], p["libelle"], f'{p["poids_sac_kg"]:.2f}', f'{stock:.2f}',
-                kg_to_bag_repr(stock, p["poids_sac_kg"]), f'{p["seuil_kg"]:.2f}'
-            ))
+                aff, f'{p["seuil_kg"]:.2f}', "-", "-", "-", "-", "", ""
+            ) for p, stock, aff in zip(products, stocks, kg_to_bag_repr_batch(stocks, weights))]
+        stocks = [self.app.db.stock_kg(p["id"], shop_id=1) for p in products]
+        fcs = [cover(stock, rates.get(p["id"], 0.0), p["seuil_kg"]) for p, stock in zip(products, stocks)]
+        stock_aff = kg_to_bag_repr_batch(stocks, weights)
+        reorder_aff = kg_to_bag_repr_batch([fc["reorder_kg"] for fc in fcs], weights)
+        return [(
+            p["id"], p["libelle"], f'{p["poids_sac_kg"]:.2f}', f'{stock:.2f}',
+            aff, f'{p["seuil_kg"]:.2f}',
+            f'{fc["rate"]:.2f}', "-" if fc["days_cover"] is None else f'{fc["days_cover"]:.0f}',
+            fc["stockout"] or "-", reorder
+        ) + self._count_values(p["id"], stock) for p, stock, fc, aff, reorder in zip(products, stocks, fcs, stock_aff, reorder_aff)]
+
+    def _count_values(self, pid, stock):
+        """Colonnes Compté / Écart d'une ligne (vides hors comptage)."""
+        if pid not in self.counts:
+            return ("", "")
+        counted = self.counts[pid]
+        return (f"{counted:.2f}", f"{counted - stock:+.2f}")
+
+    def on_change(self, events):
+        """Met à jour uniquement les lignes des produits touchés."""
+        if self.posting:
+            # Validation d'un comptage : une seule actualisation suit l'écriture
+            return
+        if any(e.entity == "product" and e.op == "insert" for e in events):
+            self.refresh()
+            return
+        rates = self.app.db.consumption_rates(shop_id=1)
+        for pid in {pid for e in events for pid in e.product_ids}:
+            iid = str(pid)
+            if not self.tree.exists(iid):
+                continue
+            p = self.app.db.get_product(pid)
+            if p is None or not p.get("actif", 1):
+                self.tree.delete(iid)
+            else:
+                self.tree.item(iid, values=self._rows([p], rates)[0])
+
+    # --- Session de comptage ---
+
+    def start_count(self):
+        if self.as_of_entry.entry.get().strip():
+            # Le comptage se fait sur le stock actuel
+            self.as_of_entry.entry.delete(0, END)
+            self.refresh()
+        self.counts = {}
+        self.count_btn.pack_forget()
+        self.post_btn.pack(side=RIGHT, padx=6)
+        self.cancel_btn.pack(side=RIGHT)
+        self._update_count_buttons()
+
+    def cancel_count(self, confirm=True):
+        if confirm and self.counts and not Messagebox.okcancel(
+                f"Abandonner les {len(self.counts)} quantités comptées ?", "Confirmer"):
+            return
+        self._close_count_entry()
+        touched, self.counts = list(self.counts), {}
+        self.post_btn.pack_forget()
+        self.cancel_btn.pack_forget()
+        self.count_btn.pack(side=RIGHT, padx=6)
+        for pid in touched:
+            self._set_count_cells(pid)
+
+    def _counting(self):
+        return self.post_btn.winfo_ismapped()
+
+    def _update_count_buttons(self):
+        self.post_btn.configure(text=f"Valider ({len(self.counts)})")
+
+    def _set_count_cells(self, pid):
+        iid = str(pid)
+        if self.tree.exists(iid):
+            stock = safe_float(self.tree.set(iid, "stock_kg"))
+            counted, ecart = self._count_values(pid, stock)
+            self.tree.set(iid, "compte", counted)
+            self.tree.set(iid, "ecart", ecart)
+
+    def edit_count(self, event):
+        """Double-clic sur une ligne pendant un comptage : saisie de la quantité comptée."""
+        if not self._counting():
+            return
+        iid = self.tree.identify_row(event.y)
+        if not iid:
+            return
+        self._close_count_entry()
+        bbox = self.tree.bbox(iid, "compte")
+        if not bbox:
+            self.tree.see(iid)
+            return
+        pid = int(iid)
+        x, y, w, h = bbox
+        bag = self._bag_weight(pid)
+        if self.unit_var.get() == "sac" and not bag:
+            Messagebox.show_warning("Poids de sac non défini pour ce produit : saisis le comptage en kg.", "Info")
+            return
+        var = ttk.StringVar()
+        if pid in self.counts:
+            counted = self.counts[pid]
+            if self.unit_var.get() == "sac":
+                counted = counted / bag
+            var.set(f"{counted:g}")
+        entry = ttk.Entry(self.tree, textvariable=var)
+        entry.place(x=x, y=y, width=w, height=h)
+        entry.focus_set()
+        entry.select_range(0, END)
+        entry.bind("<Return>", lambda e: self._commit_count(pid, var.get()))
+        entry.bind("<KP_Enter>", lambda e: self._commit_count(pid, var.get()))
+        entry.bind("<Escape>", lambda e: self._close_count_entry())
+        entry.bind("<FocusOut>", lambda e: self._commit_count(pid, var.get()))
+        self.count_entry = entry
+
+    def _close_count_entry(self):
+        if self.count_entry is not None:
+            entry, self.count_entry = self.count_entry, None
+            entry.destroy()
+
+    def _bag_weight(self, pid) -> float:
+        """Poids d'un sac du produit, 0 s'il n'est pas défini (saisie en sacs impossible)."""
+        p = self.app.db.get_product(pid)
+        weight = float(p["poids_sac_kg"] or 0) if p else 0.0
+        return weight if weight > 0 else 0.0
+
+    def _count_error(self, message):
+        """Affiche l'erreur et laisse la cellule en saisie (le message prend le focus : pas de nouvelle validation)."""
+        entry = self.count_entry
+        self.count_error = True
+        try:
+            Messagebox.show_error(message, "Erreur")
+        finally:
+            self.count_error = False
+        if entry is not None and entry.winfo_exists():
+            entry.focus_set()
+            entry.select_range(0, END)
+
+    def _commit_count(self, pid, text):
+        """
+        Enregistre la saisie (unité choisie en bas de page) ; vide, elle retire le produit du comptage.
+        Une saisie qui n'est pas un nombre est refusée : elle ne doit jamais devenir un comptage à 0.
+        """
+        if self.count_entry is None or self.count_error:
+            return
+        if not text.strip():
+            self.counts.pop(pid, None)
+        else:
+            try:
+                qty = parse_number(text)
+            except ValueError:
+                self._count_error(f"Quantité invalide : « {text.strip()} ».")
+                return
+            if qty < 0:
+                self._count_error("La quantité comptée ne peut pas être négative.")
+                return
+            if self.unit_var.get() == "sac":
+                bag = self._bag_weight(pid)
+                if not bag:
+                    self._count_error("Poids de sac non défini pour ce produit : saisis le comptage en kg.")
+                    return
+                qty = qty * bag
+            self.counts[pid] = qty
+        self._close_count_entry()
+        self._set_count_cells(pid)
+        self._update_count_buttons()
+        # Enchaîne sur la ligne suivante
+        nxt = self.tree.next(str(pid))
+        if nxt:
+            self.tree.selection_set(nxt)
+            self.tree.focus(nxt)
+            self.tree.see(nxt)
+
+    def post_counts(self):
+        """Calcule tous les écarts et enregistre les ajustements en une transaction."""
+        self._close_count_entry()
+        if not self.counts:
+            Messagebox.show_info("Aucune quantité comptée.", "Info")
+            return
+        if not Messagebox.okcancel(f"Valider le comptage de {len(self.counts)} produit(s) ?", "Confirmer"):
+            return
+        # Les sorties en attente d'écriture font partie du stock à comparer
+        self.app.writes.flush()
+        self.posting = True
+        try:
+            deltas = self.app.db.post_inventory_counts(self.counts, shop_id=1)
+        except Exception as e:
+            Messagebox.show_error(str(e), "Erreur")
+            return
+        finally:
+            self.posting = False
+            self.pending = []
+        self.cancel_count(confirm=False)
+        self.refresh()
+        Messagebox.show_info(f"Comptage validé : {len(deltas)} ajustement(s) enregistré(s).", "OK")
 
     def adjust_selected(self):
         sel = self.tree.focus()
@@ -69,11 +292,13 @@ class InventoryPage(BasePage):
         vals = self.tree.item(sel, "values")
         pid = int(vals[0])
         prod = self.app.db.get_product(pid)
+        # Le stock doit inclure les sorties encore en attente d'écriture
+        self.app.writes.flush()
         current = self.app.db.stock_kg(pid, shop_id=1)
 
         # if no target provided -> open MovementDialog ADJ
         if not self.target_var.get().strip():
-            MovementDialog(self.app, product=prod, mtype="ADJ", on_saved=self.refresh)
+            MovementDialog(self.app, product=prod, mtype="ADJ")
             return
 
         target = safe_float(self.target_var.get())
@@ -88,5 +313,4 @@ class InventoryPage(BasePage):
         note = f"Ajustement inventaire -> cible {target:.2f} kg (delta {delta:+.2f} kg)"
         self.app.db.add_movement(product_id=pid, shop_id=1, mtype="ADJ", qty_kg=delta, note=note)
         Messagebox.show_info("Ajustement enregistré.", "OK")
-        self.target_var.set("")
-        self.refresh()
\ No newline at end of file
+        self.target_var.set("")
\ No newline at end of file
@@ -4,22 +4,19 @@ from ttkbootstrap.dialogs import Messagebox
 from ttkbootstrap import DateEntry 
 from .base import BasePage
 from .dialogs import MovementDialog
-from utils import kg_to_bag_repr
+from utils import kg_to_bag_repr_batch
 from typing import Optional, Dict, List, Tuple
 
+# Nombre de mouvements lus et affichés par page
+PAGE_SIZE = 500
+
 
 class MovementsPage(BasePage):
     """
     Page pour afficher et gérer les mouvements (entrées, sorties, ajustements) des produits.
     Cette version a été mise à jour pour inclure la modification des mouvements.
     """
-    def on_show(self):
-        """
-        Méthode appelée lors de l'affichage de la page.
-        Construit l'interface utilisateur et rafraîchit les données.
-        """
-        self.build()
-        self.refresh()
+    watch = ("product", "shop", "movement")
 
     def build(self):
         """
@@ -66,12 +63,12 @@ class MovementsPage(BasePage):
         self.date_to_entry = DateEntry(f, width=12, dateformat="%Y-%m-%d", bootstyle="primary")
         self.date_to_entry.pack(side=LEFT)
         
-        ttk.Button(f, text="Filtrer", bootstyle="secondary", command=self.refresh).pack(side=LEFT, padx=8)
+        ttk.Button(f, text="Filtrer", bootstyle="secondary", command=self.apply_filters).pack(side=LEFT, padx=8)
         ttk.Button(f, text="Rafraîchir", bootstyle="info", command=self.reset_and_refresh).pack(side=LEFT)
         
         # Associer les événements de sélection aux combos
-        self.type_combo.bind("<<ComboboxSelected>>", lambda e: self.refresh())
-        self.shop_combo.bind("<<ComboboxSelected>>", lambda e: self.refresh())
+        self.type_combo.bind("<<ComboboxSelected>>", lambda e: self.apply_filters())
+        self.shop_combo.bind("<<ComboboxSelected>>", lambda e: self.apply_filters())
 
         # Cadre de résumé pour afficher les totaux
         summary_frame = ttk.Frame(self)
@@ -94,6 +91,10 @@ class MovementsPage(BasePage):
         self.tree = ttk.Treeview(self, columns=cols, show="headings", height=22, bootstyle="info")
         self.tree.pack(fill=BOTH, expand=YES, pady=10)
         self.tree.bind("<Double-1>", self.on_edit_movement) # Ajout du gestionnaire de double-clic
+        # Saisies acceptées mais pas encore écrites : affichées tout de suite, en grisé
+        self.tree.tag_configure("pending", foreground="gray")
+        unsubscribe = self.app.writes.subscribe(self.on_writes)
+        self.tree.bind("<Destroy>", lambda e: unsubscribe(), add="+")
 
         # En-têtes et propriétés des colonnes
         headers = {
@@ -105,6 +106,23 @@ class MovementsPage(BasePage):
             self.tree.heading(c, text=headers[c])
             anchor = E if c in ("quantite", "prix_unit_kg", "prix_sac", "cout") else W
             self.tree.column(c, width=120 if c not in ("note", "produit") else 220, anchor=anchor)
+        # Tri fait par la base, page par page (colonne -> clé de Database.list_movements)
+        self.bind_sort(self.tree, {
+            "date": "date", "type": "type", "produit": "produit", "boutique": "boutique", "quantite": "quantite",
+            "prix_unit_kg": "prix_unit_kg", "prix_sac": "prix_sac", "cout": "cout",
+        }, "date", descending=True)
+
+        # Pagination
+        self.offset = 0
+        self.total = 0
+        pager = ttk.Frame(self)
+        pager.pack(fill=X)
+        self.prev_btn = ttk.Button(pager, text="◀ Précédent", bootstyle="secondary-outline", command=lambda: self.goto_page(-1))
+        self.prev_btn.pack(side=LEFT)
+        self.page_var = ttk.StringVar()
+        ttk.Label(pager, textvariable=self.page_var).pack(side=LEFT, padx=10)
+        self.next_btn = ttk.Button(pager, text="Suivant ▶", bootstyle="secondary-outline", command=lambda: self.goto_page(1))
+        self.next_btn.pack(side=LEFT)
 
     def refresh(self):
         """
@@ -114,40 +132,65 @@ class MovementsPage(BasePage):
         for i in self.tree.get_children():
             self.tree.delete(i)
 
+        self.filters = self.current_filters()
+
+        # Seule la page affichée est lue, déjà triée par la base
+        self.total = self.app.db.count_movements(**self.filters)
+        if self.offset >= self.total:
+            self.offset = max(0, (self.total - 1) // PAGE_SIZE * PAGE_SIZE)
+        items = self.app.db.list_movements(**self.filters, order_by=self.sort_key, descending=self.sort_desc,
+                                           limit=PAGE_SIZE, offset=self.offset)
+        self.refresh_totals()
+        self.update_pager()
+
+        # Remplit le tableau avec les données des mouvements
+        for m, values in zip(items, self._rows(items)):
+            self.tree.insert("", END, iid=m["id"], values=values)
+        for ticket, item in self.app.writes.pending():
+            self._insert_pending(ticket, item)
+
+    def apply_filters(self):
+        """Nouveaux filtres : retour à la première page."""
+        self.offset = 0
+        self.refresh()
+
+    def on_sort(self):
+        self.offset = 0
+        self.refresh()
+
+    def goto_page(self, step: int):
+        offset = self.offset + step * PAGE_SIZE
+        if 0 <= offset < self.total:
+            self.offset = offset
+            self.refresh()
+
+    def update_pager(self):
+        first = self.offset + 1 if self.total else 0
+        last = min(self.offset + PAGE_SIZE, self.total)
+        self.page_var.set(f"{first:,}–{last:,} sur {self.total:,}".replace(",", " "))
+        self.prev_btn.configure(state="normal" if self.offset > 0 else "disabled")
+        self.next_btn.configure(state="normal" if last < self.total else "disabled")
+
+    def current_filters(self) -> Dict:
+        """Lit les filtres saisis et les convertit en paramètres de requête."""
         # Récupère les paramètres de filtre
         mtype = self.type_var.get()
         mt = None if mtype == "Tous" else mtype
 
         shop_name = self.shop_var.get()
-        shops = self.app.db.list_shops()
-        shop_id = None
-        if shop_name and shop_name != "Toutes":
-            for s in shops:
-                if s["libelle"] == shop_name:
-                    shop_id = s["id"]
-                    break
+        shop = self.app.db.shop_by_label(shop_name) if shop_name and shop_name != "Toutes" else None
+        shop_id = shop["id"] if shop else None
 
         date_from = self.date_from_entry.entry.get().strip() or None
         date_to = self.date_to_entry.entry.get().strip() or None
 
-        # Appelle la base de données pour obtenir les mouvements filtrés
-        items = self.app.db.list_movements(
-            mtype=mt,
-            shop_id=shop_id,
-            q=self.q_var.get(),
-            date_from=date_from,
-            date_to=date_to
-        )
-        
+        return {"mtype": mt, "shop_id": shop_id, "q": self.q_var.get(), "date_from": date_from, "date_to": date_to}
+
+    def refresh_totals(self):
+        """Recalcule uniquement les totaux de résumé pour les filtres appliqués."""
         # Calcule les totaux en utilisant la nouvelle fonction de la DB
-        total_sales_value, total_cogs_value = self.app.db.total_sales_and_cogs(
-            mtype=mt,
-            shop_id=shop_id,
-            q=self.q_var.get(),
-            date_from=date_from,
-            date_to=date_to
-        )
-        
+        total_sales_value, total_cogs_value = self.app.db.total_sales_and_cogs(**self.filters)
+
         profit = total_sales_value - total_cogs_value
         
         # Met à jour les labels de résumé
@@ -161,42 +204,101 @@ class MovementsPage(BasePage):
         else:
             self.profit_label.config(bootstyle="danger")
 
-        # Remplit le tableau avec les données des mouvements
-        for m in items:
-            sacs_repr = kg_to_bag_repr(abs(m["qty_kg"]), m.get("poids_sac_kg", 0))
-            self.tree.insert("", END, iid=m["id"], values=(
-                m["created_at"],
-                m["type"],
-                m["product_libelle"],
-                m["shop_libelle"],
-                f'{m["qty_kg"]:.2f}',
-                sacs_repr,
-                f'{(m["unit_price_kg"] or 0):.0f}',
-                f'{(m["unit_price_sac"] or 0):.0f}',
-                f'{(m["cost"] or 0):,.2f}',
-                m.get("note", "")
-            ))
+    def _rows(self, items: List[Dict]) -> List[Tuple]:
+        """Valeurs des lignes ; les quantités en sacs sont formatées en un seul lot."""
+        sacs_repr = kg_to_bag_repr_batch([abs(m["qty_kg"]) for m in items], [m.get("poids_sac_kg", 0) for m in items])
+        return [(
+            m["created_at"],
+            m["type"],
+            m["product_libelle"],
+            m["shop_libelle"],
+            f'{m["qty_kg"]:.2f}',
+            sacs,
+            f'{(m["unit_price_kg"] or 0):.0f}',
+            f'{(m["unit_price_sac"] or 0):.0f}',
+            f'{(m["cost"] or 0):,.2f}',
+            m.get("note", "")
+        ) for m, sacs in zip(items, sacs_repr)]
+
+    def _row_values(self, m: Dict) -> Tuple:
+        return self._rows([m])[0]
+
+    def on_change(self, events):
+        """
+        Mouvements ajoutés ou modifiés : seules leurs lignes et les totaux sont mis à jour.
+        Un changement de produit ou de boutique (libellés affichés) recharge la liste.
+        """
+        if any(e.entity == "shop" for e in events):
+            self.shop_combo.configure(values=["Toutes"] + [s["libelle"] for s in self.app.db.list_shops()])
+        if any(e.entity != "movement" for e in events):
+            self.refresh()
+            return
+
+        ids = sorted({mid for e in events for mid in e.ids})
+        found = {m["id"]: m for m in self.app.db.list_movements(**self.filters, ids=ids)}
+        # Les nouveaux mouvements n'ont une place connue qu'en tête de la première page triée par date
+        at_top = self.sort_key == "date" and self.sort_desc and self.offset == 0
+        for mid in ids:
+            iid = str(mid)
+            m = found.get(mid)
+            if m is None:
+                # Le mouvement ne correspond plus aux filtres
+                if self.tree.exists(iid):
+                    self.tree.delete(iid)
+            elif self.tree.exists(iid):
+                self.tree.item(iid, values=self._row_values(m))
+            elif at_top:
+                # Nouveau mouvement : le plus récent, donc en tête de liste
+                self.tree.insert("", 0, iid=mid, values=self._row_values(m))
+        # La page garde sa taille : les lignes repoussées passent à la page suivante
+        rows = [iid for iid in self.tree.get_children() if not iid.startswith("pending-")]
+        for iid in rows[PAGE_SIZE:]:
+            self.tree.delete(iid)
+        self.total = self.app.db.count_movements(**self.filters)
+        self.update_pager()
+        self.refresh_totals()
     
+    def on_writes(self, kind, entries):
+        """Confirmation immédiate des saisies ; les lignes provisoires disparaissent une fois écrites."""
+        for ticket, item, _ in entries:
+            iid = f"pending-{ticket}"
+            if kind == "queued":
+                self._insert_pending(ticket, item)
+            elif self.tree.exists(iid):
+                self.tree.delete(iid)
+
+    def _insert_pending(self, ticket: int, item: Dict):
+        product = self.app.db.get_product(item["product_id"]) or {}
+        shop = self.app.db.get_shop(item["shop_id"]) or {}
+        m = {
+            "created_at": item["created_at"], "type": item["mtype"],
+            "product_libelle": product.get("libelle", ""), "shop_libelle": shop.get("libelle", ""),
+            "poids_sac_kg": product.get("poids_sac_kg", 0), "qty_kg": item["qty_kg"],
+            "unit_price_kg": item["unit_price_kg"], "unit_price_sac": item["unit_price_sac"],
+            "cost": item["cost"], "note": f"(en attente) {item['note']}".strip(),
+        }
+        self.tree.insert("", 0, iid=f"pending-{ticket}", values=self._row_values(m), tags=("pending",))
+
     def reset_and_refresh(self):
         """
         Vide le champ de recherche et rafraîchit la liste des produits.
         """
         self.q_var.set("")
-        self.refresh()
+        self.apply_filters()
 
     def new_movement(self):
         """
         Ouvre la boîte de dialogue pour créer un nouveau mouvement.
         """
-        MovementDialog(self.app, on_saved=self.refresh)
+        MovementDialog(self.app)
 
     def on_edit_movement(self, event):
         """
         Gère le double-clic sur une ligne pour ouvrir le formulaire en mode édition.
         """
         selected_item = self.tree.focus()
-        if selected_item:
+        if selected_item and not selected_item.startswith("pending-"):
             movement_id = int(selected_item)
             movement_data = self.app.db.get_movement(movement_id)
             if movement_data:
-                MovementDialog(self.app, on_saved=self.refresh, movement_data=movement_data)
+                MovementDialog(self.app, movement_data=movement_data)
@@ -2,14 +2,13 @@ import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from ttkbootstrap.dialogs import Messagebox
 from .base import BasePage
-from .dialogs import ProductDialog, MovementDialog
-from utils import kg_to_bag_repr
+from tkinter import filedialog
+from .dialogs import ProductDialog, MovementDialog, CatalogueImportDialog
+import catalogue
+from utils import kg_to_bag_repr_batch
 
 class ProductsPage(BasePage):
-    def on_show(self):
-        """Construit et rafraîchit la page quand elle est affichée."""
-        self.build()
-        self.refresh()
+    watch = ("product", "movement")
 
     def build(self):
         """Construit l'interface de la page des produits."""
@@ -24,6 +23,7 @@ class ProductsPage(BasePage):
         # Bouton "Nouveau" dont l'état dépend du rôle de l'utilisateur
         if self.app.role == "a":
             ttk.Button(header, text="Nouveau", bootstyle="success", command=self.new_product).pack(side=RIGHT)
+            ttk.Button(header, text="Importer catalogue (CSV)", bootstyle="secondary", command=self.import_catalogue).pack(side=RIGHT, padx=6)
         else:
             # Désactive le bouton si le rôle est 'secretaire'
             ttk.Button(header, text="Nouveau", bootstyle="success", state="disabled").pack(side=RIGHT)
@@ -49,6 +49,10 @@ class ProductsPage(BasePage):
         ]:
             self.tree.heading(cid, text=label)
             self.tree.column(cid, width=w, anchor=(E if cid in ("poids_sac","prix_kg","prix_sac","seuil") else W))
+        self.bind_sort(self.tree, {
+            "id": "id", "sku": "sku", "libelle": "libelle", "poids_sac": "poids_sac_kg",
+            "prix_kg": "prix_kg", "prix_sac": "prix_sac", "seuil": "seuil_kg", "actif": "actif",
+        }, "libelle")
 
         # Actions
         actions = ttk.Frame(self)
@@ -69,14 +73,34 @@ class ProductsPage(BasePage):
         for i in self.tree.get_children():
             self.tree.delete(i)
 
-        items = self.app.db.list_products(self.q_var.get())
-        for p in items:
-            stock = self.app.db.stock_kg(p["id"], shop_id=1)
-            stock_aff = kg_to_bag_repr(stock, p["poids_sac_kg"])
-            self.tree.insert("", END, values=(
-                p["id"], p.get("sku",""), p["libelle"], f'{p["poids_sac_kg"]:.2f}',
-                stock_aff, f'{p["prix_kg"]:.0f}', f'{p["prix_sac"]:.0f}', f'{p["seuil_kg"]:.0f}', "Oui" if p.get("actif",1) else "Non"
-            ))
+        items = self.app.db.list_products(self.q_var.get(), order_by=self.sort_key, descending=self.sort_desc)
+        for p, values in zip(items, self._rows(items)):
+            self.tree.insert("", END, iid=str(p["id"]), values=values)
+
+    def _rows(self, products):
+        """Valeurs des lignes ; les quantités en sacs sont formatées en un seul lot."""
+        stocks = [self.app.db.stock_kg(p["id"], shop_id=1) for p in products]
+        stock_aff = kg_to_bag_repr_batch(stocks, [p["poids_sac_kg"] for p in products])
+        return [(
+            p["id"], p.get("sku",""), p["libelle"], f'{p["poids_sac_kg"]:.2f}',
+            aff, f'{p["prix_kg"]:.0f}', f'{p["prix_sac"]:.0f}', f'{p["seuil_kg"]:.0f}', "Oui" if p.get("actif",1) else "Non"
+        ) for p, aff in zip(products, stock_aff)]
+
+    def on_change(self, events):
+        """Met à jour uniquement les lignes des produits touchés."""
+        if any(e.entity == "product" and e.op == "insert" for e in events):
+            # Nouveau produit : l'ordre alphabétique et le filtre s'appliquent
+            self.refresh()
+            return
+        for pid in {pid for e in events for pid in e.product_ids}:
+            iid = str(pid)
+            if not self.tree.exists(iid):
+                continue
+            p = self.app.db.get_product(pid)
+            if p is None or not p.get("actif", 1):
+                self.tree.delete(iid)
+            else:
+                self.tree.item(iid, values=self._rows([p])[0])
 
     
     def reset_and_refresh(self):
@@ -97,13 +121,25 @@ class ProductsPage(BasePage):
 
     def new_product(self):
         """Ouvre une boîte de dialogue pour créer un nouveau produit."""
-        ProductDialog(self.app, on_saved=self.refresh)
+        ProductDialog(self.app)
+
+    def import_catalogue(self):
+        """Importe un catalogue ou une liste de prix (CSV par SKU), après aperçu des différences."""
+        path = filedialog.askopenfilename(title="Importer le catalogue", filetypes=[("CSV", "*.csv")])
+        if not path:
+            return
+        try:
+            diff = catalogue.import_file(self.app.db, path, dry_run=True)
+        except Exception as e:
+            Messagebox.show_error(str(e), "Erreur")
+            return
+        CatalogueImportDialog(self.app, diff, path)
 
     def edit_selected(self):
         """Ouvre une boîte de dialogue pour modifier le produit sélectionné."""
         p = self.selected_product()
         if p:
-            ProductDialog(self.app, product=p, on_saved=self.refresh)
+            ProductDialog(self.app, product=p)
 
     def archive_selected(self):
         """Archive le produit sélectionné."""
@@ -111,10 +147,9 @@ class ProductsPage(BasePage):
         if not p: return
         if Messagebox.okcancel("Archiver ce produit ? Il n'apparaîtra plus dans les listes actives.", "Confirmer"):
             self.app.db.archive_product(p["id"])
-            self.refresh()
 
     def move_selected(self, mtype: str):
         """Ouvre une boîte de dialogue pour créer un mouvement de stock pour le produit sélectionné."""
         p = self.selected_product()
         if not p: return
-        MovementDialog(self.app, product=p, mtype=mtype, on_saved=self.refresh)
+        MovementDialog(self.app, product=p, mtype=mtype)
@@ -3,14 +3,28 @@ import os
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from ttkbootstrap.dialogs import Messagebox
+from ttkbootstrap import DateEntry
 from tkinter import filedialog
-from .base import BasePage
-from utils import kg_to_bag_repr
+from .base import BasePage, bind_local_sort
+from utils import kg_to_bag_repr_batch
+from analytics import Ledger
+from forecast import cover
+
+# Colonnes communes aux onglets d'analyse (clé, en-tête, largeur)
+ANALYSIS_COLS = [
+    ("qty_in", "Entrées (kg)", 100), ("qty_out", "Sorties (kg)", 100),
+    ("sales", "Ventes", 110), ("purchases", "Achats", 110), ("margin", "Marge", 110),
+    ("stock_close", "Stock fin (kg)", 110), ("turnover", "Rotation", 80),
+]
+# Onglet de classement (clé, en-tête, largeur)
+RANKING_COLS = [
+    ("revenue_rank", "Rang CA", 70), ("libelle", "Produit", 220), ("revenue", "Ventes", 120),
+    ("share", "Part", 70), ("cum_share", "Cumul", 70), ("abc", "Classe", 60),
+    ("volume_kg", "Volume (kg)", 110), ("volume_rank", "Rang volume", 90),
+]
 
 class ReportsPage(BasePage):
-    def on_show(self):
-        self.build()
-        self.refresh()
+    watch = ("product", "shop", "movement")
 
     def build(self):
         for w in self.winfo_children():
@@ -22,32 +36,142 @@ class ReportsPage(BasePage):
 
         ttk.Separator(self).pack(fill=X, pady=10)
 
-        # Low stock
-        ttk.Label(self, text="Ruptures / Sous seuil", font="-size 12 -weight bold").pack(anchor=W)
+        # Filtres des onglets d'analyse
+        f = ttk.Frame(self); f.pack(fill=X)
+        self.shop_var = ttk.StringVar(value="Toutes")
+        self.freq_var = ttk.StringVar(value="Mois")
+        self.shop_ids = {s["libelle"]: s["id"] for s in self.app.db.list_shops()}
+        ttk.Label(f, text="Boutique").pack(side=LEFT, padx=(0,6))
+        ttk.Combobox(f, values=["Toutes"] + list(self.shop_ids), textvariable=self.shop_var, width=22, state="readonly").pack(side=LEFT)
+        ttk.Label(f, text="Du").pack(side=LEFT, padx=(10,6))
+        self.date_from_entry = DateEntry(f, width=12, dateformat="%Y-%m-%d", bootstyle="primary")
+        self.date_from_entry.pack(side=LEFT)
+        self.date_from_entry.entry.delete(0, END)
+        ttk.Label(f, text="Au").pack(side=LEFT, padx=(6,6))
+        self.date_to_entry = DateEntry(f, width=12, dateformat="%Y-%m-%d", bootstyle="primary")
+        self.date_to_entry.pack(side=LEFT)
+        ttk.Label(f, text="Période").pack(side=LEFT, padx=(10,6))
+        ttk.Combobox(f, values=["Semaine","Mois"], textvariable=self.freq_var, width=9, state="readonly").pack(side=LEFT)
+        ttk.Button(f, text="Calculer", bootstyle="info", command=self.refresh).pack(side=LEFT, padx=8)
+
+        self.summary_var = ttk.StringVar(value="")
+        ttk.Label(self, textvariable=self.summary_var, font="-size 10 -weight bold").pack(anchor=W, pady=(8,0))
+
+        self.notebook = ttk.Notebook(self)
+        self.notebook.pack(fill=BOTH, expand=YES, pady=8)
 
-        cols = ("id","libelle","stock_kg","stock_aff","seuil","poids_sac")
-        self.tree = ttk.Treeview(self, columns=cols, show="headings", height=18, bootstyle="success")
+        # Low stock
+        tab = ttk.Frame(self.notebook); self.notebook.add(tab, text="Ruptures / Sous seuil")
+        cols = ("id","libelle","stock_kg","stock_aff","seuil","poids_sac","couverture","rupture","reappro")
+        self.tree = ttk.Treeview(tab, columns=cols, show="headings", height=18, bootstyle="success")
         self.tree.pack(fill=BOTH, expand=YES, pady=8)
 
         headers = {
-            "id":"ID","libelle":"Produit","stock_kg":"Stock (kg)","stock_aff":"Stock (sacs+kg)","seuil":"Seuil (kg)","poids_sac":"1 sac (kg)"
+            "id":"ID","libelle":"Produit","stock_kg":"Stock (kg)","stock_aff":"Stock (sacs+kg)","seuil":"Seuil (kg)","poids_sac":"1 sac (kg)",
+            "couverture":"Couverture (j)","rupture":"Rupture prévue","reappro":"Réappro suggéré"
         }
         for c in cols:
             self.tree.heading(c, text=headers[c])
-            anchor = E if c in ("stock_kg","seuil","poids_sac") else W
+            anchor = E if c in ("stock_kg","seuil","poids_sac","couverture") else W
             self.tree.column(c, width=130 if c!="libelle" else 260, anchor=anchor)
+        bind_local_sort(self.tree)
+
+        self.product_tree = self._analysis_tab("Par produit", ("libelle", "Produit", 220))
+        self.shop_tree = self._analysis_tab("Par boutique", ("libelle", "Boutique", 220))
+        self.period_tree = self._analysis_tab("Par période", ("period", "Période", 120))
+
+        tab = ttk.Frame(self.notebook); self.notebook.add(tab, text="Classement ABC")
+        self.ranking_var = ttk.StringVar(value="")
+        ttk.Label(tab, textvariable=self.ranking_var).pack(anchor=W, pady=(8, 0))
+        self.ranking_tree = ttk.Treeview(tab, columns=[c for c, _, _ in RANKING_COLS], show="headings", height=17, bootstyle="info")
+        self.ranking_tree.pack(fill=BOTH, expand=YES, pady=8)
+        for cid, label, w in RANKING_COLS:
+            self.ranking_tree.heading(cid, text=label)
+            self.ranking_tree.column(cid, width=w, anchor=(W if cid == "libelle" else CENTER if cid == "abc" else E))
+        self.ranking_tree.tag_configure("A", background="#d4edda")
+        self.ranking_tree.tag_configure("B", background="#fff3cd")
+        bind_local_sort(self.ranking_tree)
+
+    def on_change(self, events):
+        if any(e.entity == "shop" for e in events):
+            # La liste des boutiques du filtre doit être reconstruite
+            self.build()
+        self.refresh()
+
+    def _analysis_tab(self, title, first_col):
+        """Crée un onglet avec une table d'analyse (ventes, achats, marge, rotation)."""
+        tab = ttk.Frame(self.notebook); self.notebook.add(tab, text=title)
+        spec = [first_col] + ANALYSIS_COLS
+        tree = ttk.Treeview(tab, columns=[c for c, _, _ in spec], show="headings", height=18, bootstyle="info")
+        tree.pack(fill=BOTH, expand=YES, pady=8)
+        for cid, label, w in spec:
+            tree.heading(cid, text=label)
+            tree.column(cid, width=w, anchor=(W if cid == first_col[0] else E))
+        # Agrégats déjà calculés (quelques centaines de lignes) : tri sur place
+        bind_local_sort(tree)
+        return tree
 
     def refresh(self):
         for i in self.tree.get_children():
             self.tree.delete(i)
 
         items = self.app.db.low_stock_products(shop_id=1)
-        for p in items:
+        rates = self.app.db.consumption_rates(shop_id=1)
+        fcs = [cover(p["stock_kg"], rates.get(p["id"], 0.0), p["seuil_kg"]) for p in items]
+        weights = [p["poids_sac_kg"] for p in items]
+        stock_aff = kg_to_bag_repr_batch([p["stock_kg"] for p in items], weights)
+        reorder_aff = kg_to_bag_repr_batch([fc["reorder_kg"] for fc in fcs], weights)
+        for p, fc, aff, reorder in zip(items, fcs, stock_aff, reorder_aff):
             self.tree.insert("", END, values=(
-                p["id"], p["libelle"], f'{p["stock_kg"]:.2f}',
-                kg_to_bag_repr(p["stock_kg"], p["poids_sac_kg"]),
-                f'{p["seuil_kg"]:.2f}', f'{p["poids_sac_kg"]:.2f}'
+                p["id"], p["libelle"], f'{p["stock_kg"]:.2f}', aff,
+                f'{p["seuil_kg"]:.2f}', f'{p["poids_sac_kg"]:.2f}',
+                "-" if fc["days_cover"] is None else f'{fc["days_cover"]:.0f}',
+                fc["stockout"] or "-", reorder
+            ))
+
+        self.refresh_analysis()
+
+    def refresh_analysis(self):
+        """Recharge le grand livre filtré une fois et remplit les onglets d'analyse."""
+        filters = dict(
+            shop_id=self.shop_ids.get(self.shop_var.get()),
+            date_from=self.date_from_entry.entry.get().strip() or None,
+            date_to=self.date_to_entry.entry.get().strip() or None,
+        )
+        ledger = Ledger.load(self.app.db, **filters)
+        freq = "week" if self.freq_var.get() == "Semaine" else "month"
+        self._fill(self.product_tree, "libelle", ledger.by_product())
+        self._fill(self.shop_tree, "libelle", ledger.by_shop())
+        self._fill(self.period_tree, "period", ledger.by_period(freq))
+
+        self._fill_ranking(self.app.db.product_ranking(**filters))
+
+        s = ledger.summary()
+        cogs = self.app.db.cogs(**filters)
+        self.summary_var.set(
+            f"Ventes : {s['sales']:,.2f} FCFA   Achats : {s['purchases']:,.2f} FCFA   Marge : {s['margin']:,.2f} FCFA   "
+            f"Coût réel des ventes : {cogs:,.2f} FCFA   Marge réelle : {s['sales'] - cogs:,.2f} FCFA"
+        )
+
+    def _fill(self, tree, first_col, rows):
+        tree.delete(*tree.get_children())
+        for r in rows:
+            tree.insert("", END, values=[r[first_col]] + [
+                f'{r[c]:.2f}' if c == "turnover" else f'{r[c]:,.2f}' for c, _, _ in ANALYSIS_COLS
+            ])
+
+    def _fill_ranking(self, rows):
+        self.ranking_tree.delete(*self.ranking_tree.get_children())
+        counts = {"A": 0, "B": 0, "C": 0}
+        for r in rows:
+            counts[r["abc"]] += 1
+            self.ranking_tree.insert("", END, tags=(r["abc"],), values=(
+                r["revenue_rank"], r["libelle"], f'{r["revenue"]:,.2f}',
+                f'{r["share"]:.1%}', f'{r["cum_share"]:.1%}', r["abc"],
+                f'{r["volume_kg"]:,.2f}', r["volume_rank"]
             ))
+        self.ranking_var.set(f"{len(rows)} produits vendus : {counts['A']} en A, {counts['B']} en B, {counts['C']} en C "
+                             f"(A : 80 % du CA, B : 15 %, C : le reste)")
 
     def export_csv(self):
         path = filedialog.asksaveasfilename(
@@ -63,12 +187,11 @@ class ReportsPage(BasePage):
                 w = csv.writer(f, delimiter=";")
                 w.writerow(["ID","Produit","Stock (kg)","Stock (sacs+kg)","Seuil (kg)","1 sac (kg)"])
                 items = self.app.db.all_stocks(shop_id=1)
-                for p, qty in items:
-                    w.writerow([
-                        p["id"], p["libelle"], f"{qty:.2f}",
-                        kg_to_bag_repr(qty, p["poids_sac_kg"]),
-                        f'{p["seuil_kg"]:.2f}', f'{p["poids_sac_kg"]:.2f}'
-                    ])
+                reprs = kg_to_bag_repr_batch([qty for _, qty in items], [p["poids_sac_kg"] for p, _ in items])
+                w.writerows([
+                    p["id"], p["libelle"], f"{qty:.2f}", aff,
+                    f'{p["seuil_kg"]:.2f}', f'{p["poids_sac_kg"]:.2f}'
+                ] for (p, qty), aff in zip(items, reprs))
             Messagebox.show_info("Export terminé.", "OK")
         except Exception as e:
-            Messagebox.show_error(str(e), "Erreur")
\ No newline at end of file
+            Messagebox.show_error(str(e), "Erreur")
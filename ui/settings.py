@@ -1,12 +1,13 @@
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from ttkbootstrap.dialogs import Messagebox
-from .base import BasePage
+from tkinter import filedialog
+from .base import BasePage, bind_local_sort
+import backup
+from db import Database
 
 class SettingsPage(BasePage):
-    def on_show(self):
-        self.build()
-        self.refresh()
+    watch = ("shop",)
 
     def build(self):
         for w in self.winfo_children():
@@ -29,6 +30,7 @@ class SettingsPage(BasePage):
         self.shop_list.column("id", width=60, anchor=CENTER)
         self.shop_list.column("libelle", width=260, anchor=W)
         self.shop_list.pack(fill=Y)
+        bind_local_sort(self.shop_list)
 
         right = ttk.Frame(box); right.pack(side=LEFT, fill=BOTH, expand=YES, padx=10, pady=10)
         self.shop_name_var = ttk.StringVar()
@@ -41,6 +43,96 @@ class SettingsPage(BasePage):
         ttk.Button(btns, text="Renommer", bootstyle="secondary", command=self.rename_shop).pack(side=LEFT, padx=5)
         ttk.Button(btns, text="Supprimer", bootstyle="danger", command=self.delete_shop).pack(side=LEFT, padx=5)
 
+        # Sauvegarde à chaud (base locale seulement ; en multi-postes elle se fait sur le serveur,
+        # RemoteDatabase.path n'étant que « hôte:port »)
+        self.backup_job = None
+        if isinstance(self.app.db, Database):
+            self._build_backup()
+
+    def _build_backup(self):
+        box = ttk.Labelframe(self, text="Sauvegarde")
+        box.pack(fill=X, padx=5, pady=5)
+        row = ttk.Frame(box); row.pack(fill=X, padx=10, pady=(10, 4))
+        self.backup_dir_var = ttk.StringVar(value="sauvegardes")
+        self.backup_gzip_var = ttk.BooleanVar(value=True)
+        self.backup_keep_var = ttk.StringVar(value="14")
+        ttk.Label(row, text="Dossier").pack(side=LEFT, padx=(0, 6))
+        ttk.Entry(row, textvariable=self.backup_dir_var, width=30).pack(side=LEFT)
+        ttk.Button(row, text="...", bootstyle="secondary", command=self.choose_backup_dir).pack(side=LEFT, padx=4)
+        ttk.Checkbutton(row, text="Compresser (gzip)", variable=self.backup_gzip_var).pack(side=LEFT, padx=10)
+        ttk.Label(row, text="Garder les").pack(side=LEFT, padx=(10, 6))
+        ttk.Spinbox(row, from_=1, to=365, textvariable=self.backup_keep_var, width=5).pack(side=LEFT)
+        ttk.Label(row, text="dernières").pack(side=LEFT, padx=6)
+
+        row = ttk.Frame(box); row.pack(fill=X, padx=10, pady=(4, 10))
+        self.backup_btn = ttk.Button(row, text="Sauvegarder maintenant", bootstyle="success", command=self.start_backup)
+        self.backup_btn.pack(side=LEFT)
+        if self.app.role == "a":
+            ttk.Button(row, text="Restaurer...", bootstyle="danger-outline", command=self.restore_backup).pack(side=LEFT, padx=6)
+        self.backup_progress = ttk.Progressbar(row, length=220, bootstyle="success-striped")
+        self.backup_progress.pack(side=LEFT, padx=10)
+        self.backup_status_var = ttk.StringVar(value="")
+        ttk.Label(row, textvariable=self.backup_status_var).pack(side=LEFT)
+
+    def choose_backup_dir(self):
+        path = filedialog.askdirectory(title="Dossier des sauvegardes")
+        if path:
+            self.backup_dir_var.set(path)
+
+    def start_backup(self):
+        """Lance la copie dans un thread ; la progression est relue sur la boucle Tk."""
+        if self.backup_job is not None:
+            return
+        try:
+            keep = int(self.backup_keep_var.get())
+        except ValueError:
+            keep = None
+        self.backup_job = backup.BackupJob(self.app.db.path, self.backup_dir_var.get().strip() or "sauvegardes",
+                                           compress=self.backup_gzip_var.get(), keep=keep)
+        self.backup_btn.configure(state="disabled")
+        self.backup_status_var.set("Sauvegarde en cours...")
+        self.backup_job.start()
+        self.after(100, self._poll_backup)
+
+    def _poll_backup(self):
+        job = self.backup_job
+        if job.total:
+            self.backup_progress.configure(value=100 * job.copied / job.total)
+        if not job.done.is_set():
+            self.after(100, self._poll_backup)
+            return
+        self.backup_job = None
+        self.backup_btn.configure(state="normal")
+        if job.error is not None:
+            self.backup_status_var.set("Échec")
+            Messagebox.show_error(str(job.error), "Sauvegarde")
+        else:
+            self.backup_progress.configure(value=100)
+            self.backup_status_var.set(f"OK : {job.result.name}")
+
+    def restore_backup(self):
+        path = filedialog.askopenfilename(
+            title="Restaurer une sauvegarde", initialdir=self.backup_dir_var.get().strip() or None,
+            filetypes=[("Sauvegardes", "*.db *.db.gz"), ("Tous", "*.*")]
+        )
+        if not path:
+            return
+        if not Messagebox.okcancel(
+                "Remplacer toutes les données par cette sauvegarde ?\n"
+                "La base actuelle est d'abord mise de côté. Les autres postes doivent être fermés.", "Confirmer"):
+            return
+        # Rien ne doit rester en attente d'écriture dans la base remplacée
+        self.app.writes.flush()
+        try:
+            saved = backup.restore(path, self.app.db.path)
+        except Exception as e:
+            Messagebox.show_error(str(e), "Restauration")
+            return
+        Messagebox.show_info(
+            "Restauration terminée" + (f" (ancienne base : {saved.name})" if saved else "")
+            + ".\nL'application va se fermer ; relancez-la.", "Restauration")
+        self.app.on_close()
+
     def refresh(self):
         for i in self.shop_list.get_children():
             self.shop_list.delete(i)
@@ -62,7 +154,6 @@ class SettingsPage(BasePage):
         try:
             self.app.db.add_shop(name)
             self.shop_name_var.set("")
-            self.refresh()
         except Exception as e:
             Messagebox.show_error(str(e), "Erreur")
 
@@ -77,7 +168,6 @@ class SettingsPage(BasePage):
             return
         try:
             self.app.db.rename_shop(shop["id"], name)
-            self.refresh()
         except Exception as e:
             Messagebox.show_error(str(e), "Erreur")
 
@@ -90,5 +180,4 @@ class SettingsPage(BasePage):
             return
         ok = self.app.db.delete_shop(shop["id"])
         if not ok:
-            Messagebox.show_error("Impossible: des mouvements y sont rattachés.", "Erreur")
-        self.refresh()
\ No newline at end of file
+            Messagebox.show_error("Impossible: des mouvements y sont rattachés.", "Erreur")
\ No newline at end of file
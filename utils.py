@@ -1,4 +1,6 @@
-from typing import Tuple
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
 
 def safe_float(value, default=0.0):
     """Convertit une chaîne en flottant, gère les erreurs de conversion."""
@@ -8,12 +10,28 @@ def safe_float(value, default=0.0):
         return default
 
 
+def parse_number(value) -> float:
+    """
+    Lecture stricte d'un nombre saisi : virgule décimale et espaces de milliers
+    acceptés ("1 200,50"). Lève ValueError au lieu de retourner 0.
+    """
+    text = str(value).strip()
+    for space in (" ", "\u00a0", "\u202f"):
+        text = text.replace(space, "")
+    number = float(text.replace(",", "."))
+    if number != number or number in (float("inf"), float("-inf")):
+        raise ValueError(f"nombre invalide : {value!r}")
+    return number
+
+
 # --- Module utils.py (inchangé) ---
 def kg_to_bag_repr(qty_kg: float, bag_weight_kg: float) -> str:
     """
     Convertit un poids en kg en une représentation en sacs et kg restants.
     Ex: 54 kg avec des sacs de 50 kg -> "1 sac et 4 kg"
     """
+    # -0.0 (solde d'un ajustement) s'affiche comme 0.0
+    qty_kg = qty_kg + 0.0
     if bag_weight_kg <= 0:
         return f"{qty_kg:,.2f} kg"
     
@@ -42,4 +60,51 @@ def kg_to_bags(qty_kg: float, poids_sac_kg: float) -> Tuple[int, float]:
         return (0, qty_kg)
     sacs = int(qty_kg // poids)
     reste = qty_kg - sacs * poids
-    return sacs, reste
\ No newline at end of file
+    return sacs, reste
+
+
+# --- Conversions par lots (remplissage des tableaux, exports) ---
+# Les représentations déjà formatées sont gardées par couple (qté, poids du sac) :
+# les mêmes stocks reviennent à chaque rafraîchissement.
+_REPR_CACHE: Dict[Tuple[float, float], str] = {}
+_REPR_CACHE_MAX = 20000
+
+
+def kg_to_bags_batch(qty_kg: Sequence[float], poids_sac_kg: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """Version vectorisée de kg_to_bags : (sacs entiers, kg restants) pour chaque ligne."""
+    qty = np.asarray(qty_kg, dtype=np.float64)
+    poids = np.nan_to_num(np.asarray(poids_sac_kg, dtype=np.float64))
+    valid = poids > 0
+    safe = np.where(valid, poids, 1.0)
+    sacs = np.where(valid, np.floor_divide(qty, safe), 0).astype(np.int64)
+    reste = np.where(valid, qty - sacs * safe, qty)
+    return sacs, reste
+
+
+def kg_to_bag_repr_batch(qty_kg: Sequence[float], bag_weight_kg: Sequence[float]) -> List[str]:
+    """Version par lots de kg_to_bag_repr (mêmes chaînes), un seul formatage par couple distinct."""
+    # + 0.0 : -0.0 et 0.0 partagent la même entrée du cache, comme dans kg_to_bag_repr
+    qty = np.nan_to_num(np.asarray(qty_kg, dtype=np.float64)) + 0.0
+    weight = np.nan_to_num(np.asarray(bag_weight_kg, dtype=np.float64)) + 0.0
+    keys = list(zip(qty.tolist(), weight.tolist()))
+    missing = list({k for k in keys if k not in _REPR_CACHE})
+    if missing:
+        if len(_REPR_CACHE) + len(missing) > _REPR_CACHE_MAX:
+            _REPR_CACHE.clear()
+        q = np.array([k[0] for k in missing], dtype=np.float64)
+        w = np.array([k[1] for k in missing], dtype=np.float64)
+        valid = w > 0
+        safe = np.where(valid, w, 1.0)
+        bags = np.floor_divide(q, safe).astype(np.int64).tolist()
+        rest = np.mod(q, safe).tolist()
+        for key, ok, n, r in zip(missing, valid.tolist(), bags, rest):
+            if not ok:
+                _REPR_CACHE[key] = f"{key[0]:,.2f} kg"
+                continue
+            parts = []
+            if n > 0:
+                parts.append(f"{n} sac{'s' if n > 1 else ''}")
+            if r > 0:
+                parts.append(f"{r:,.2f} kg")
+            _REPR_CACHE[key] = " et ".join(parts) if parts else "0 kg"
+    return [_REPR_CACHE[k] for k in keys]
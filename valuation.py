@@ -0,0 +1,276 @@
+import sqlite3
+from typing import Dict, Optional, Tuple
+
+
+# --- Module valuation.py ---
+# Valorisation des stocks par produit/boutique : coût moyen pondéré ("avg")
+# ou premier entré, premier sorti ("fifo").
+#
+# L'état est tenu de façon incrémentale :
+#   - cost_state     : état courant par produit/boutique (qté, valeur, coût unitaire, COGS cumulé)
+#   - movement_cost  : état après chaque mouvement (point de reprise en cas de modification)
+#   - cost_layer     : couches FIFO (une par entrée), avec la quantité restante
+#
+# Un ajout ne traite que le nouveau mouvement ; une modification via
+# update_movement ne rejoue que les mouvements postérieurs, pour les seuls
+# couples produit/boutique concernés.
+
+METHODS = ("avg", "fifo")
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cost_state (
+        product_id INTEGER NOT NULL,
+        shop_id INTEGER NOT NULL,
+        qty_kg REAL NOT NULL DEFAULT 0,
+        value REAL NOT NULL DEFAULT 0,
+        unit_cost REAL NOT NULL DEFAULT 0,
+        consumed_kg REAL NOT NULL DEFAULT 0,
+        cum_in_kg REAL NOT NULL DEFAULT 0,
+        cogs REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (product_id, shop_id)
+    );
+
+    CREATE TABLE IF NOT EXISTS movement_cost (
+        movement_id INTEGER PRIMARY KEY,
+        product_id INTEGER NOT NULL,
+        shop_id INTEGER NOT NULL,
+        value_delta REAL NOT NULL,
+        qty_after REAL NOT NULL,
+        value_after REAL NOT NULL,
+        unit_after REAL NOT NULL,
+        consumed_after REAL NOT NULL,
+        cum_in_after REAL NOT NULL,
+        cogs_after REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_movement_cost_key ON movement_cost(product_id, shop_id, movement_id);
+
+    CREATE TABLE IF NOT EXISTS cost_layer (
+        movement_id INTEGER PRIMARY KEY,
+        product_id INTEGER NOT NULL,
+        shop_id INTEGER NOT NULL,
+        qty_in REAL NOT NULL,
+        qty_left REAL NOT NULL,
+        unit_cost REAL NOT NULL,
+        cum_in_before REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_cost_layer_key ON cost_layer(product_id, shop_id, movement_id);
+"""
+
+_EMPTY = {"qty_kg": 0.0, "value": 0.0, "unit_cost": 0.0, "consumed_kg": 0.0, "cum_in_kg": 0.0, "cogs": 0.0}
+
+
+class CostEngine:
+    """Moteur de valorisation incrémental partageant la connexion de `Database`."""
+
+    def __init__(self, cnx: sqlite3.Connection, method: str = "avg", readonly: bool = False):
+        if method not in METHODS:
+            raise ValueError(f"Méthode de valorisation inconnue : {method}")
+        self.cnx = cnx
+        self.method = method
+        if readonly:
+            return
+        self.cnx.executescript(SCHEMA)
+        row = self.cnx.execute("SELECT value FROM app_setting WHERE key='valuation_method'").fetchone()
+        if row is None or row[0] != method:
+            self.rebuild()
+
+    # ------------------------------------------------------------------
+    # Points d'entrée appelés par Database (dans la transaction d'écriture)
+    # ------------------------------------------------------------------
+    def on_insert(self, movement_id: int):
+        """Valorise un nouveau mouvement (toujours le dernier de son couple produit/boutique)."""
+        m = self._movement(movement_id)
+        if m is None:
+            return
+        state = self._state(m["product_id"], m["shop_id"])
+        self._apply(m, state)
+        self._save_state(m["product_id"], m["shop_id"], state)
+
+    def on_update(self, movement_id: int, old_key: Tuple[int, int]):
+        """Rejoue, à partir du mouvement modifié, l'ancien et le nouveau couple produit/boutique."""
+        m = self._movement(movement_id)
+        keys = {old_key}
+        if m is not None:
+            keys.add((m["product_id"], m["shop_id"]))
+        for pid, sid in keys:
+            self._replay_from(pid, sid, movement_id)
+
+    def rebuild(self):
+        """Recalcule toute la valorisation (migration initiale ou changement de méthode)."""
+        self.cnx.execute("DELETE FROM cost_state")
+        self.cnx.execute("DELETE FROM movement_cost")
+        self.cnx.execute("DELETE FROM cost_layer")
+        states: Dict[Tuple[int, int], Dict] = {}
+        for m in self.cnx.execute("SELECT id, product_id, shop_id, type, qty_kg, cost FROM movement ORDER BY id").fetchall():
+            key = (m["product_id"], m["shop_id"])
+            state = states.setdefault(key, dict(_EMPTY))
+            self._apply(m, state)
+        for (pid, sid), state in states.items():
+            self._save_state(pid, sid, state)
+        self.cnx.execute(
+            "INSERT OR REPLACE INTO app_setting(key, value) VALUES ('valuation_method', ?)", (self.method,)
+        )
+        self.cnx.commit()
+
+    # ------------------------------------------------------------------
+    # Calcul
+    # ------------------------------------------------------------------
+    def _apply(self, m, state: Dict):
+        """Applique un mouvement à l'état et enregistre le point de reprise."""
+        qty = float(m["qty_kg"])
+        if qty > 0:
+            unit = state["unit_cost"]
+            if m["type"] == "IN" and (m["cost"] or 0) > 0:
+                unit = float(m["cost"]) / qty
+            delta = self._receive(m, state, qty, unit)
+        else:
+            delta = self._issue(m, state, -qty)
+            if m["type"] == "OUT":
+                state["cogs"] -= delta
+
+        self.cnx.execute(
+            """INSERT OR REPLACE INTO movement_cost(movement_id, product_id, shop_id, value_delta, qty_after,
+                    value_after, unit_after, consumed_after, cum_in_after, cogs_after)
+                VALUES (?,?,?,?,?,?,?,?,?,?)""",
+            (m["id"], m["product_id"], m["shop_id"], delta, state["qty_kg"], state["value"],
+             state["unit_cost"], state["consumed_kg"], state["cum_in_kg"], state["cogs"])
+        )
+
+    def _receive(self, m, state: Dict, qty: float, unit: float) -> float:
+        if self.method == "avg":
+            before = state["value"]
+            if state["qty_kg"] < 0:
+                # Stock négatif (vente à découvert) : seule la part qui le rend positif est valorisée
+                state["value"] = max(0.0, state["qty_kg"] + qty) * unit
+            else:
+                state["value"] += qty * unit
+            state["qty_kg"] += qty
+            if state["qty_kg"] > 0:
+                state["unit_cost"] = state["value"] / state["qty_kg"]
+            return state["value"] - before
+
+        # FIFO : une couche par entrée ; la part déjà vendue à découvert est absorbée tout de suite
+        left = max(0.0, min(qty, state["cum_in_kg"] + qty - state["consumed_kg"]))
+        self.cnx.execute(
+            "INSERT OR REPLACE INTO cost_layer(movement_id, product_id, shop_id, qty_in, qty_left, unit_cost, cum_in_before) VALUES (?,?,?,?,?,?,?)",
+            (m["id"], m["product_id"], m["shop_id"], qty, left, unit, state["cum_in_kg"])
+        )
+        state["cum_in_kg"] += qty
+        state["qty_kg"] += qty
+        state["value"] += left * unit
+        state["unit_cost"] = unit
+        return left * unit
+
+    def _issue(self, m, state: Dict, qty: float) -> float:
+        """Sort `qty` kg du stock et retourne la variation de valeur (négative)."""
+        if self.method == "avg":
+            unit = state["value"] / state["qty_kg"] if state["qty_kg"] > 0 else state["unit_cost"]
+            state["qty_kg"] -= qty
+            state["value"] = state["value"] - qty * unit if state["qty_kg"] > 0 else 0.0
+            state["unit_cost"] = unit
+            return -qty * unit
+
+        covered = 0.0
+        remaining = qty
+        layers = self.cnx.execute(
+            "SELECT movement_id, qty_left, unit_cost FROM cost_layer WHERE product_id=? AND shop_id=? AND qty_left > 0 ORDER BY movement_id",
+            (m["product_id"], m["shop_id"])
+        ).fetchall()
+        for layer in layers:
+            if remaining <= 0:
+                break
+            take = min(remaining, layer["qty_left"])
+            covered += take * layer["unit_cost"]
+            remaining -= take
+            self.cnx.execute("UPDATE cost_layer SET qty_left=? WHERE movement_id=?", (layer["qty_left"] - take, layer["movement_id"]))
+        state["consumed_kg"] += qty
+        state["qty_kg"] -= qty
+        state["value"] = max(0.0, state["value"] - covered)
+        # Vente à découvert : valorisée au dernier coût connu
+        return -(covered + remaining * state["unit_cost"])
+
+    # ------------------------------------------------------------------
+    # Reprise après modification
+    # ------------------------------------------------------------------
+    def _replay_from(self, product_id: int, shop_id: int, movement_id: int):
+        prev = self.cnx.execute(
+            """SELECT * FROM movement_cost WHERE product_id=? AND shop_id=? AND movement_id < ?
+                ORDER BY movement_id DESC LIMIT 1""",
+            (product_id, shop_id, movement_id)
+        ).fetchone()
+        if prev:
+            state = {"qty_kg": prev["qty_after"], "value": prev["value_after"], "unit_cost": prev["unit_after"],
+                     "consumed_kg": prev["consumed_after"], "cum_in_kg": prev["cum_in_after"], "cogs": prev["cogs_after"]}
+        else:
+            state = dict(_EMPTY)
+
+        key = (product_id, shop_id, movement_id)
+        self.cnx.execute("DELETE FROM movement_cost WHERE product_id=? AND shop_id=? AND movement_id >= ?", key)
+        self.cnx.execute("DELETE FROM cost_layer WHERE product_id=? AND shop_id=? AND movement_id >= ?", key)
+        # Restaure les couches FIFO antérieures à partir de la quantité consommée au point de reprise
+        self.cnx.execute(
+            """UPDATE cost_layer SET qty_left = MAX(0, MIN(qty_in, cum_in_before + qty_in - ?))
+                WHERE product_id=? AND shop_id=?""",
+            (state["consumed_kg"], product_id, shop_id)
+        )
+
+        rows = self.cnx.execute(
+            "SELECT id, product_id, shop_id, type, qty_kg, cost FROM movement WHERE product_id=? AND shop_id=? AND id >= ? ORDER BY id",
+            key
+        ).fetchall()
+        for m in rows:
+            self._apply(m, state)
+        self._save_state(product_id, shop_id, state)
+
+    # ------------------------------------------------------------------
+    # Accès
+    # ------------------------------------------------------------------
+    def _movement(self, movement_id: int):
+        return self.cnx.execute(
+            "SELECT id, product_id, shop_id, type, qty_kg, cost FROM movement WHERE id=?", (movement_id,)
+        ).fetchone()
+
+    def _state(self, product_id: int, shop_id: int) -> Dict:
+        r = self.cnx.execute(
+            "SELECT qty_kg, value, unit_cost, consumed_kg, cum_in_kg, cogs FROM cost_state WHERE product_id=? AND shop_id=?",
+            (product_id, shop_id)
+        ).fetchone()
+        return dict(r) if r else dict(_EMPTY)
+
+    def _save_state(self, product_id: int, shop_id: int, state: Dict):
+        self.cnx.execute(
+            """INSERT OR REPLACE INTO cost_state(product_id, shop_id, qty_kg, value, unit_cost, consumed_kg, cum_in_kg, cogs)
+                VALUES (?,?,?,?,?,?,?,?)""",
+            (product_id, shop_id, state["qty_kg"], state["value"], state["unit_cost"],
+             state["consumed_kg"], state["cum_in_kg"], state["cogs"])
+        )
+
+    def stock_value(self, shop_id: Optional[int] = None, product_id: Optional[int] = None) -> float:
+        where, params = [], []
+        if shop_id:
+            where.append("shop_id = ?")
+            params.append(shop_id)
+        if product_id:
+            where.append("product_id = ?")
+            params.append(product_id)
+        sql = "SELECT COALESCE(SUM(value),0) FROM cost_state"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return float(self.cnx.execute(sql, params).fetchone()[0] or 0.0)
+
+    def stock_value_at(self, bound: str, shop_id: Optional[int] = None) -> float:
+        """
+        Valeur du stock à `bound` (created_at inclus) : valeur après le dernier mouvement
+        de chaque couple à cette date (les mouvements sont valorisés dans l'ordre de saisie).
+        """
+        where, params = ["m.created_at <= ?"], [bound]
+        if shop_id:
+            where.append("m.shop_id = ?")
+            params.append(shop_id)
+        sql = f"""
+            SELECT COALESCE(SUM(mc.value_after), 0)
+            FROM (SELECT MAX(m.id) AS id FROM movement m WHERE {" AND ".join(where)}
+                  GROUP BY m.product_id, m.shop_id) last
+            JOIN movement_cost mc ON mc.movement_id = last.id
+        """
+        return float(self.cnx.execute(sql, params).fetchone()[0] or 0.0)
@@ -0,0 +1,149 @@
+import itertools
+import json
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# --- Module writequeue.py ---
+# File d'écriture des nouveaux mouvements saisis au comptoir.
+#
+# `submit` accepte le mouvement immédiatement (horodaté à la saisie) ; les
+# mouvements en attente sont écrits ensemble, dans l'ordre de saisie, par un
+# seul `add_movements` (une transaction) toutes les `interval_ms` ou dès que
+# `max_items` sont en attente. La connexion SQLite appartient au thread de
+# l'interface : le vidage est planifié sur sa boucle (`after` de Tk).
+#
+# Les abonnés reçoivent ("queued", [(ticket, item, None)]) à la saisie puis
+# ("flushed", [(ticket, item, id ou exception), ...]) après chaque écriture.
+#
+# À la fermeture, les mouvements refusés par la dernière écriture sont conservés
+# dans un fichier de reprise (JSON) et rejoués au démarrage suivant (`replay`),
+# avec leur horodatage de saisie.
+
+Entry = Tuple[int, Dict, object]
+
+
+class WriteQueue:
+    def __init__(self, db, schedule: Optional[Callable] = None, interval_ms: int = 300, max_items: int = 50):
+        """
+        :param db: Database (ou RemoteDatabase) qui reçoit les écritures.
+        :param schedule: fonction (délai_ms, rappel) planifiant un vidage, ex. `App.after`.
+                         Sans planificateur, seul `max_items` ou un `flush` explicite écrit.
+        """
+        self.db = db
+        self.schedule = schedule
+        self.interval_ms = interval_ms
+        self.max_items = max_items
+        self.queue: List[Tuple[int, Dict]] = []
+        self.listeners: List[Callable] = []
+        self.scheduled = False
+        self._tickets = itertools.count(1)
+
+    def subscribe(self, callback: Callable) -> Callable:
+        """Abonne `callback(kind, entries)` ; retourne la fonction de désabonnement."""
+        self.listeners.append(callback)
+        return lambda: self.listeners.remove(callback) if callback in self.listeners else None
+
+    def pending(self) -> List[Tuple[int, Dict]]:
+        return list(self.queue)
+
+    def submit(self, product_id: int, shop_id: int, mtype: str, qty_kg: float, unit_price_kg: Optional[float] = None,
+               unit_price_sac: Optional[float] = None, cost: float = 0, note: str = "") -> int:
+        """Met un mouvement en attente d'écriture ; retourne son numéro de ticket."""
+        item = {
+            "product_id": product_id, "shop_id": shop_id, "mtype": mtype, "qty_kg": float(qty_kg),
+            "unit_price_kg": unit_price_kg, "unit_price_sac": unit_price_sac, "cost": float(cost), "note": note,
+            # Horodatage de la saisie, pas de l'écriture
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        ticket = self._enqueue(item)
+        if len(self.queue) >= self.max_items:
+            self.flush()
+        elif not self.scheduled and self.schedule is not None:
+            self.scheduled = True
+            self.schedule(self.interval_ms, self._on_timer)
+        return ticket
+
+    def _enqueue(self, item: Dict) -> int:
+        ticket = next(self._tickets)
+        self.queue.append((ticket, item))
+        self._notify("queued", [(ticket, item, None)])
+        return ticket
+
+    def _on_timer(self):
+        self.scheduled = False
+        self.flush()
+
+    def flush(self) -> List[Entry]:
+        """
+        Écrit tout ce qui est en attente, dans l'ordre de saisie, en une transaction.
+        À appeler aussi avant toute écriture directe qui doit passer après (modification,
+        ajustement calculé sur le stock) et à la fermeture de l'application.
+        """
+        if not self.queue:
+            return []
+        batch, self.queue = self.queue, []
+        items = [item for _, item in batch]
+        try:
+            results = self.db.add_movements(items)
+        except Exception as e:
+            # Échec de toute la transaction (base verrouillée, disque plein...)
+            cnx = getattr(self.db, "cnx", None)
+            if cnx is not None and cnx.in_transaction:
+                cnx.rollback()
+            results = [e] * len(items)
+        entries = [(ticket, item, result) for (ticket, item), result in zip(batch, results)]
+        self._notify("flushed", entries)
+        return entries
+
+    def close(self, recovery_path=None) -> List[Entry]:
+        """
+        Vide la file ; retourne les écritures refusées, ajoutées au fichier de reprise
+        `recovery_path` s'il est donné (elles ne sont pas perdues à la fermeture).
+        """
+        rejected = [e for e in self.flush() if isinstance(e[2], Exception)]
+        if rejected and recovery_path is not None:
+            self._save(Path(recovery_path), self._load(Path(recovery_path)) + [item for _, item, _ in rejected])
+        return rejected
+
+    def replay(self, recovery_path) -> List[Entry]:
+        """
+        Réécrit les mouvements du fichier de reprise, dans l'ordre et avec leur horodatage.
+        Ceux qui sont encore refusés y restent ; le fichier disparaît quand tout est écrit.
+        """
+        path = Path(recovery_path)
+        items = self._load(path)
+        if not items:
+            return []
+        self.flush()
+        for item in items:
+            self._enqueue(item)
+        entries = self.flush()
+        rejected = [item for _, item, r in entries if isinstance(r, Exception)]
+        if rejected:
+            self._save(path, rejected)
+        else:
+            path.unlink(missing_ok=True)
+        return entries
+
+    @staticmethod
+    def _load(path: Path) -> List[Dict]:
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _save(path: Path, items: List[Dict]):
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(items, ensure_ascii=False, indent=1), encoding="utf-8")
+        tmp.replace(path)
+
+    def _notify(self, kind: str, entries: List[Entry]):
+        for callback in list(self.listeners):
+            try:
+                callback(kind, entries)
+            except Exception:
+                traceback.print_exc()